@@ -0,0 +1,117 @@
+import os
+import threading
+from sqlalchemy import select, update, insert
+from models import db, User, AccountSequence
+
+PREFIX = 'ACC'
+SERIAL_DIGITS = 9  # + контрольная цифра = 10 цифр, проходит Validator.validate_account_number
+SEQUENCE_NAME = 'account_number'
+BLOCK_SIZE = int(os.environ.get('ACCOUNT_BLOCK_SIZE', 100))
+
+# ==================== ФОРМАТ НОМЕРА ====================
+def luhn_check_digit(digits):
+    total = 0
+    for position, digit in enumerate(reversed(digits)):
+        value = int(digit)
+        if position % 2 == 0:
+            value *= 2
+            if value > 9:
+                value -= 9
+        total += value
+    return (10 - total % 10) % 10
+
+def format_account_number(serial):
+    digits = f'{serial:0{SERIAL_DIGITS}d}'
+    return f'{PREFIX}{digits}{luhn_check_digit(digits)}'
+
+def parse_serial(account_number):
+    """Порядковый номер из номера, выданного распределителем, иначе None"""
+    if not account_number or len(account_number) != len(PREFIX) + SERIAL_DIGITS + 1:
+        return None
+    digits = account_number[len(PREFIX):]
+    if not account_number.startswith(PREFIX) or not digits.isdigit():
+        return None
+    if luhn_check_digit(digits[:-1]) != int(digits[-1]):
+        return None
+    return int(digits[:-1])
+
+def is_allocated_format(account_number):
+    # Такие номера выдает только распределитель, иначе ручной номер может совпасть с будущим
+    return parse_serial(account_number) is not None
+
+# ==================== РАСПРЕДЕЛИТЕЛЬ ====================
+class AccountNumberAllocator:
+    """Выдает номера счетов без обращения к БД на каждый номер.
+    
+    Процесс резервирует в таблице-счетчике блок номеров одним UPDATE в
+    отдельной короткой транзакции и раздает их из памяти. Блоки разных
+    воркеров не пересекаются, поэтому номера уникальны без проверок.
+    Неиспользованный остаток блока при перезапуске просто пропускается.
+    Резервировать блок нужно до того, как сессия начала запись: в SQLite
+    отдельное соединение иначе будет ждать ее блокировку.
+    """
+    def __init__(self, block_size=BLOCK_SIZE):
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._next = 0
+        self._end = 0
+
+    def reset(self):
+        # После fork дочерний процесс не должен раздавать блок родителя
+        self._next = self._end = 0
+
+    def _reserve(self, size):
+        with db.engine.begin() as connection:
+            reserved = connection.execute(
+                update(AccountSequence)
+                .where(AccountSequence.name == SEQUENCE_NAME)
+                .values(next_value=AccountSequence.next_value + size)
+            )
+            if reserved.rowcount == 0:
+                start = _first_free_serial(connection)
+                connection.execute(insert(AccountSequence).values(name=SEQUENCE_NAME, next_value=start + size))
+                return start
+            end = connection.execute(
+                select(AccountSequence.next_value).where(AccountSequence.name == SEQUENCE_NAME)
+            ).scalar_one()
+            return end - size
+
+    def allocate(self):
+        with self._lock:
+            if self._next >= self._end:
+                self._next = self._reserve(self.block_size)
+                self._end = self._next + self.block_size
+            serial = self._next
+            self._next += 1
+        return format_account_number(serial)
+
+    def allocate_many(self, count):
+        """Номера для массовой загрузки: недостающие резервируются одним блоком"""
+        with self._lock:
+            serials = list(range(self._next, min(self._end, self._next + count)))
+            self._next += len(serials)
+            if len(serials) < count:
+                start = self._reserve(count - len(serials))
+                serials.extend(range(start, start + count - len(serials)))
+        return [format_account_number(serial) for serial in serials]
+
+def _first_free_serial(connection):
+    # Счетчик создается впервые: начинаем после номеров этого формата, уже занятых в базе
+    length = len(PREFIX) + SERIAL_DIGITS + 1
+    numbers = connection.execute(
+        select(User.account_number).where(
+            User.account_number.like(f'{PREFIX}%'),
+            db.func.length(User.account_number) == length
+        )
+    ).scalars()
+    serials = [serial for serial in map(parse_serial, numbers) if serial is not None]
+    return max(serials, default=0) + 1
+
+allocator = AccountNumberAllocator()
+os.register_at_fork(after_in_child=allocator.reset)
+
+def allocate_account_number():
+    return allocator.allocate()
+
+def allocate_account_numbers(count):
+    return allocator.allocate_many(count)
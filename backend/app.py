@@ -1,16 +1,65 @@
-from flask import Flask, request, jsonify, session, send_from_directory, render_template_string
+from flask import Flask, Response, abort, g, request, jsonify, session, render_template_string, stream_with_context
 from flask_cors import CORS
 from models import db, User, Transaction
 from validators import Validator
-from auth import login_required, manager_required, client_required
-import random
+from auth import login_required, manager_required, client_required, RPCError, BankRequest, load_principal, invalidate_principal, principal_cache
+from seed import seed_test_data, bulk_seed
+from accounts import allocate_account_number, is_allocated_format
+from migrations import upgrade_schema
+from history import transaction_history, parse_date, parse_limit
+from stats import snapshot, record_user_change, get_statistics, get_versions, rebuild_statistics, ensure_statistics
+from transfers import transfer, bulk_transfer, parse_transfer_lines
+from transfer_queue import TransferQueue
+from checkpoints import write_checkpoints, checkpoint_active_accounts, balance_at, balance_series, series_to_dict
+from search import search_users
+from recipients import resolve_recipient, invalidate_recipients, display_name, mask_account_number, recipient_cache
+from assets import AssetStore, asset_response, brotli_available
+from export import export_transactions, encode_chunks, gzip_stream, FORMATS as EXPORT_FORMATS
+from importer import import_users, read_rows, read_text, write_rejected_report, ROLES
+from serialization import FastJSONProvider, parse_fields, pack_rows, USER_FIELDS, TRANSACTION_FIELDS
+from metrics import metrics
+from storage import configure_database, init_storage, storage_info, use_route, routed, READ, WRITE, READ_BIND
+from events import bus, format_event, balance_data, publish_transfer, publish_transfers, publish_balances
+from idempotency import idempotent, current_claim, remember, sweep_expired, KeySweeper
+from archive import archive
+from money import to_kopecks, from_kopecks
+from datetime import datetime, timedelta
+import click
+from itertools import islice
 import os
 
 app = Flask(__name__, 
             static_folder='../frontend',  # Добавлено для статических файлов
             template_folder='../frontend') # Добавлено для шаблонов
+app.request_class = BankRequest
+app.json = FastJSONProvider(app)
 app.config['SECRET_KEY'] = 'banking-system-secret-key-2025'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['JSONRPC_MAX_BATCH_SIZE'] = 50
+app.config['BULK_TRANSFER_MAX_ROWS'] = 100000
+app.config['IMPORT_HASH_WORKERS'] = int(os.environ.get('IMPORT_HASH_WORKERS', os.cpu_count() or 1))
+# importUsers держит воркер на все время bcrypt: большие файлы - через flask import-users
+app.config['IMPORT_MAX_ROWS'] = int(os.environ.get('IMPORT_MAX_ROWS', 1000))
+# Вызовы дольше порога попадают в журнал медленных запросов вместе с их SQL
+app.config['SLOW_REQUEST_MS'] = float(os.environ.get('SLOW_REQUEST_MS', 500))
+# Токен для /metrics (Authorization: Bearer ...); без него метрики видны только менеджеру
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+# Поток событий /api/events. В синхронном режиме открытый поток занимает поток сервера,
+# поэтому он включается явно (EVENTS_ENABLED=1); asgi.py включает его сам
+app.config['EVENTS_ENABLED'] = os.environ.get('EVENTS_ENABLED') == '1'
+# Пинг при простое и пауза браузера перед переподключением
+app.config['EVENTS_HEARTBEAT'] = float(os.environ.get('EVENTS_HEARTBEAT', 15))
+app.config['EVENTS_RETRY_MS'] = int(os.environ.get('EVENTS_RETRY_MS', 3000))
+# Переводы через очередь с одним писателем и групповым commit (см. transfer_queue.py)
+app.config['TRANSFER_QUEUE'] = os.environ.get('TRANSFER_QUEUE') == '1'
+app.config['TRANSFER_BATCH_SIZE'] = int(os.environ.get('TRANSFER_BATCH_SIZE', 64))
+app.config['TRANSFER_MAX_DELAY_MS'] = float(os.environ.get('TRANSFER_MAX_DELAY_MS', 2))
+# Ключи идемпотентности изменяющих методов: срок хранения и период фоновой очистки (0 - без потока)
+app.config['IDEMPOTENCY_TTL_HOURS'] = float(os.environ.get('IDEMPOTENCY_TTL_HOURS', 24))
+app.config['IDEMPOTENCY_SWEEP_INTERVAL'] = float(os.environ.get('IDEMPOTENCY_SWEEP_INTERVAL', 300))
+# Холодный архив операций (см. archive.py): каталог сегментов и горизонт по умолчанию
+app.config['ARCHIVE_DIR'] = os.environ.get('ARCHIVE_DIR') or os.path.join(app.instance_path, 'archive')
+app.config['ARCHIVE_HORIZON_DAYS'] = int(os.environ.get('ARCHIVE_HORIZON_DAYS', 365))
 
 # ==================== НАСТРОЙКА ДЛЯ PYTHONANYWHERE ====================
 # Определяем где запускаем
@@ -31,6 +80,9 @@ else:
     DOMAINS = ['http://localhost:5000', 'http://127.0.0.1:5000']
     FRONTEND_PATH = '../frontend'
 
+# BANK_DATABASE_URI, пул соединений и PRAGMA SQLite - см. storage.py
+configure_database(app)
+
 # CORS настройки
 CORS(app, 
      supports_credentials=True, 
@@ -39,68 +91,164 @@ CORS(app,
      methods=['GET', 'POST', 'OPTIONS'])
 
 db.init_app(app)
+init_storage(app, db)
+archive.configure(app.config['ARCHIVE_DIR'])
 
-# ==================== ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ====================
-def generate_account_number():
-    return f"ACC{random.randint(1000, 9999)}"
+transfer_queue = TransferQueue(
+    app,
+    batch_size=app.config['TRANSFER_BATCH_SIZE'],
+    max_delay=app.config['TRANSFER_MAX_DELAY_MS'] / 1000
+)
+key_sweeper = KeySweeper(
+    app,
+    ttl_hours=app.config['IDEMPOTENCY_TTL_HOURS'],
+    interval=app.config['IDEMPOTENCY_SWEEP_INTERVAL']
+)
 
-def initialize_test_data():
+# ==================== ИНИЦИАЛИЗАЦИЯ БД ====================
+def init_database():
+    """Создает таблицы и демо-данные. Выполняется один раз при запуске, а не на каждый запрос"""
     with app.app_context():
-        if User.query.count() == 0:
-            admin1 = User(
-                login='admin1',
-                full_name='Иванов Иван Иванович',
-                role='manager',
-                phone='+79991112233',
-                account_number='ADMIN001'
-            )
-            admin1.set_password('admin123')
-            db.session.add(admin1)
-            
-            admin2 = User(
-                login='manager1',
-                full_name='Петрова Анна Сергеевна',
-                role='manager',
-                phone='+79992223344',
-                account_number='ADMIN002'
-            )
-            admin2.set_password('manager123')
-            db.session.add(admin2)
-            
-            clients_data = [
-                {'full_name': 'Сидоров Алексей Владимирович', 'phone': '+79161111111'},
-                {'full_name': 'Кузнецова Мария Петровна', 'phone': '+79162222222'},
-                {'full_name': 'Смирнов Дмитрий Алексеевич', 'phone': '+79163333333'},
-                {'full_name': 'Васильева Екатерина Игоревна', 'phone': '+79164444444'},
-                {'full_name': 'Попов Сергей Николаевич', 'phone': '+79165555555'},
-                {'full_name': 'Новикова Ольга Викторовна', 'phone': '+79166666666'},
-                {'full_name': 'Фёдоров Павел Александрович', 'phone': '+79167777777'},
-                {'full_name': 'Морозова Анастасия Дмитриевна', 'phone': '+79168888888'},
-                {'full_name': 'Волков Андрей Сергеевич', 'phone': '+79169999999'},
-                {'full_name': 'Лебедева Татьяна Михайловна', 'phone': '+79160000000'}
-            ]
-            
-            for i, client_data in enumerate(clients_data, 1):
-                client = User(
-                    login=f'client{i}',
-                    full_name=client_data['full_name'],
-                    role='client',
-                    phone=client_data['phone'],
-                    account_number=generate_account_number(),
-                    balance=10000.00
-                )
-                client.set_password(f'client{i}')
-                db.session.add(client)
-            
-            db.session.commit()
-            print("Тестовые данные созданы")
+        db.create_all()
+        upgrade_schema()
+        seed_test_data()
+        ensure_statistics()
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Создать таблицы и демо-пользователей"""
+    init_database()
+    click.echo(f"База данных готова: {app.config['SQLALCHEMY_DATABASE_URI']}")
+
+@app.cli.command('seed-bulk')
+@click.option('--clients', default=10000, show_default=True, help='Количество синтетических клиентов')
+@click.option('--transfers', default=0, show_default=True, help='Количество синтетических переводов')
+@click.option('--chunk-size', default=10000, show_default=True, help='Размер пакета вставки')
+@click.option('--seed', type=int, default=None, help='Зерно генератора для воспроизводимости')
+@click.option('--days', default=365, show_default=True, help='За сколько дней распределить переводы')
+def seed_bulk_command(clients, transfers, chunk_size, seed, days):
+    """Заполнить базу синтетическими клиентами и переводами"""
+    db.create_all()
+    upgrade_schema()
+
+    def progress(table, done, total):
+        click.echo(f"\r{table}: {done}/{total}", nl=False)
+        if done >= total:
+            click.echo()
+    
+    result = bulk_seed(clients, transfers, chunk_size=chunk_size, seed=seed, days=days, progress=progress)
+    click.echo(
+        f"Создано пользователей: {result['users']}, операций: {result['transactions']} "
+        f"(пропущено: {result['skipped_transfers']}, seed={result['seed']}) за {result['seconds']} с"
+    )
+
+@app.cli.command('import-users')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), default=None, help='По умолчанию - по расширению файла')
+@click.option('--chunk-size', default=1000, show_default=True, help='Пользователей в одной вставке')
+@click.option('--workers', type=int, default=None, help='Процессов для bcrypt (по умолчанию - число ядер)')
+@click.option('--rejected', 'rejected_path', type=click.Path(dir_okay=False), default=None, help='Куда записать отклоненные строки (CSV)')
+def import_users_command(path, fmt, chunk_size, workers, rejected_path):
+    """Импортировать пользователей из CSV или JSONL"""
+    db.create_all()
+    upgrade_schema()
+    fmt = fmt or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+    
+    def progress(processed, imported, rejected):
+        click.echo(f'Обработано: {processed}, импортировано: {imported}, отклонено: {rejected}')
+    
+    with open(path, encoding='utf-8', newline='') as source:
+        result = import_users(read_rows(source, fmt), chunk_size=chunk_size, workers=workers, progress=progress)
+    
+    click.echo(f"Готово за {result['seconds']} с: импортировано {result['imported']}, отклонено {len(result['rejected'])}")
+    if rejected_path and result['rejected']:
+        write_rejected_report(result['rejected'], rejected_path)
+        click.echo(f'Отклоненные строки: {rejected_path}')
+
+@app.cli.command('rebuild-stats')
+@click.option('--check', is_flag=True, help='Только проверить расхождения, ничего не записывая')
+def rebuild_stats_command(check):
+    """Пересчитать агрегаты статистики с нуля и показать расхождения"""
+    drift = rebuild_statistics(check_only=check)
+    if not drift:
+        click.echo('Расхождений нет')
+        return
+    for key, (stored, expected) in drift.items():
+        click.echo(f'{key}: было {stored}, должно быть {expected}')
+    if check:
+        raise SystemExit(1)
+    click.echo('Агрегаты пересчитаны')
+
+@app.cli.command('checkpoint-balances')
+@click.option('--min-transactions', default=1, show_default=True, help='Сколько операций с последней точки нужно для новой')
+def checkpoint_balances_command(min_transactions):
+    """Записать контрольные точки балансов (периодическое задание)"""
+    opened, written = checkpoint_active_accounts(min_transactions)
+    click.echo(f'Начальных точек: {opened}, новых точек: {written}')
+
+@app.cli.command('archive-transactions')
+@click.option('--days', type=int, default=None, help='Горизонт в днях (по умолчанию ARCHIVE_HORIZON_DAYS)')
+def archive_transactions_command(days):
+    """Перенести операции старше горизонта в сжатые сегменты архива"""
+    days = app.config['ARCHIVE_HORIZON_DAYS'] if days is None else days
+    now = datetime.utcnow()
+    # Граница - начало дня, чтобы повторные запуски в течение дня ничего не меняли
+    cutoff = datetime(now.year, now.month, now.day) - timedelta(days=days)
+    click.echo(f"Архив: {app.config['ARCHIVE_DIR']}, операции раньше {cutoff.isoformat()}")
+    result = archive.archive_before(cutoff, progress=lambda done: click.echo(f'Записано в сегменты: {done}'))
+    click.echo(f"Перенесено операций: {result['rows']}, сегментов: {result['segments']}, "
+               f"удалено из базы: {result.get('deleted', 0)}")
+
+@app.cli.command('sweep-idempotency-keys')
+@click.option('--hours', type=float, default=None, help='Срок хранения ключей (по умолчанию IDEMPOTENCY_TTL_HOURS)')
+def sweep_idempotency_keys_command(hours):
+    """Удалить просроченные ключи идемпотентности (если фоновая очистка выключена)"""
+    hours = app.config['IDEMPOTENCY_TTL_HOURS'] if hours is None else hours
+    deleted = sweep_expired(timedelta(hours=hours))
+    click.echo(f'Удалено ключей: {deleted}')
+
+@app.cli.command('storage-info')
+def storage_info_command():
+    """Показать настройки соединения с базой (PRAGMA, состояние пула)"""
+    click.echo(f"База: {app.config['SQLALCHEMY_DATABASE_URI']}")
+    for name, value in storage_info(db.engine).items():
+        click.echo(f'{name}: {value}')
+    if READ_BIND in db.engines:
+        read_engine = db.engines[READ_BIND]
+        click.echo(f'Чтения: {read_engine.url}')
+        for name, value in storage_info(read_engine).items():
+            click.echo(f'  {name}: {value}')
 
 # ==================== СТАТИЧЕСКИЕ ФАЙЛЫ ====================
+# Статика собирается в память при первом запросе; в режиме отладки - пересобирается при изменении файлов
+# Относительный путь считается от каталога приложения, а не от текущего каталога процесса
+FRONTEND_DIR = os.path.normpath(os.path.join(app.root_path, FRONTEND_PATH))
+assets = AssetStore(FRONTEND_DIR, auto_reload=app.debug or os.environ.get('FLASK_DEBUG') == '1')
+
+@app.cli.command('build-assets')
+@click.option('--output', default=None, help='Каталог для готовых файлов (по умолчанию - build/frontend рядом с backend)')
+def build_assets_command(output):
+    """Собрать статику с хешами в именах и сжатыми копиями (.gz, .br)"""
+    if output is None:
+        output = os.path.normpath(os.path.join(app.root_path, '..', 'build', 'frontend'))
+    written = assets.write(output)
+    compressions = 'gzip и brotli' if brotli_available() else 'gzip'
+    click.echo(f'Записано файлов: {written} ({compressions}) в {os.path.abspath(output)}')
+
+def serve_asset(path):
+    asset = assets.get(path)
+    if asset is None:
+        abort(404)
+    return asset_response(request, asset)
+
 @app.route('/')
 def index():
     """Главная страница"""
     try:
-        return send_from_directory(FRONTEND_PATH, 'index.html')
+        index_page = assets.get('index.html')
+        if index_page is None:
+            raise FileNotFoundError(os.path.join(FRONTEND_DIR, 'index.html'))
+        return asset_response(request, index_page)
     except Exception as e:
         print(f"Ошибка загрузки фронтенда: {e}")
         # Возвращаем простую HTML страницу если не получается загрузить index.html
@@ -139,23 +287,133 @@ def index():
 
 @app.route('/css/<path:filename>')
 def serve_css(filename):
-    try:
-        return send_from_directory(os.path.join(FRONTEND_PATH, 'css'), filename)
-    except:
-        return send_from_directory(FRONTEND_PATH, filename)
+    return serve_asset(f'css/{filename}')
 
 @app.route('/js/<path:filename>')
 def serve_js(filename):
-    try:
-        return send_from_directory(os.path.join(FRONTEND_PATH, 'js'), filename)
-    except:
-        return send_from_directory(FRONTEND_PATH, filename)
+    return serve_asset(f'js/{filename}')
 
 @app.route('/static/<path:filename>')
 def serve_static(filename):
-    return send_from_directory(FRONTEND_PATH, filename)
+    return serve_asset(filename)
 
 # ==================== API ====================
+# Методы, которые ничего не пишут в БД: в пакете они работают в общей сессии,
+# а их запросы идут на движок только для чтения (если он настроен)
+READ_ONLY_METHODS = {
+    'verifyToken',
+    'getAccountInfo',
+    'getTransactionHistory',
+    'getAllUsers',
+    'getStatistics',
+    'getCacheStats',
+    'resolveRecipient',
+    'getBalanceAt',
+    'getBalanceSeries',
+    'getMetrics'
+}
+
+@app.errorhandler(RPCError)
+def handle_rpc_error(e):
+    # Ошибки авторизации на обычных (не JSON-RPC) маршрутах
+    return jsonify(rpc_error(e.code, e.message)), e.status
+
+def rpc_error(code, message, request_id=None):
+    return {
+        'jsonrpc': '2.0',
+        'error': {'code': code, 'message': message},
+        'id': request_id
+    }
+
+def reset_session(method):
+    # Неудачная запись не должна мешать следующим вызовам пакета,
+    # а чтения сохраняют общую сессию с уже загруженными объектами
+    if method not in READ_ONLY_METHODS:
+        db.session.rollback()
+
+# ==================== УСЛОВНЫЕ ЧТЕНИЯ ====================
+def requested_version(params):
+    """Версия, которая уже есть у клиента: параметр ifVersion или заголовок If-None-Match.
+    Заголовок учитывается только для одиночного вызова: в пакете он общий для всех"""
+    value = params.get('ifVersion')
+    if value is None and not g.get('rpc_batch'):
+        value = request.headers.get('If-None-Match')
+    if value is None:
+        return None
+    return str(value).strip().removeprefix('W/').strip('"')
+
+def not_modified(version, params):
+    """Короткий ответ, если у клиента уже эта версия, иначе None.
+    Версия читается до данных, поэтому отданные данные не старше нее"""
+    if version is None:
+        return None
+    g.etag = f'"{version}"'
+    if requested_version(params) == str(version):
+        return {'notModified': True, 'version': version}
+    return None
+
+def dispatch_call(call):
+    """Выполняет один вызов JSON-RPC с замером времени, SQL и bcrypt, возвращает (ответ, HTTP-статус)"""
+    method = call.get('method') if isinstance(call, dict) else None
+    route = READ if method in READ_ONLY_METHODS else WRITE
+    # Неизвестные методы собираются под одной меткой, чтобы не плодить метрики
+    trace = metrics.start_call(method if method in handlers else 'unknown', route)
+    with use_route(route):
+        response, status = execute_call(call)
+    error = response.get('error')
+    metrics.finish_call(
+        trace,
+        error_code=error['code'] if error else None,
+        slow_threshold=app.config['SLOW_REQUEST_MS'] / 1000
+    )
+    return response, status
+
+def execute_call(call):
+    if not isinstance(call, dict) or not isinstance(call.get('method'), str):
+        return rpc_error(-32600, 'Invalid Request'), 400
+    
+    method = call['method']
+    params = call.get('params', {})
+    request_id = call.get('id')
+    
+    if method not in handlers:
+        return rpc_error(-32601, 'Method not found', request_id), 404
+    
+    try:
+        result = handlers[method](params)
+    except RPCError as e:
+        reset_session(method)
+        return rpc_error(e.code, e.message, request_id), e.status
+    except Exception as e:
+        reset_session(method)
+        return rpc_error(-32000, str(e), request_id), 400
+    
+    return {
+        'jsonrpc': '2.0',
+        'result': result,
+        'id': request_id
+    }, 200
+
+def dispatch_batch(calls):
+    if not calls:
+        return jsonify(rpc_error(-32600, 'Invalid Request')), 400
+    
+    if len(calls) > app.config['JSONRPC_MAX_BATCH_SIZE']:
+        return jsonify(rpc_error(-32600, 'Invalid Request: batch too large')), 400
+    
+    # Ответы возвращаются в порядке вызовов, уведомления (без id) ответа не получают
+    g.rpc_batch = True
+    responses = []
+    for call in calls:
+        response, _ = dispatch_call(call)
+        if isinstance(call, dict) and 'method' in call and 'id' not in call:
+            continue
+        responses.append(response)
+    
+    if not responses:
+        return '', 204
+    return jsonify(responses), 200
+
 @app.route('/api', methods=['POST', 'OPTIONS'])
 def jsonrpc_handler():
     if request.method == 'OPTIONS':
@@ -163,61 +421,32 @@ def jsonrpc_handler():
     
     try:
         if not request.is_json:
-            return jsonify({
-                'jsonrpc': '2.0',
-                'error': {'code': -32600, 'message': 'Invalid Request'},
-                'id': None
-            }), 400
+            return jsonify(rpc_error(-32600, 'Invalid Request')), 400
         
         data = request.get_json()
-        method = data.get('method')
-        params = data.get('params', {})
-        request_id = data.get('id')
         
-        initialize_test_data()
+        if isinstance(data, list):
+            return dispatch_batch(data)
         
-        handlers = {
-            'login': handle_login,
-            'logout': handle_logout,
-            'verifyToken': handle_verify_token,
-            'getAccountInfo': handle_get_account_info,
-            'getTransactionHistory': handle_get_transaction_history,
-            'transferMoney': handle_transfer_money,
-            'getAllUsers': handle_get_all_users,
-            'createUser': handle_create_user,
-            'updateUser': handle_update_user,
-            'deleteUser': handle_delete_user,
-            'deleteAccount': handle_delete_account,
-            'getStatistics': handle_get_statistics
-        }
-        
-        if method in handlers:
-            try:
-                result = handlers[method](params)
-                return jsonify({
-                    'jsonrpc': '2.0',
-                    'result': result,
-                    'id': request_id
-                })
-            except Exception as e:
-                return jsonify({
-                    'jsonrpc': '2.0',
-                    'error': {'code': -32000, 'message': str(e)},
-                    'id': request_id
-                }), 400
-        else:
-            return jsonify({
-                'jsonrpc': '2.0',
-                'error': {'code': -32601, 'message': 'Method not found'},
-                'id': request_id
-            }), 404
-            
+        response, status = dispatch_call(data)
+        response = jsonify(response)
+        if status == 200 and g.get('etag'):
+            response.headers['ETag'] = g.etag
+        return response, status
+    
     except Exception as e:
-        return jsonify({
-            'jsonrpc': '2.0',
-            'error': {'code': -32603, 'message': f'Internal error: {str(e)}'},
-            'id': None
-        }), 500
+        return jsonify(rpc_error(-32603, f'Internal error: {str(e)}')), 500
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Метрики вызовов для Prometheus (по токену или в сессии менеджера)"""
+    token = app.config['METRICS_TOKEN']
+    if not token or request.headers.get('Authorization') != f'Bearer {token}':
+        user_id = session.get('user_id')
+        principal = load_principal(user_id) if user_id else None
+        if not principal or not principal.is_active or principal.role != 'manager':
+            raise RPCError(-32007, 'Доступ только для менеджеров', 403)
+    return Response(metrics.prometheus(), mimetype='text/plain; version=0.0.4')
 
 def handle_login(params):
     login = params.get('login')
@@ -238,7 +467,8 @@ def handle_login(params):
     session['user_id'] = user.id
     
     return {
-        'user': user.to_dict()
+        'user': user.to_dict(),
+        'events': app.config['EVENTS_ENABLED']
     }
 
 def handle_logout(params):
@@ -250,39 +480,98 @@ def handle_verify_token(params):
     if not user_id:
         raise Exception('Не авторизован')
     
-    user = User.query.get(user_id)
-    if not user or not user.is_active:
+    principal = load_principal(user_id)
+    if not principal or not principal.is_active:
         raise Exception('Пользователь не найден')
     
-    return {'valid': True}
+    return {'valid': True, 'events': app.config['EVENTS_ENABLED']}
 
 @login_required
 def handle_get_account_info(params):
+    params = params or {}
+    version = db.session.execute(
+        db.select(User.version).where(User.id == request.principal.id)
+    ).scalar()
+    unchanged = not_modified(version, params)
+    if unchanged:
+        return unchanged
     return request.user.to_dict()
 
 @login_required
 @client_required
 def handle_get_transaction_history(params):
-    transactions = Transaction.query.filter(
-        (Transaction.sender_id == request.user.id) | 
-        (Transaction.receiver_id == request.user.id)
-    ).order_by(Transaction.created_at.desc()).all()
-    
-    result = []
-    for tx in transactions:
-        tx_dict = tx.to_dict()
-        if tx.sender_id == request.user.id:
-            tx_dict['type'] = 'outgoing'
-            tx_dict['counterparty'] = tx.receiver.full_name
-        else:
-            tx_dict['type'] = 'incoming'
-            tx_dict['counterparty'] = tx.sender.full_name
-        result.append(tx_dict)
+    params = params or {}
+    date_from = parse_date(params.get('dateFrom'))
+    date_to = parse_date(params.get('dateTo'), end_of_day=True)
+    fields = parse_fields(params.get('fields'), TRANSACTION_FIELDS)
     
-    return result
+    # Без параметров пагинации - прежний формат ответа: полный список операций
+    if not any(key in params for key in ('limit', 'cursor', 'dateFrom', 'dateTo')):
+        transactions, _ = transaction_history(request.principal.id, fields=fields)
+        return transactions
+    
+    transactions, next_cursor = transaction_history(
+        request.principal.id,
+        limit=parse_limit(params.get('limit')),
+        cursor=params.get('cursor'),
+        date_from=date_from,
+        date_to=date_to,
+        fields=fields
+    )
+    return {
+        'transactions': transactions,
+        'next_cursor': next_cursor
+    }
+
+def balance_owner(params):
+    # Клиент видит только свой счет, менеджер - любой по userId
+    user_id = params.get('userId')
+    if user_id is None:
+        return request.principal.id
+    # userId может прийти строкой ("3"): сравниваем с id сессии уже как число
+    try:
+        user_id = int(user_id)
+    except (ValueError, TypeError):
+        raise Exception('Некорректный userId')
+    if user_id == request.principal.id:
+        return request.principal.id
+    if request.principal.role != 'manager':
+        raise RPCError(-32007, 'Доступ только для менеджеров', 403)
+    if not db.session.get(User, user_id):
+        raise Exception('Пользователь не найден')
+    return user_id
+
+@login_required
+def handle_get_balance_at(params):
+    user_id = balance_owner(params)
+    at = parse_date(params.get('date'), end_of_day=True)
+    if at is None:
+        raise Exception('Укажите date')
+    
+    return {
+        'user_id': user_id,
+        'date': params.get('date'),
+        'balance': from_kopecks(balance_at(user_id, at))
+    }
+
+@login_required
+def handle_get_balance_series(params):
+    user_id = balance_owner(params)
+    date_from = parse_date(params.get('dateFrom'))
+    date_to = parse_date(params.get('dateTo'), end_of_day=True) or datetime.utcnow()
+    if date_from is None:
+        raise Exception('Укажите dateFrom')
+    interval = params.get('interval', 'day')
+    
+    return {
+        'user_id': user_id,
+        'interval': interval,
+        'points': series_to_dict(balance_series(user_id, date_from, date_to, interval))
+    }
 
 @login_required
 @client_required
+@idempotent('transferMoney')
 def handle_transfer_money(params):
     recipient = params.get('recipient')
     amount = params.get('amount')
@@ -291,48 +580,226 @@ def handle_transfer_money(params):
     if not is_valid:
         raise Exception(message)
     
-    amount = float(amount)
-    
-    if request.user.balance < amount:
-        raise Exception('Недостаточно средств')
-    
-    receiver = User.query.filter(
-        (User.account_number == recipient) | (User.phone == recipient)
-    ).first()
+    amount = to_kopecks(amount)
     
-    if not receiver or receiver.role != 'client':
+    receiver = resolve_recipient(recipient)
+    if not receiver:
         raise Exception('Получатель не найден')
     
-    if receiver.id == request.user.id:
+    if receiver.id == request.principal.id:
         raise Exception('Нельзя переводить самому себе')
     
-    request.user.balance -= amount
-    receiver.balance += amount
-    
-    transaction = Transaction(
-        sender_id=request.user.id,
-        receiver_id=receiver.id,
-        amount=amount,
-        description=f'Перевод {recipient}'
+    submit = transfer_queue.submit if app.config['TRANSFER_QUEUE'] else transfer
+    claim = current_claim()
+    transaction_id, new_balance = submit(
+        request.principal.id,
+        receiver.id,
+        amount,
+        description=f'Перевод {recipient}',
+        # Ключ идемпотентности с ответом фиксируется тем же commit, что и перевод
+        on_applied=(lambda result: claim.store(transfer_result(*result))) if claim else None
     )
+    # Уведомления - только после commit: подписчики не увидят откатившийся перевод
+    try:
+        publish_transfer(transaction_id, request.principal.id, receiver.id, amount, description=f'Перевод {recipient}')
+    except Exception:
+        app.logger.exception('Не удалось отправить события перевода %s', transaction_id)
     
-    db.session.add(transaction)
-    db.session.commit()
-    
+    return transfer_result(transaction_id, new_balance)
+
+def transfer_result(transaction_id, new_balance):
     return {
         'success': True,
-        'transaction_id': transaction.id,
-        'new_balance': round(request.user.balance, 2)
+        'transaction_id': transaction_id,
+        'new_balance': from_kopecks(new_balance)
     }
 
+@login_required
+def handle_resolve_recipient(params):
+    # Предпросмотр получателя перед переводом, сам перевод не начинается
+    receiver = resolve_recipient(params.get('recipient'))
+    if not receiver:
+        raise Exception('Получатель не найден')
+    
+    # Полный номер не отдается: иначе поиск по телефону раскрывал бы номер счета
+    return {
+        'account_number': mask_account_number(receiver.account_number),
+        'display_name': display_name(receiver.full_name),
+        'is_self': receiver.id == request.principal.id
+    }
+
+def run_bulk_transfer(source_account, rows, description=None):
+    source = db.session.query(User.id).filter_by(account_number=source_account).first()
+    if not source:
+        raise Exception('Счет списания не найден')
+    
+    rows = list(rows)
+    if len(rows) > app.config['BULK_TRANSFER_MAX_ROWS']:
+        raise Exception(f"Слишком много строк (максимум {app.config['BULK_TRANSFER_MAX_ROWS']})")
+    
+    claim = current_claim()
+    result = bulk_transfer(
+        source.id,
+        rows,
+        description=description,
+        on_applied=(lambda result: claim.store(bulk_result(result))) if claim else None
+    )
+    # Уведомления - только после commit, как у одиночного перевода
+    try:
+        publish_transfers(source.id, result['transactions'])
+    except Exception:
+        app.logger.exception('Не удалось отправить события выплаты со счета %s', source_account)
+    return bulk_result(result)
+
+def bulk_result(result):
+    data = {key: value for key, value in result.items() if key != 'transactions'}
+    return dict(data, total=from_kopecks(result['total']), new_balance=from_kopecks(result['new_balance']))
+
+@login_required
+@manager_required
+@idempotent('bulkTransfer')
+def handle_bulk_transfer(params):
+    source_account = params.get('sourceAccount')
+    if 'jsonl' in params:
+        rows = parse_transfer_lines(str(params['jsonl']).splitlines())
+    else:
+        rows = params.get('transfers')
+        if not isinstance(rows, list):
+            raise Exception('transfers должен быть списком {recipient, amount}')
+    
+    return run_bulk_transfer(source_account, rows, params.get('description'))
+
+@app.route('/api/bulk-transfer', methods=['POST'])
+@login_required
+@manager_required
+def bulk_transfer_upload():
+    """Массовая выплата из JSONL-файла: тело запроса читается построчно, без загрузки целиком"""
+    try:
+        result = run_bulk_transfer(
+            request.args.get('sourceAccount'),
+            parse_transfer_lines(request.stream),
+            request.args.get('description')
+        )
+    except Exception as e:
+        return jsonify(rpc_error(-32000, str(e))), 400
+    return jsonify({'jsonrpc': '2.0', 'result': result, 'id': None})
+
+@app.route('/api/export/transactions', methods=['GET'])
+@login_required
+@manager_required
+def export_transactions_download():
+    """Выгрузка операций за период в CSV или JSONL (gzip=1 - сжатый файл), отдается потоком"""
+    fmt = request.args.get('format', 'csv')
+    try:
+        if fmt not in EXPORT_FORMATS:
+            raise Exception('Формат должен быть csv или jsonl')
+        date_from = parse_date(request.args.get('dateFrom'))
+        date_to = parse_date(request.args.get('dateTo'), end_of_day=True)
+    except Exception as e:
+        return jsonify(rpc_error(-32000, str(e))), 400
+    
+    # Длинная выгрузка читает с движка только для чтения и не мешает переводам
+    body = encode_chunks(routed(export_transactions(date_from, date_to)), fmt)
+    filename = f'transactions.{fmt}'
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    if request.args.get('gzip') in ('1', 'true'):
+        body = gzip_stream(body)
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+@app.route('/api/events', methods=['GET'])
+@login_required
+@client_required
+def events_stream():
+    """Поток событий клиента (text/event-stream): balance и transaction.
+    
+    Первым событием приходит текущий баланс, поэтому после переподключения
+    ничего пропущенного догружать не нужно. Пока событий нет, раз в
+    EVENTS_HEARTBEAT секунд отправляется комментарий, и заодно проверяется,
+    что пользователь не заблокирован.
+    """
+    if not app.config['EVENTS_ENABLED']:
+        # Клиент узнает об этом из login/verifyToken и перечитывает счет сам
+        return jsonify(rpc_error(-32601, 'Поток событий выключен (EVENTS_ENABLED)')), 404
+    
+    user_id = request.principal.id
+    heartbeat = app.config['EVENTS_HEARTBEAT']
+    
+    def stream():
+        # Подписка раньше чтения баланса: событие между ними не потеряется
+        subscription = bus.subscribe(user_id)
+        try:
+            with app.app_context():
+                balance, version = db.session.execute(
+                    db.select(User.balance, User.version).where(User.id == user_id)
+                ).one()
+            yield f"retry: {app.config['EVENTS_RETRY_MS']}\n\n".encode('utf-8')
+            yield format_event({'id': 0, 'type': 'balance', 'data': balance_data(balance, version)})
+            while not subscription.overflowed:
+                event = subscription.get(timeout=heartbeat)
+                if event is not None:
+                    yield format_event(event)
+                    continue
+                with app.app_context():
+                    principal = load_principal(user_id)
+                if not principal or not principal.is_active:
+                    return
+                yield b': ping\n\n'
+        finally:
+            bus.unsubscribe(subscription)
+    
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # nginx не должен буферизовать поток
+    })
+
 @login_required
 @manager_required
 def handle_get_all_users(params):
-    users = User.query.filter_by(is_active=True).all()
-    return [user.to_dict() for user in users]
+    params = params or {}
+    _, users_version = get_versions()
+    unchanged = not_modified(users_version, params)
+    if unchanged:
+        return unchanged
+    
+    fields = parse_fields(params.get('fields'), USER_FIELDS)
+    
+    # Без параметров поиска - прежний формат ответа: все активные пользователи.
+    # ifVersion формат не меняет: версия проверена выше, а клиенту отдается в ETag
+    if not any(key in params for key in ('query', 'role', 'minBalance', 'maxBalance', 'sort', 'limit', 'cursor')):
+        if fields:
+            rows = db.session.execute(
+                db.select(*(getattr(User, name) for name in fields)).where(User.is_active == True)
+            ).all()
+            return pack_rows(rows, fields)
+        users = User.query.filter_by(is_active=True).all()
+        return [user.to_dict() for user in users]
+    
+    users, next_cursor = search_users(
+        query=params.get('query'),
+        role=params.get('role'),
+        min_balance=params.get('minBalance'),
+        max_balance=params.get('maxBalance'),
+        sort=params.get('sort', 'id'),
+        limit=parse_limit(params.get('limit')),
+        cursor=params.get('cursor'),
+        fields=fields
+    )
+    return {
+        'users': users,
+        'next_cursor': next_cursor,
+        'version': users_version
+    }
 
 @login_required
 @manager_required
+@idempotent('createUser')
 def handle_create_user(params):
     login = params.get('login')
     password = params.get('password')
@@ -342,24 +809,18 @@ def handle_create_user(params):
     account_number = params.get('accountNumber')
     balance = params.get('balance', 1000.0 if role == 'client' else 0)
     
-    for field, value, validator in [
-        ('login', login, Validator.validate_login),
-        ('password', password, Validator.validate_password),
-        ('full_name', full_name, Validator.validate_full_name),
-        ('phone', phone, Validator.validate_phone),
-        ('account_number', account_number, Validator.validate_account_number),
-        ('balance', balance, Validator.validate_balance)
-    ]:
-        is_valid, message = validator(value)
-        if not is_valid:
-            raise Exception(f'{field}: {message}')
+    is_valid, message = Validator.validate_new_user(login, password, full_name, phone, account_number, balance)
+    if not is_valid:
+        raise Exception(message)
     
     if User.query.filter_by(login=login).first():
         raise Exception('Логин уже существует')
     
     if role == 'client':
         if not account_number:
-            account_number = generate_account_number()
+            account_number = allocate_account_number()
+        elif is_allocated_format(account_number):
+            raise Exception('Номера счетов этого формата выдаются автоматически')
         if User.query.filter_by(account_number=account_number).first():
             raise Exception('Номер счета уже существует')
     
@@ -369,24 +830,58 @@ def handle_create_user(params):
         role=role,
         phone=phone,
         account_number=account_number if role == 'client' else None,
-        balance=float(balance)
+        balance=to_kopecks(balance)
     )
     user.set_password(password)
     
     db.session.add(user)
+    record_user_change(None, snapshot(user))
+    db.session.flush()
+    write_checkpoints([user.id], as_of=user.created_at)
+    result = user.to_dict()
+    remember(result)
     db.session.commit()
     
-    return user.to_dict()
+    return result
 
 @login_required
 @manager_required
+def handle_import_users(params):
+    # Импорт фиксируется пачками: ключ нельзя записать одним commit с изменением
+    if 'idempotencyKey' in params:
+        raise Exception('importUsers не поддерживает idempotencyKey: повторный импорт отклоняет существующие логины')
+    if 'csv' in params:
+        rows = read_text(str(params['csv']), 'csv')
+    elif 'jsonl' in params:
+        rows = read_text(str(params['jsonl']), 'jsonl')
+    else:
+        rows = params.get('users')
+        if not isinstance(rows, list):
+            raise Exception('Передайте users (список), csv или jsonl')
+    
+    # Лимит проверяется до импорта: пачки фиксируются по одной, и прерывать его на середине нельзя
+    max_rows = app.config['IMPORT_MAX_ROWS']
+    rows = list(islice(rows, max_rows + 1))
+    if len(rows) > max_rows:
+        raise Exception(f'Слишком много строк (максимум {max_rows}), большие файлы импортируйте командой flask import-users')
+    # Пул потоков, а не процессов: fork из воркера копировал бы его фоновые потоки
+    return import_users(rows, workers=app.config['IMPORT_HASH_WORKERS'], threads=True)
+
+# Поля, которые менеджер может менять через updateUser; служебные колонки
+# (password_hash, phone_normalized, version) меняются только самим приложением
+EDITABLE_USER_FIELDS = ('login', 'password', 'full_name', 'role', 'phone', 'account_number', 'balance', 'is_active')
+
+@login_required
+@manager_required
+@idempotent('updateUser')
 def handle_update_user(params):
     user_id = params.get('id')
-    updates = {k: v for k, v in params.items() if k != 'id'}
+    updates = {k: v for k, v in params.items() if k in EDITABLE_USER_FIELDS}
     
     user = User.query.get(user_id)
     if not user:
         raise Exception('Пользователь не найден')
+    before = snapshot(user)
     
     if 'login' in updates:
         is_valid, message = Validator.validate_login(updates['login'])
@@ -412,62 +907,148 @@ def handle_update_user(params):
         if not is_valid:
             raise Exception(message)
     
+    if 'role' in updates and updates['role'] not in ROLES:
+        raise Exception('Роль должна быть client или manager')
+    
+    if 'is_active' in updates and not isinstance(updates['is_active'], bool):
+        raise Exception('is_active должен быть true или false')
+    
+    if 'account_number' in updates:
+        # Те же правила, что в createUser и импорте: номера распределителя вручную не задаются
+        account_number = updates['account_number']
+        if not account_number:
+            raise Exception('Номер счета не может быть пустым')
+        is_valid, message = Validator.validate_account_number(account_number)
+        if not is_valid:
+            raise Exception(message)
+        if account_number != user.account_number:
+            if is_allocated_format(account_number):
+                raise Exception('Номера счетов этого формата выдаются автоматически')
+            if User.query.filter(User.account_number == account_number, User.id != user.id).first():
+                raise Exception('Номер счета уже существует')
+    
     if 'balance' in updates:
         is_valid, message = Validator.validate_balance(updates['balance'])
         if not is_valid:
             raise Exception(message)
+        updates['balance'] = to_kopecks(updates['balance'])
     
     for key, value in updates.items():
-        if hasattr(user, key):
-            setattr(user, key, value)
+        setattr(user, key, value)
+    # Увеличение в SQL: параллельный перевод тоже меняет версию этой строки
+    user.version = User.version + 1
     
+    record_user_change(before, snapshot(user))
+    # После flush версия перечитывается из базы, и ответ совпадает с тем, что будет зафиксировано
+    db.session.flush()
+    if 'balance' in updates:
+        # Правка баланса мимо журнала операций: фиксируем ее контрольной точкой
+        write_checkpoints([user.id])
+    result = user.to_dict()
+    remember(result)
     db.session.commit()
-    return user.to_dict()
+    invalidate_principal(user.id)
+    invalidate_recipients()
+    if 'balance' in updates:
+        # Открытый поток клиента получает новый баланс без перезагрузки данных
+        try:
+            publish_balances([user.id])
+        except Exception:
+            app.logger.exception('Не удалось отправить событие баланса пользователя %s', user.id)
+    return result
 
 @login_required
 @manager_required
+@idempotent('deleteUser')
 def handle_delete_user(params):
     user_id = params.get('id')
     
-    if user_id == request.user.id:
+    if user_id == request.principal.id:
         raise Exception('Нельзя удалить самого себя')
     
     user = User.query.get(user_id)
     if not user:
         raise Exception('Пользователь не найден')
     
+    before = snapshot(user)
     user.is_active = False
+    user.version = User.version + 1
+    record_user_change(before, snapshot(user))
+    remember({'success': True})
     db.session.commit()
+    invalidate_principal(user.id)
+    invalidate_recipients()
     
     return {'success': True}
 
 @login_required
+@idempotent('deleteAccount')
 def handle_delete_account(params):
+    before = snapshot(request.user)
     request.user.is_active = False
+    request.user.version = User.version + 1
+    record_user_change(before, snapshot(request.user))
+    remember({'success': True})
     db.session.commit()
+    invalidate_principal(request.principal.id)
+    invalidate_recipients()
     session.clear()
     return {'success': True}
 
 @login_required
 @manager_required
 def handle_get_statistics(params):
-    users = User.query.filter_by(is_active=True).all()
-    total_users = len(users)
-    total_managers = len([u for u in users if u.role == 'manager'])
-    total_clients = len([u for u in users if u.role == 'client'])
-    total_balance = sum([u.balance for u in users if u.role == 'client'])
-    
+    # Агрегаты поддерживаются при каждой записи, здесь только чтение одной строки
+    version, _ = get_versions()
+    unchanged = not_modified(version, params or {})
+    if unchanged:
+        return unchanged
+    return get_statistics()
+
+@login_required
+@manager_required
+def handle_get_cache_stats(params):
     return {
-        'total_users': total_users,
-        'total_managers': total_managers,
-        'total_clients': total_clients,
-        'total_balance': round(total_balance, 2)
+        'auth': principal_cache.stats(),
+        'recipients': recipient_cache.stats()
     }
 
+@login_required
+@manager_required
+def handle_get_metrics(params):
+    params = params or {}
+    snapshot = metrics.snapshot()
+    if app.config['TRANSFER_QUEUE']:
+        snapshot['transfer_queue'] = transfer_queue.stats()
+    if params.get('reset'):
+        metrics.reset()
+    return snapshot
+
+handlers = {
+    'login': handle_login,
+    'logout': handle_logout,
+    'verifyToken': handle_verify_token,
+    'getAccountInfo': handle_get_account_info,
+    'getTransactionHistory': handle_get_transaction_history,
+    'getBalanceAt': handle_get_balance_at,
+    'getBalanceSeries': handle_get_balance_series,
+    'transferMoney': handle_transfer_money,
+    'resolveRecipient': handle_resolve_recipient,
+    'bulkTransfer': handle_bulk_transfer,
+    'getAllUsers': handle_get_all_users,
+    'createUser': handle_create_user,
+    'importUsers': handle_import_users,
+    'updateUser': handle_update_user,
+    'deleteUser': handle_delete_user,
+    'deleteAccount': handle_delete_account,
+    'getStatistics': handle_get_statistics,
+    'getCacheStats': handle_get_cache_stats,
+    'getMetrics': handle_get_metrics
+}
+
 # ==================== ЗАПУСК ====================
 if __name__ == '__main__':
-    with app.app_context():
-        db.create_all()
+    init_database()
     print("=" * 60)
     print("БАНКОВСКАЯ СИСТЕМА ЗАПУЩЕНА!")
     print("=" * 60)
@@ -476,7 +1057,7 @@ if __name__ == '__main__':
     print("Менеджеры: admin1/admin123, manager1/manager123")
     print("Клиенты: client1/client1 ... client10/client10")
     print("=" * 60)
-    print(f"Frontend путь: {FRONTEND_PATH}")
+    print(f"Frontend путь: {FRONTEND_DIR}")
     print(f"База данных: {app.config['SQLALCHEMY_DATABASE_URI']}")
     print("=" * 60)
     app.run(debug=True)
\ No newline at end of file
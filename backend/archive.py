@@ -0,0 +1,407 @@
+"""Холодный архив операций: старые строки transactions в сжатых сегментах по месяцам.
+
+Задание архивации (flask archive-transactions) переносит операции старше
+горизонта из основной базы в каталог архива:
+
+    archive/2024-01/segment-<run>.seg   - блоки по BLOCK_ROWS операций, каждый сжат zlib
+                                         отдельно (колонки в JSON), строки по (created_at, id)
+    archive/index.db                     - небольшой индекс SQLite: запуски, сегменты, блоки
+                                         с диапазонами дат и участники каждого сегмента
+
+Сегменты только дописываются: новый запуск создает новые файлы и не трогает
+старые. Граница архива - (cutoff, max_id) последнего запуска: все операции с
+created_at < cutoff и id <= max_id лежат в архиве, поэтому запросы к основной
+таблице, которые заходят за границу, исключают такие строки, и дублей нет даже
+если задание прервалось между записью архива и удалением строк из базы.
+"""
+from collections import namedtuple
+from datetime import datetime
+import heapq
+import json
+import os
+import sqlite3
+import threading
+import zlib
+from sqlalchemy import select, delete, func, and_, not_
+from models import db, User, Transaction
+
+BLOCK_ROWS = 2000
+READ_CHUNK = 5000
+COLUMNS = ('id', 'sender_id', 'receiver_id', 'amount', 'description', 'created_at')
+
+ArchivedTransaction = namedtuple('ArchivedTransaction', COLUMNS)
+
+class HistoryRow(namedtuple('HistoryRow', COLUMNS + ('type', 'counterparty'))):
+    """Строка истории из архива с тем же доступом к полям, что у строк запроса"""
+    @property
+    def _mapping(self):
+        return self._asdict()
+
+def _timestamp(moment):
+    # Одинаковая точность у всех значений: строки сравниваются как даты
+    return moment.isoformat(timespec='microseconds')
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS runs ('
+    'id INTEGER PRIMARY KEY, cutoff TEXT NOT NULL, max_id INTEGER NOT NULL, '
+    'rows INTEGER NOT NULL, volume INTEGER NOT NULL, created_at TEXT NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS segments ('
+    'id INTEGER PRIMARY KEY, run_id INTEGER NOT NULL, month TEXT NOT NULL, path TEXT NOT NULL, '
+    'rows INTEGER NOT NULL, volume INTEGER NOT NULL, min_created_at TEXT NOT NULL, max_created_at TEXT NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS blocks ('
+    'id INTEGER PRIMARY KEY, segment_id INTEGER NOT NULL, offset INTEGER NOT NULL, length INTEGER NOT NULL, '
+    'rows INTEGER NOT NULL, min_created_at TEXT NOT NULL, max_created_at TEXT NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS ix_blocks_segment ON blocks (segment_id, min_created_at)',
+    'CREATE TABLE IF NOT EXISTS segment_users ('
+    'user_id INTEGER NOT NULL, segment_id INTEGER NOT NULL, rows INTEGER NOT NULL, '
+    'PRIMARY KEY (user_id, segment_id)) WITHOUT ROWID'
+)
+
+# ==================== ЗАПИСЬ СЕГМЕНТА ====================
+class SegmentWriter:
+    """Один файл сегмента: строки одного месяца по возрастанию (created_at, id)"""
+    def __init__(self, directory, month, run_id):
+        self.month = month
+        self.relative_path = os.path.join(month, f'segment-{run_id:06d}.seg')
+        self.path = os.path.join(directory, self.relative_path)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._file = open(self.path + '.tmp', 'wb')
+        self._pending = []
+        self.blocks = []
+        self.users = {}
+        self.rows = 0
+        self.volume = 0
+        self.min_created_at = None
+        self.max_created_at = None
+
+    def add(self, row):
+        self._pending.append(row)
+        self.rows += 1
+        self.volume += row.amount
+        for user_id in (row.sender_id, row.receiver_id):
+            self.users[user_id] = self.users.get(user_id, 0) + 1
+        if len(self._pending) >= BLOCK_ROWS:
+            self._flush_block()
+
+    def _flush_block(self):
+        if not self._pending:
+            return
+        columns = {name: [getattr(row, name) for row in self._pending] for name in COLUMNS}
+        columns['created_at'] = [_timestamp(value) for value in columns['created_at']]
+        data = zlib.compress(json.dumps(columns, ensure_ascii=False, separators=(',', ':')).encode('utf-8'), 6)
+        offset = self._file.tell()
+        self._file.write(data)
+        first, last = columns['created_at'][0], columns['created_at'][-1]
+        self.blocks.append((offset, len(data), len(self._pending), first, last))
+        self.min_created_at = self.min_created_at or first
+        self.max_created_at = last
+        self._pending = []
+
+    def close(self):
+        self._flush_block()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self.path + '.tmp', self.path)
+
+def _read_block(directory, path, offset, length):
+    with open(os.path.join(directory, path), 'rb') as segment:
+        segment.seek(offset)
+        columns = json.loads(zlib.decompress(segment.read(length)))
+    created_at = [datetime.fromisoformat(value) for value in columns['created_at']]
+    return [
+        ArchivedTransaction(*values)
+        for values in zip(columns['id'], columns['sender_id'], columns['receiver_id'],
+                          columns['amount'], columns['description'], created_at)
+    ]
+
+# ==================== АРХИВ ====================
+class Archive:
+    """Каталог архива. Пока он не настроен или пуст, запросы работают только с основной базой"""
+    def __init__(self):
+        self.directory = None
+        self._boundary = None
+        self._index_mtime = None
+        self._lock = threading.Lock()
+
+    def configure(self, directory):
+        self.directory = directory
+        self._boundary = None
+        self._index_mtime = None
+
+    @property
+    def index_path(self):
+        return os.path.join(self.directory, 'index.db')
+
+    def _connect(self):
+        connection = sqlite3.connect(self.index_path, timeout=5)
+        connection.execute('PRAGMA journal_mode=WAL')
+        return connection
+
+    def boundary(self):
+        """(cutoff, max_id) последнего запуска или None; индекс перечитывается при изменении файла"""
+        if self.directory is None:
+            return None
+        try:
+            mtime = os.stat(self.index_path).st_mtime_ns
+            wal = os.path.join(self.directory, 'index.db-wal')
+            if os.path.exists(wal):
+                mtime = max(mtime, os.stat(wal).st_mtime_ns)
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            if mtime != self._index_mtime:
+                connection = self._connect()
+                try:
+                    row = connection.execute('SELECT cutoff, max_id FROM runs ORDER BY id DESC LIMIT 1').fetchone()
+                except sqlite3.OperationalError:
+                    row = None
+                finally:
+                    connection.close()
+                self._boundary = (datetime.fromisoformat(row[0]), row[1]) if row else None
+                self._index_mtime = mtime
+            return self._boundary
+
+    def reaches(self, date_from):
+        """Граница архива, если период запроса заходит за нее, иначе None"""
+        boundary = self.boundary()
+        if boundary is None or (date_from is not None and date_from >= boundary[0]):
+            return None
+        return boundary
+
+    def totals(self):
+        """(число операций, сумма в копейках) в архиве - для пересчета статистики"""
+        if self.boundary() is None:
+            return 0, 0
+        connection = self._connect()
+        try:
+            count, volume = connection.execute('SELECT COALESCE(SUM(rows), 0), COALESCE(SUM(volume), 0) FROM runs').fetchone()
+        finally:
+            connection.close()
+        return count, volume
+    
+    # ---------- Чтение ----------
+    def user_rows(self, user_id, date_from=None, date_to=None, before=None, after_id=None, limit=None, newest_first=True):
+        """Операции пользователя из архива (отправитель или получатель).
+        
+        before - (created_at, id): только строки строго раньше (курсор истории),
+        after_id - только с id больше (хвост после контрольной точки). С limit
+        месяцы читаются от новых к старым, пока не наберется limit строк.
+        """
+        if self.boundary() is None:
+            return []
+        query = (
+            'SELECT s.id, s.month, s.path FROM segment_users u JOIN segments s ON s.id = u.segment_id '
+            'WHERE u.user_id = ?'
+        )
+        params = [user_id]
+        if date_from is not None:
+            query += ' AND s.max_created_at >= ?'
+            params.append(_timestamp(date_from))
+        if date_to is not None:
+            query += ' AND s.min_created_at < ?'
+            params.append(_timestamp(date_to))
+        if before is not None:
+            query += ' AND s.min_created_at <= ?'
+            params.append(_timestamp(before[0]))
+        query += ' ORDER BY s.month DESC, s.id'
+        
+        connection = self._connect()
+        try:
+            segments = connection.execute(query, params).fetchall()
+            collected = []
+            month = None
+            for segment_id, segment_month, path in segments:
+                if limit is not None and segment_month != month and len(collected) >= limit:
+                    break
+                month = segment_month
+                for row in self._segment_rows(connection, segment_id, path, date_from, date_to):
+                    if row.sender_id != user_id and row.receiver_id != user_id:
+                        continue
+                    if before is not None and (row.created_at, row.id) >= before:
+                        continue
+                    if after_id is not None and row.id <= after_id:
+                        continue
+                    collected.append(row)
+        finally:
+            connection.close()
+        
+        collected.sort(key=lambda row: (row.created_at, row.id), reverse=newest_first)
+        return collected[:limit] if limit is not None else collected
+
+    def _segment_rows(self, connection, segment_id, path, date_from=None, date_to=None):
+        query = 'SELECT offset, length FROM blocks WHERE segment_id = ?'
+        params = [segment_id]
+        if date_from is not None:
+            query += ' AND max_created_at >= ?'
+            params.append(_timestamp(date_from))
+        if date_to is not None:
+            query += ' AND min_created_at < ?'
+            params.append(_timestamp(date_to))
+        for offset, length in connection.execute(query + ' ORDER BY min_created_at', params).fetchall():
+            for row in _read_block(self.directory, path, offset, length):
+                if date_from is not None and row.created_at < date_from:
+                    continue
+                if date_to is not None and row.created_at >= date_to:
+                    continue
+                yield row
+
+    def rows_between(self, date_from=None, date_to=None):
+        """Все операции архива за период по возрастанию (created_at, id), потоком"""
+        if self.boundary() is None:
+            return
+        query = 'SELECT id, path FROM segments WHERE 1 = 1'
+        params = []
+        if date_from is not None:
+            query += ' AND max_created_at >= ?'
+            params.append(_timestamp(date_from))
+        if date_to is not None:
+            query += ' AND min_created_at < ?'
+            params.append(_timestamp(date_to))
+        connection = self._connect()
+        try:
+            segments = connection.execute(query, params).fetchall()
+            # Сегменты разных запусков одного месяца пересекаются по времени: слияние по ключу
+            streams = [self._segment_rows(connection, segment_id, path, date_from, date_to) for segment_id, path in segments]
+            yield from heapq.merge(*streams, key=lambda row: (row.created_at, row.id))
+        finally:
+            connection.close()
+    
+    # ---------- Архивация ----------
+    def archive_before(self, cutoff, progress=None):
+        """Переносит операции с created_at < cutoff из основной базы в архив.
+        
+        Порядок: сегменты пишутся во временные файлы и переименовываются,
+        индекс фиксируется одной транзакцией (с этого момента архив виден
+        запросам), затем строки удаляются из основной таблицы. Повторный запуск
+        после сбоя дочищает основную таблицу по границе последнего запуска.
+        """
+        from checkpoints import backfill_opening_checkpoints
+        os.makedirs(self.directory, exist_ok=True)
+        connection = self._connect()
+        try:
+            for statement in SCHEMA:
+                connection.execute(statement)
+            connection.commit()
+            
+            previous = connection.execute('SELECT cutoff, max_id FROM runs ORDER BY id DESC LIMIT 1').fetchone()
+            if previous is not None:
+                previous_cutoff, previous_max_id = datetime.fromisoformat(previous[0]), previous[1]
+                # Дочищаем строки прошлого запуска, если он прервался до удаления
+                self._delete_hot(previous_cutoff, previous_max_id)
+                if cutoff <= previous_cutoff:
+                    return {'rows': 0, 'segments': 0, 'cutoff': previous_cutoff.isoformat()}
+            
+            # Балансы на любую дату после архивации считаются от контрольных точек
+            backfill_opening_checkpoints()
+            db.session.commit()
+            
+            max_id = db.session.execute(
+                select(func.max(Transaction.id)).where(Transaction.created_at < cutoff)
+            ).scalar()
+            if max_id is None:
+                return {'rows': 0, 'segments': 0, 'cutoff': cutoff.isoformat()}
+            if previous is not None:
+                max_id = max(max_id, previous_max_id)
+            
+            run_id = (connection.execute('SELECT COALESCE(MAX(id), 0) FROM runs').fetchone()[0]) + 1
+            writers = self._write_segments(run_id, cutoff, max_id, progress)
+            rows = sum(writer.rows for writer in writers)
+            volume = sum(writer.volume for writer in writers)
+            
+            with connection:
+                connection.execute(
+                    'INSERT INTO runs (id, cutoff, max_id, rows, volume, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+                    (run_id, _timestamp(cutoff), max_id, rows, volume, _timestamp(datetime.utcnow()))
+                )
+                for writer in writers:
+                    segment_id = connection.execute(
+                        'INSERT INTO segments (run_id, month, path, rows, volume, min_created_at, max_created_at) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                        (run_id, writer.month, writer.relative_path, writer.rows, writer.volume,
+                         writer.min_created_at, writer.max_created_at)
+                    ).lastrowid
+                    connection.executemany(
+                        'INSERT INTO blocks (segment_id, offset, length, rows, min_created_at, max_created_at) '
+                        'VALUES (?, ?, ?, ?, ?, ?)',
+                        [(segment_id, *block) for block in writer.blocks]
+                    )
+                    connection.executemany(
+                        'INSERT INTO segment_users (user_id, segment_id, rows) VALUES (?, ?, ?)',
+                        [(user_id, segment_id, count) for user_id, count in writer.users.items()]
+                    )
+            
+            deleted = self._delete_hot(cutoff, max_id)
+            return {'rows': rows, 'deleted': deleted, 'segments': len(writers), 'cutoff': cutoff.isoformat()}
+        finally:
+            connection.close()
+
+    def _write_segments(self, run_id, cutoff, max_id, progress=None):
+        writers = []
+        writer = None
+        after = None
+        done = 0
+        while True:
+            query = select(*(getattr(Transaction, name) for name in COLUMNS)).where(
+                Transaction.created_at < cutoff, Transaction.id <= max_id
+            )
+            if after is not None:
+                query = query.where(
+                    (Transaction.created_at > after[0]) | and_(Transaction.created_at == after[0], Transaction.id > after[1])
+                )
+            rows = db.session.execute(query.order_by(Transaction.created_at, Transaction.id).limit(READ_CHUNK)).all()
+            db.session.rollback()  # не держим транзакцию чтения между пачками
+            if not rows:
+                break
+            for row in rows:
+                month = row.created_at.strftime('%Y-%m')
+                if writer is None or writer.month != month:
+                    if writer is not None:
+                        writer.close()
+                    writer = SegmentWriter(self.directory, month, run_id)
+                    writers.append(writer)
+                writer.add(row)
+            done += len(rows)
+            if progress:
+                progress(done)
+            after = (rows[-1].created_at, rows[-1].id)
+        if writer is not None:
+            writer.close()
+        return writers
+
+    def _delete_hot(self, cutoff, max_id):
+        deleted = 0
+        while True:
+            ids = db.session.execute(
+                select(Transaction.id).where(archived_condition((cutoff, max_id))).limit(READ_CHUNK)
+            ).scalars().all()
+            if not ids:
+                return deleted
+            db.session.execute(delete(Transaction).where(Transaction.id.in_(ids)))
+            db.session.commit()
+            deleted += len(ids)
+
+def archived_condition(boundary):
+    """Условие для строк основной таблицы, которые уже есть в архиве"""
+    cutoff, max_id = boundary
+    return and_(Transaction.created_at < cutoff, Transaction.id <= max_id)
+
+def not_archived(boundary):
+    return not_(archived_condition(boundary))
+
+def history_rows(rows, user_id, session=None):
+    """Операции архива -> строки истории с типом и именем контрагента"""
+    other_ids = {row.receiver_id if row.sender_id == user_id else row.sender_id for row in rows}
+    names = {}
+    if other_ids:
+        names = dict((session or db.session).execute(
+            select(User.id, User.full_name).where(User.id.in_(other_ids))
+        ).all())
+    result = []
+    for row in rows:
+        outgoing = row.sender_id == user_id
+        other_id = row.receiver_id if outgoing else row.sender_id
+        result.append(HistoryRow(*row, 'outgoing' if outgoing else 'incoming', names.get(other_id)))
+    return result
+
+archive = Archive()
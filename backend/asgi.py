@@ -0,0 +1,505 @@
+"""Асинхронный (ASGI) режим того же API.
+
+Запуск (нужен ASGI-сервер, например uvicorn):
+    cd backend && uvicorn asgi:application --workers 4
+
+Частые и медленные вызовы JSON-RPC (login, logout, verifyToken, getAccountInfo,
+getTransactionHistory, getStatistics) обрабатываются здесь асинхронно: запросы к
+базе идут через асинхронный движок SQLAlchemy (sqlite+aiosqlite, если установлены
+aiosqlite и greenlet, иначе - в отдельном пуле потоков), bcrypt - в пуле потоков.
+Поток событий /api/events тоже обслуживается здесь: открытое соединение не
+занимает поток. Остальные вызовы, пакеты и все прочие адреса выполняет то же
+Flask-приложение в пуле потоков, поэтому поверхность API и cookie сессии у
+режимов общие.
+wsgi.py продолжает работать без изменений.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import functools
+import io
+import os
+import sys
+from sqlalchemy.orm import Session
+from werkzeug.http import parse_cookie
+from werkzeug.wrappers import Response as WerkzeugResponse
+from app import app as flask_app, DOMAINS, READ_ONLY_METHODS, init_database, parse_fields, rpc_error, TRANSACTION_FIELDS
+from auth import RPCError, load_principal, principal_cache
+from events import bus, format_event, balance_data
+from history import transaction_history, parse_date, parse_limit
+from metrics import metrics
+from models import db, User
+from stats import get_statistics, get_versions
+from storage import install_pragmas, read_pragmas, current_route, use_route, READ, WRITE, READ_BIND
+from validators import Validator
+
+try:
+    import aiosqlite  # noqa: F401 - драйвер для sqlite+aiosqlite
+    import greenlet  # noqa: F401 - нужен SQLAlchemy для асинхронных движков
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+except ImportError:  # без них запросы к базе выполняются в пуле потоков
+    create_async_engine = None
+
+# ==================== БАЗА ДАННЫХ ====================
+class AsyncDatabase:
+    """Выполняет синхронную функцию fn(session, *args) с запросами, не блокируя цикл событий.
+    
+    С асинхронным движком функция работает через AsyncSession.run_sync: ввод-вывод
+    идет через aiosqlite, а цикл событий свободен, пока база отвечает. Без него -
+    в отдельном пуле потоков со своими соединениями из синхронного движка.
+    Вызовы с маршрутом READ (методы из READ_ONLY_METHODS) идут на движок только
+    для чтения, если он настроен, как и в app.py.
+    """
+    def __init__(self, app, workers):
+        self.app = app
+        with app.app_context():
+            self.engine = db.engine
+            self.read_engine = db.engines.get(READ_BIND)
+        self.async_engine = self.async_read_engine = None
+        if create_async_engine is not None and self.engine.dialect.name == 'sqlite':
+            self.async_engine = create_async_engine(self.engine.url.set(drivername='sqlite+aiosqlite'))
+            install_pragmas(self.async_engine.sync_engine)
+            if self.read_engine is not None and self.read_engine.dialect.name == 'sqlite':
+                # Та же пометка db_route, что у синхронного движка чтения: метрики делят запросы по ней
+                self.async_read_engine = create_async_engine(
+                    self.read_engine.url.set(drivername='sqlite+aiosqlite'),
+                    execution_options={'db_route': READ}
+                )
+                install_pragmas(self.async_read_engine.sync_engine, read_pragmas())
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='asgi-db')
+
+    @property
+    def mode(self):
+        return 'aiosqlite' if self.async_engine is not None else 'threads'
+
+    def _call(self, session, fn, *args):
+        # Контекст приложения нужен общим функциям, которые в редких случаях обращаются к db.session
+        with self.app.app_context():
+            return fn(session, *args)
+
+    def _engines(self):
+        # Маршрут задает dispatch_native (use_route), по умолчанию - основной движок
+        if current_route() == READ and self.read_engine is not None:
+            return self.read_engine, self.async_read_engine
+        return self.engine, self.async_engine
+
+    def _call_sync(self, engine, fn, *args):
+        with Session(engine) as session:
+            return self._call(session, fn, *args)
+    
+    async def run(self, fn, *args):
+        engine, async_engine = self._engines()
+        if async_engine is not None:
+            async with AsyncSession(async_engine) as session:
+                return await session.run_sync(self._call, fn, *args)
+        return await run_in_pool(self.executor, self._call_sync, engine, fn, *args)
+    
+    async def close(self):
+        for engine in (self.async_engine, self.async_read_engine):
+            if engine is not None:
+                await engine.dispose()
+        self.executor.shutdown(wait=False)
+
+async def run_in_pool(executor, fn, *args):
+    # Копия контекста: метрики текущего вызова учитывают SQL и bcrypt из пула
+    context = contextvars.copy_context()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(context.run, fn, *args))
+
+# ==================== СЕССИЯ FLASK ====================
+class Call:
+    """Один асинхронный вызов: сессия из cookie, заголовки и версия для ETag"""
+    def __init__(self, headers, session):
+        self.headers = headers
+        self.session = session
+        self.etag = None
+        self.principal = None
+
+def open_session(headers):
+    interface = flask_app.session_interface
+    serializer = interface.get_signing_serializer(flask_app)
+    value = parse_cookie(headers.get('cookie', '')).get(interface.get_cookie_name(flask_app))
+    if not value:
+        return interface.session_class()
+    try:
+        data = serializer.loads(value, max_age=int(flask_app.permanent_session_lifetime.total_seconds()))
+    except Exception:
+        return interface.session_class()
+    return interface.session_class(data)
+
+def requested_version(call, params):
+    # Как requested_version в app.py: ifVersion или If-None-Match одиночного вызова
+    value = params.get('ifVersion')
+    if value is None:
+        value = call.headers.get('if-none-match')
+    if value is None:
+        return None
+    return str(value).strip().removeprefix('W/').strip('"')
+
+def not_modified(call, version, params):
+    if version is None:
+        return None
+    call.etag = f'"{version}"'
+    if requested_version(call, params) == str(version):
+        return {'notModified': True, 'version': version}
+    return None
+
+# ==================== АВТОРИЗАЦИЯ ====================
+async def require_principal(call, role=None):
+    user_id = call.session.get('user_id')
+    if not user_id:
+        raise RPCError(-32000, 'Требуется авторизация', 401)
+    # Попадание в кэш авторизации обходится без перехода в пул
+    principal = principal_cache.get(user_id)
+    if principal is None:
+        principal = await database.run(lambda session: load_principal(user_id, session))
+    if not principal or not principal.is_active:
+        raise RPCError(-32000, 'Пользователь не найден или заблокирован', 401)
+    if role == 'manager' and principal.role != 'manager':
+        raise RPCError(-32007, 'Доступ только для менеджеров', 403)
+    if role == 'client' and principal.role != 'client':
+        raise RPCError(-32002, 'Только клиенты могут выполнять эту операцию', 403)
+    call.principal = principal
+    return principal
+
+# ==================== ОБРАБОТЧИКИ ====================
+def _find_login(session, login):
+    user = session.execute(db.select(User).where(User.login == login)).scalar_one_or_none()
+    if user is None:
+        return None
+    return user.id, user.password_hash, user.is_active, user.to_dict()
+
+async def rpc_login(call, params):
+    login = params.get('login')
+    password = params.get('password')
+    
+    is_valid, message = Validator.validate_login(login)
+    if not is_valid:
+        raise Exception(message)
+    
+    is_valid, message = Validator.validate_password(password)
+    if not is_valid:
+        raise Exception(message)
+    
+    found = await database.run(_find_login, login)
+    if found is None:
+        raise Exception('Неверный логин или пароль')
+    user_id, password_hash, is_active, user = found
+    # bcrypt занимает сотни миллисекунд: считаем его в пуле, цикл событий свободен
+    if not await run_in_pool(cpu_executor, User.verify_password, password, password_hash) or not is_active:
+        raise Exception('Неверный логин или пароль')
+    
+    call.session['user_id'] = user_id
+    return {'user': user, 'events': flask_app.config['EVENTS_ENABLED']}
+
+async def rpc_logout(call, params):
+    call.session.clear()
+    return {'success': True}
+
+async def rpc_verify_token(call, params):
+    user_id = call.session.get('user_id')
+    if not user_id:
+        raise Exception('Не авторизован')
+    principal = await database.run(lambda session: load_principal(user_id, session))
+    if not principal or not principal.is_active:
+        raise Exception('Пользователь не найден')
+    return {'valid': True, 'events': flask_app.config['EVENTS_ENABLED']}
+
+async def rpc_get_account_info(call, params):
+    principal = await require_principal(call)
+    # Сначала только версия: при совпадении пользователь не загружается
+    version = await database.run(
+        lambda session: session.execute(db.select(User.version).where(User.id == principal.id)).scalar()
+    )
+    unchanged = not_modified(call, version, params)
+    if unchanged:
+        return unchanged
+    return await database.run(lambda session: session.get(User, principal.id).to_dict())
+
+async def rpc_get_transaction_history(call, params):
+    principal = await require_principal(call, role='client')
+    date_from = parse_date(params.get('dateFrom'))
+    date_to = parse_date(params.get('dateTo'), end_of_day=True)
+    fields = parse_fields(params.get('fields'), TRANSACTION_FIELDS)
+    
+    # Без параметров пагинации - прежний формат ответа: полный список операций
+    if not any(key in params for key in ('limit', 'cursor', 'dateFrom', 'dateTo')):
+        transactions, _ = await database.run(
+            lambda session: transaction_history(principal.id, fields=fields, session=session)
+        )
+        return transactions
+    
+    limit = parse_limit(params.get('limit'))
+    transactions, next_cursor = await database.run(lambda session: transaction_history(
+        principal.id,
+        limit=limit,
+        cursor=params.get('cursor'),
+        date_from=date_from,
+        date_to=date_to,
+        fields=fields,
+        session=session
+    ))
+    return {
+        'transactions': transactions,
+        'next_cursor': next_cursor
+    }
+
+def _statistics(session):
+    version, _ = get_versions(session)
+    return version, get_statistics(session)
+
+async def rpc_get_statistics(call, params):
+    await require_principal(call, role='manager')
+    version, statistics = await database.run(_statistics)
+    unchanged = not_modified(call, version, params)
+    if unchanged:
+        return unchanged
+    return statistics
+
+NATIVE_HANDLERS = {
+    'login': rpc_login,
+    'logout': rpc_logout,
+    'verifyToken': rpc_verify_token,
+    'getAccountInfo': rpc_get_account_info,
+    'getTransactionHistory': rpc_get_transaction_history,
+    'getStatistics': rpc_get_statistics
+}
+
+async def dispatch_native(call, payload):
+    """Как dispatch_call в app.py, но для асинхронных обработчиков"""
+    method = payload['method']
+    params = payload.get('params') or {}
+    request_id = payload.get('id')
+    route = READ if method in READ_ONLY_METHODS else WRITE
+    trace = metrics.start_call(method, route)
+    error = None
+    try:
+        with use_route(route):
+            result = await NATIVE_HANDLERS[method](call, params)
+        response, status = {'jsonrpc': '2.0', 'result': result, 'id': request_id}, 200
+    except RPCError as e:
+        error = e.code
+        response, status = {'jsonrpc': '2.0', 'error': {'code': e.code, 'message': e.message}, 'id': request_id}, e.status
+    except Exception as e:
+        error = -32000
+        response, status = {'jsonrpc': '2.0', 'error': {'code': -32000, 'message': str(e)}, 'id': request_id}, 400
+    metrics.finish_call(trace, error_code=error, slow_threshold=flask_app.config['SLOW_REQUEST_MS'] / 1000)
+    return response, status
+
+# ==================== ПРИЛОЖЕНИЕ ASGI ====================
+def _headers(scope):
+    headers = {}
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').lower()
+        value = value.decode('latin-1')
+        headers[name] = f'{headers[name]}, {value}' if name in headers else value
+    return headers
+
+async def _wait_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+def _native_payload(scope, headers, body):
+    """Одиночный вызов JSON-RPC, который обрабатывается асинхронно, или None"""
+    if scope['method'] != 'POST' or scope['path'] != '/api':
+        return None
+    if not headers.get('content-type', '').startswith('application/json'):
+        return None
+    try:
+        payload = flask_app.json.loads(body)
+    except ValueError:
+        return None
+    if isinstance(payload, dict) and payload.get('method') in NATIVE_HANDLERS:
+        return payload
+    return None
+
+def _environ(scope, headers, body):
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('127.0.0.1', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False
+    }
+    for name, value in headers.items():
+        if name == 'content-type':
+            environ['CONTENT_TYPE'] = value
+        elif name != 'content-length':
+            environ[f"HTTP_{name.upper().replace('-', '_')}"] = value
+    return environ
+
+class BankASGI:
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        
+        headers = _headers(scope)
+        body = await _read_body(receive)
+        if scope['method'] == 'GET' and scope['path'] == '/api/events' and self.app.config['EVENTS_ENABLED']:
+            await self._events(headers, receive, send)
+            return
+        payload = _native_payload(scope, headers, body)
+        if payload is None:
+            await self._run_wsgi(scope, headers, body, send)
+            return
+        
+        call = Call(headers, open_session(headers))
+        result, status = await dispatch_native(call, payload)
+        response = WerkzeugResponse(self.app.json.dumps(result), status=status, mimetype='application/json')
+        if status == 200 and call.etag:
+            response.headers['ETag'] = call.etag
+        self.app.session_interface.save_session(self.app, call.session, response)
+        await self._respond(response, headers, send)
+    
+    async def _respond(self, response, headers, send, more_body=False):
+        origin = headers.get('origin')
+        if origin in DOMAINS:
+            response.headers['Access-Control-Allow-Origin'] = origin
+            response.headers['Access-Control-Allow-Credentials'] = 'true'
+            response.vary.add('Origin')
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in response.headers.items()]
+        })
+        await send({'type': 'http.response.body', 'body': response.get_data(), 'more_body': more_body})
+    
+    async def _events(self, headers, receive, send):
+        """/api/events без потока из пула: ожидание событий не занимает поток"""
+        call = Call(headers, open_session(headers))
+        try:
+            principal = await require_principal(call, role='client')
+        except RPCError as e:
+            response = WerkzeugResponse(self.app.json.dumps(rpc_error(e.code, e.message)), status=e.status, mimetype='application/json')
+            await self._respond(response, headers, send)
+            return
+        
+        loop = asyncio.get_running_loop()
+        woken = asyncio.Event()
+        subscription = bus.subscribe(principal.id, wakeup=lambda: loop.call_soon_threadsafe(woken.set))
+        disconnected = asyncio.ensure_future(_wait_disconnect(receive))
+        heartbeat = self.app.config['EVENTS_HEARTBEAT']
+        try:
+            balance, version = await database.run(lambda session: session.execute(
+                db.select(User.balance, User.version).where(User.id == principal.id)
+            ).one())
+            response = WerkzeugResponse(mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+            response.set_data(
+                f"retry: {self.app.config['EVENTS_RETRY_MS']}\n\n".encode('utf-8')
+                + format_event({'id': 0, 'type': 'balance', 'data': balance_data(balance, version)})
+            )
+            await self._respond(response, headers, send, more_body=True)
+            
+            while not subscription.overflowed:
+                waiter = asyncio.ensure_future(woken.wait())
+                await asyncio.wait({waiter, disconnected}, timeout=heartbeat, return_when=asyncio.FIRST_COMPLETED)
+                waiter.cancel()
+                if disconnected.done():
+                    return
+                woke = woken.is_set()
+                woken.clear()
+                events = subscription.drain()
+                if events:
+                    body = b''.join(format_event(event) for event in events)
+                elif woke:
+                    continue
+                else:
+                    current = await database.run(lambda session: load_principal(principal.id, session))
+                    if not current or not current.is_active:
+                        break
+                    body = b': ping\n\n'
+                await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            disconnected.cancel()
+            bus.unsubscribe(subscription)
+    
+    async def _run_wsgi(self, scope, headers, body, send):
+        # Flask-приложение в пуле потоков; ответ (в том числе потоковый) передается по частям
+        loop = asyncio.get_running_loop()
+        environ = _environ(scope, headers, body)
+
+        def send_from_thread(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        def run():
+            started = {}
+
+            def start_response(status, response_headers, exc_info=None):
+                started['status'] = int(status.split(' ', 1)[0])
+                started['headers'] = [
+                    (name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in response_headers
+                ]
+
+            def send_start():
+                send_from_thread({'type': 'http.response.start', 'status': started['status'], 'headers': started['headers']})
+            
+            result = self.app(environ, start_response)
+            try:
+                sent_start = False
+                for chunk in result:
+                    if not chunk:
+                        continue
+                    if not sent_start:
+                        send_start()
+                        sent_start = True
+                    send_from_thread({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                if not sent_start:
+                    send_start()
+                send_from_thread({'type': 'http.response.body', 'body': b''})
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+        
+        await loop.run_in_executor(wsgi_executor, run)
+    
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await run_in_pool(wsgi_executor, init_database)
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await database.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+# Здесь ожидание событий не занимает поток, поэтому поток включен, если его не выключили явно
+flask_app.config['EVENTS_ENABLED'] = os.environ.get('EVENTS_ENABLED', '1') == '1'
+
+# Пулы процесса: запросы к базе без асинхронного драйвера, bcrypt и Flask-обработчики
+database = AsyncDatabase(flask_app, workers=int(os.environ.get('ASGI_DB_THREADS', 4)))
+cpu_executor = ThreadPoolExecutor(max_workers=int(os.environ.get('ASGI_CPU_THREADS', os.cpu_count() or 1)), thread_name_prefix='asgi-cpu')
+wsgi_executor = ThreadPoolExecutor(max_workers=int(os.environ.get('ASGI_WSGI_THREADS', 8)), thread_name_prefix='asgi-wsgi')
+
+application = BankASGI(flask_app)
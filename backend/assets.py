@@ -0,0 +1,173 @@
+from collections import namedtuple
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+from flask import Response
+
+try:
+    import brotli
+except ImportError:  # brotli не обязателен: без него отдаем gzip
+    brotli = None
+
+# Файлы с суффиксом _backup (index_backup.html, app_backup.js) не публикуются
+EXCLUDED = re.compile(r'_backup\.[^/]+$')
+INDEX = 'index.html'
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+# Меньше этого размера сжатие не окупает заголовки
+MIN_COMPRESS_SIZE = 512
+ENCODINGS = ('br', 'gzip')
+
+Asset = namedtuple('Asset', ['path', 'hashed_path', 'mimetype', 'digest', 'variants'])
+
+def _compress(data):
+    variants = {'identity': data}
+    if len(data) < MIN_COMPRESS_SIZE:
+        return variants
+    gzipped = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(gzipped) < len(data):
+        variants['gzip'] = gzipped
+    if brotli is not None:
+        compressed = brotli.compress(data, quality=11)
+        if len(compressed) < len(data):
+            variants['br'] = compressed
+    return variants
+
+def _hashed_name(path, digest):
+    stem, extension = os.path.splitext(path)
+    return f'{stem}.{digest}{extension}'
+
+class AssetStore:
+    """Статика фронтенда, подготовленная один раз и хранящаяся в памяти.
+    
+    Каждый файл получает имя с хешем содержимого (css/style.1a2b3c4d5e6f.css) и
+    заранее сжатые варианты gzip (и brotli, если пакет установлен). Ссылки в
+    index.html переписываются на имена с хешем, поэтому такие файлы можно
+    кэшировать навсегда. Сам index.html и старые имена без хеша отдаются с
+    проверкой по ETag.
+    """
+    def __init__(self, root, auto_reload=False):
+        self.root = root
+        self.auto_reload = auto_reload
+        self._lock = threading.Lock()
+        self._signature = None
+        self.assets = {}
+        self.index = None
+
+    def _scan(self):
+        files = []
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                full_path = os.path.join(directory, name)
+                path = os.path.relpath(full_path, self.root).replace(os.sep, '/')
+                if EXCLUDED.search(path):
+                    continue
+                files.append((path, full_path, os.stat(full_path).st_mtime_ns))
+        return sorted(files)
+
+    def build(self, files=None):
+        files = files if files is not None else self._scan()
+        assets = {}
+        index_source = None
+        for path, full_path, _ in files:
+            with open(full_path, 'rb') as source:
+                data = source.read()
+            if path == INDEX:
+                index_source = data
+                continue
+            digest = hashlib.sha256(data).hexdigest()[:12]
+            mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+            asset = Asset(path, _hashed_name(path, digest), mimetype, digest, _compress(data))
+            assets[asset.path] = asset
+            assets[asset.hashed_path] = asset
+        
+        index = None
+        if index_source is not None:
+            html = self._rewrite_links(index_source.decode('utf-8'), assets).encode('utf-8')
+            digest = hashlib.sha256(html).hexdigest()[:12]
+            index = Asset(INDEX, INDEX, 'text/html', digest, _compress(html))
+        
+        self.assets = assets
+        self.index = index
+        self._signature = [(path, mtime) for path, _, mtime in files]
+
+    @staticmethod
+    def _rewrite_links(html, assets):
+        def replace(match):
+            asset = assets.get(match.group('path'))
+            if asset is None:
+                return match.group(0)
+            quote = match.group('quote')
+            return f"{match.group('attribute')}={quote}/{asset.hashed_path}{quote}"
+        return re.sub(
+            r"(?P<attribute>href|src)=(?P<quote>['\"])/(?:static/)?(?P<path>[^'\"?#]+)(?P=quote)",
+            replace,
+            html
+        )
+
+    def refresh(self):
+        """Собирает статику при первом обращении, а с auto_reload - и при изменении файлов"""
+        if self._signature is not None and not self.auto_reload:
+            return
+        with self._lock:
+            if self._signature is None:
+                self.build()
+            elif self.auto_reload:
+                files = self._scan()
+                if [(path, mtime) for path, _, mtime in files] != self._signature:
+                    self.build(files)
+
+    def write(self, output_dir):
+        """Записывает файлы с хешем и их сжатые копии (.gz, .br) для раздачи веб-сервером"""
+        self.refresh()
+        suffixes = {'identity': '', 'gzip': '.gz', 'br': '.br'}
+        written = 0
+        for asset in {asset.hashed_path: asset for asset in [*self.assets.values(), self.index] if asset}.values():
+            for encoding, data in asset.variants.items():
+                target = os.path.join(output_dir, asset.hashed_path + suffixes[encoding])
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with open(target, 'wb') as output:
+                    output.write(data)
+                written += 1
+        return written
+
+    def get(self, path):
+        self.refresh()
+        return self.index if path == INDEX else self.assets.get(path)
+
+def _accepted_encoding(request, asset):
+    accepted = {
+        part.split(';')[0].strip().lower()
+        for part in request.headers.get('Accept-Encoding', '').split(',')
+        if not part.strip().endswith(';q=0')
+    }
+    for encoding in ENCODINGS:
+        if encoding in asset.variants and encoding in accepted:
+            return encoding
+    return 'identity'
+
+def asset_response(request, asset):
+    """Ответ с подходящим по Accept-Encoding вариантом; 304, если у клиента та же версия"""
+    encoding = _accepted_encoding(request, asset)
+    etag = f'"{asset.digest}-{encoding}"'
+    immutable = request.path.lstrip('/').removeprefix('static/') == asset.hashed_path and asset.path != INDEX
+    headers = {
+        'ETag': etag,
+        'Vary': 'Accept-Encoding',
+        'Cache-Control': IMMUTABLE if immutable else REVALIDATE
+    }
+    if etag in request.headers.get('If-None-Match', ''):
+        return Response(status=304, headers=headers)
+    
+    if encoding != 'identity':
+        headers['Content-Encoding'] = encoding
+    mimetype = asset.mimetype
+    if mimetype.startswith('text/') or mimetype in ('application/javascript', 'application/json'):
+        mimetype += '; charset=utf-8'
+    return Response(asset.variants[encoding], headers=headers, content_type=mimetype)
+
+def brotli_available():
+    return brotli is not None
@@ -1,83 +1,89 @@
 from functools import wraps
-from flask import request, jsonify, session
-from models import User
+from collections import namedtuple
+import os
+from flask import request, session, g, Request
+from models import db, User
+from cache import TTLCache
 
+class RPCError(Exception):
+    """Ошибка JSON-RPC с собственным кодом и HTTP-статусом"""
+    def __init__(self, code, message, status=400):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.status = status
+
+# ==================== КЭШ АВТОРИЗАЦИИ ====================
+# Для проверки доступа нужны только id, роль и активность - их и кэшируем
+Principal = namedtuple('Principal', ['id', 'role', 'is_active'])
+
+principal_cache = TTLCache(
+    maxsize=int(os.environ.get('AUTH_CACHE_SIZE', 10000)),
+    ttl=float(os.environ.get('AUTH_CACHE_TTL', 30))
+)
+
+def load_principal(user_id, session=None):
+    principal = principal_cache.get(user_id)
+    if principal is None:
+        row = (session or db.session).query(User.id, User.role, User.is_active).filter(User.id == user_id).first()
+        if row is None:
+            return None
+        principal = Principal(row.id, row.role, bool(row.is_active))
+        principal_cache.set(user_id, principal)
+    return principal
+
+def invalidate_principal(user_id):
+    """Вызывается после commit любого изменения роли или активности пользователя"""
+    principal_cache.invalidate(user_id)
+    if g.get('auth_user_id') == user_id:
+        g.pop('auth_user_id', None)
+        g.pop('principal', None)
+
+class BankRequest(Request):
+    """Запрос с ленивой загрузкой полного пользователя: модель читается из БД,
+    только если обработчику нужно что-то кроме данных из кэша авторизации"""
+    principal = None
+    _user = None
+    
+    @property
+    def user(self):
+        if self.principal is None:
+            return None
+        if self._user is None or self._user.id != self.principal.id:
+            self._user = db.session.get(User, self.principal.id)
+        return self._user
+
+# ==================== ДЕКОРАТОРЫ ====================
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        print("=== login_required проверка ===")
         user_id = session.get('user_id')
-        print(f"User ID из сессии: {user_id}")
-        print(f"Сессия: {dict(session)}")
-        
         if not user_id:
-            print("ОШИБКА: Нет user_id в сессии")
-            return jsonify({
-                'jsonrpc': '2.0',
-                'error': {'code': -32000, 'message': 'Требуется авторизация'},
-                'id': request.json.get('id') if request.json else None
-            }), 401
+            raise RPCError(-32000, 'Требуется авторизация', 401)
         
-        user = User.query.get(user_id)
-        if not user:
-            print(f"ОШИБКА: Пользователь с ID {user_id} не найден")
-            return jsonify({
-                'jsonrpc': '2.0',
-                'error': {'code': -32000, 'message': 'Пользователь не найден или заблокирован'},
-                'id': request.json.get('id') if request.json else None
-            }), 401
+        # В пакетном запросе пользователь проверяется один раз на весь пакет
+        if g.get('auth_user_id') == user_id:
+            principal = g.principal
+        else:
+            principal = load_principal(user_id)
+            g.auth_user_id = user_id
+            g.principal = principal
         
-        if not user.is_active:
-            print(f"ОШИБКА: Пользователь {user_id} не активен")
-            return jsonify({
-                'jsonrpc': '2.0',
-                'error': {'code': -32000, 'message': 'Пользователь не найден или заблокирован'},
-                'id': request.json.get('id') if request.json else None
-            }), 401
+        if not principal or not principal.is_active:
+            raise RPCError(-32000, 'Пользователь не найден или заблокирован', 401)
         
-        print(f"Успех: пользователь {user.login} авторизован")
-        request.user = user
-        return f(*args, **kwargs)
-    return decorated_function
-def login_required(f):
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        user_id = session.get('user_id')
-        if not user_id:
-            return jsonify({
-                'jsonrpc': '2.0',
-                'error': {'code': -32000, 'message': 'Требуется авторизация'},
-                'id': request.json.get('id') if request.json else None
-            }), 401
-        
-        user = User.query.get(user_id)
-        if not user or not user.is_active:
-            return jsonify({
-                'jsonrpc': '2.0',
-                'error': {'code': -32000, 'message': 'Пользователь не найден или заблокирован'},
-                'id': request.json.get('id') if request.json else None
-            }), 401
-        
-        request.user = user
+        request.principal = principal
         return f(*args, **kwargs)
     return decorated_function
 
 def manager_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if not hasattr(request, 'user'):
-            return jsonify({
-                'jsonrpc': '2.0',
-                'error': {'code': -32000, 'message': 'Требуется авторизация'},
-                'id': request.json.get('id') if request.json else None
-            }), 401
+        if request.principal is None:
+            raise RPCError(-32000, 'Требуется авторизация', 401)
         
-        if request.user.role != 'manager':
-            return jsonify({
-                'jsonrpc': '2.0',
-                'error': {'code': -32007, 'message': 'Доступ только для менеджеров'},
-                'id': request.json.get('id') if request.json else None
-            }), 403
+        if request.principal.role != 'manager':
+            raise RPCError(-32007, 'Доступ только для менеджеров', 403)
         
         return f(*args, **kwargs)
     return decorated_function
@@ -85,19 +91,11 @@ def manager_required(f):
 def client_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if not hasattr(request, 'user'):
-            return jsonify({
-                'jsonrpc': '2.0',
-                'error': {'code': -32000, 'message': 'Требуется авторизация'},
-                'id': request.json.get('id') if request.json else None
-            }), 401
+        if request.principal is None:
+            raise RPCError(-32000, 'Требуется авторизация', 401)
         
-        if request.user.role != 'client':
-            return jsonify({
-                'jsonrpc': '2.0',
-                'error': {'code': -32002, 'message': 'Только клиенты могут выполнять эту операцию'},
-                'id': request.json.get('id') if request.json else None
-            }), 403
+        if request.principal.role != 'client':
+            raise RPCError(-32002, 'Только клиенты могут выполнять эту операцию', 403)
         
         return f(*args, **kwargs)
-    return decorated_function
\ No newline at end of file
+    return decorated_function
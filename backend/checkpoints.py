@@ -0,0 +1,199 @@
+from collections import namedtuple
+from datetime import datetime, timedelta
+from sqlalchemy import select, insert, union_all, literal, func
+from models import db, User, Transaction, BalanceCheckpoint
+from money import from_kopecks
+from archive import archive, not_archived
+
+# Операция с id больше last_tx_id контрольной точки могла получить created_at чуть
+# раньше as_of (создана до записи точки, зафиксирована после). Хвост ищем с запасом
+CLOCK_SLACK = timedelta(minutes=5)
+CHUNK_SIZE = 500
+MAX_POINTS = 1000
+INTERVALS = ('day', 'week')
+
+# ==================== ЗАПИСЬ ====================
+def _last_tx_id():
+    return func.coalesce(select(func.max(Transaction.id)).scalar_subquery(), 0)
+
+def write_checkpoints(user_ids, as_of=None):
+    """Записывает текущие балансы пользователей в текущей транзакции (без commit).
+    
+    Вызывается при каждом изменении баланса мимо журнала операций (создание,
+    импорт, правка менеджером) и периодическим заданием. Баланс и последний id
+    операции читаются одним INSERT ... SELECT, поэтому согласованы между собой.
+    """
+    as_of = as_of or datetime.utcnow()
+    user_ids = list(user_ids)
+    for start in range(0, len(user_ids), CHUNK_SIZE):
+        chunk = user_ids[start:start + CHUNK_SIZE]
+        db.session.execute(
+            insert(BalanceCheckpoint).from_select(
+                ['user_id', 'as_of', 'balance', 'last_tx_id'],
+                select(User.id, literal(as_of, db.DateTime), User.balance, _last_tx_id())
+                .where(User.id.in_(chunk))
+            )
+        )
+
+def backfill_opening_checkpoints(connection=None):
+    """Начальные точки для пользователей, у которых их еще нет (база до появления
+    контрольных точек): баланс на момент создания = текущий минус итог журнала.
+    Возвращает число записанных точек"""
+    incoming = select(func.coalesce(func.sum(Transaction.amount), 0)).where(
+        Transaction.receiver_id == User.id
+    ).scalar_subquery()
+    outgoing = select(func.coalesce(func.sum(Transaction.amount), 0)).where(
+        Transaction.sender_id == User.id
+    ).scalar_subquery()
+    has_checkpoint = select(BalanceCheckpoint.id).where(BalanceCheckpoint.user_id == User.id).exists()
+    
+    result = (connection or db.session).execute(
+        insert(BalanceCheckpoint).from_select(
+            ['user_id', 'as_of', 'balance', 'last_tx_id'],
+            select(
+                User.id,
+                func.coalesce(User.created_at, literal(datetime(1970, 1, 1), db.DateTime)),
+                User.balance - incoming + outgoing,
+                literal(0)
+            ).where(~has_checkpoint)
+        )
+    )
+    return result.rowcount
+
+def checkpoint_active_accounts(min_transactions=1):
+    """Периодическое задание: новая точка для счетов, у которых с последней точки
+    накопилось не меньше min_transactions операций. Возвращает (начальных точек, новых точек)"""
+    opened = backfill_opening_checkpoints()
+    
+    latest = select(
+        BalanceCheckpoint.user_id,
+        func.max(BalanceCheckpoint.as_of).label('as_of')
+    ).group_by(BalanceCheckpoint.user_id).subquery()
+    
+    def recent(column):
+        # Счетчик нужен только как порог, поэтому хватает диапазона по индексу (участник, дата)
+        return select(func.count(Transaction.id)).where(
+            column == latest.c.user_id, Transaction.created_at > latest.c.as_of
+        ).scalar_subquery()
+    
+    activity = recent(Transaction.sender_id) + recent(Transaction.receiver_id)
+    user_ids = db.session.execute(
+        select(latest.c.user_id).where(activity >= min_transactions)
+    ).scalars().all()
+    
+    write_checkpoints(user_ids)
+    db.session.commit()
+    return opened, len(user_ids)
+
+# ==================== ЧТЕНИЕ ====================
+Movement = namedtuple('Movement', ('id', 'created_at', 'delta'))
+
+def _movements(user_id, start=None, end=None, after_id=None):
+    # Операции счета со знаком: списания отрицательные, зачисления положительные
+    def side(column, sign):
+        query = select(
+            Transaction.id,
+            Transaction.created_at,
+            (Transaction.amount * sign).label('delta')
+        ).where(column == user_id)
+        if start is not None:
+            query = query.where(Transaction.created_at >= start)
+        if end is not None:
+            query = query.where(Transaction.created_at < end)
+        if after_id is not None:
+            query = query.where(Transaction.id > after_id)
+        if boundary is not None:
+            query = query.where(not_archived(boundary))
+        return query
+    
+    boundary = archive.reaches(start)
+    combined = union_all(side(Transaction.sender_id, -1), side(Transaction.receiver_id, 1)).subquery()
+    rows = db.session.execute(
+        select(combined).order_by(combined.c.created_at, combined.c.id)
+    ).all()
+    if boundary is None:
+        return rows
+    
+    # Старые операции перенесены в архив: дочитываем их оттуда и сливаем по времени
+    archived = [
+        Movement(row.id, row.created_at, -row.amount if row.sender_id == user_id else row.amount)
+        for row in archive.user_rows(user_id, start, end, after_id=after_id, newest_first=False)
+    ]
+    return sorted(rows + archived, key=lambda row: (row.created_at, row.id))
+
+def _replay(user_id, at):
+    """Баланс перед моментом at: ближайшая более ранняя точка + хвост операций после нее.
+    Возвращает (баланс, last_tx_id точки, [(id, delta)] примененных операций)"""
+    base = db.session.execute(
+        select(BalanceCheckpoint.balance, BalanceCheckpoint.last_tx_id, BalanceCheckpoint.as_of)
+        .where(BalanceCheckpoint.user_id == user_id, BalanceCheckpoint.as_of < at)
+        .order_by(BalanceCheckpoint.as_of.desc(), BalanceCheckpoint.id.desc())
+        .limit(1)
+    ).first()
+    if base is None:
+        balance, floor, start = 0, 0, None
+    else:
+        balance, floor, start = base.balance, base.last_tx_id, base.as_of - CLOCK_SLACK
+    
+    applied = [(row.id, row.delta) for row in _movements(user_id, start, at, floor)]
+    return balance + sum(delta for _, delta in applied), floor, applied
+
+def balance_at(user_id, at):
+    """Баланс счета в копейках с учетом всех операций раньше at"""
+    return _replay(user_id, at)[0]
+
+def _bucket_start(moment, interval):
+    day = datetime(moment.year, moment.month, moment.day)
+    if interval == 'week':
+        day -= timedelta(days=day.weekday())
+    return day
+
+def balance_series(user_id, date_from, date_to, interval='day'):
+    """Баланс на конец каждого дня или недели в [date_from, date_to).
+    
+    Начальное значение берется из контрольной точки с хвостом, дальше за один
+    проход по операциям периода. Точки внутри периода (правки мимо журнала)
+    заменяют накопленный баланс. Возвращает [(начало периода, баланс)].
+    """
+    if interval not in INTERVALS:
+        raise Exception('interval должен быть day или week')
+    if date_to <= date_from:
+        raise Exception('dateTo должна быть позже dateFrom')
+    step = timedelta(weeks=1) if interval == 'week' else timedelta(days=1)
+    first = _bucket_start(date_from, interval)
+    if (date_to - first) / step > MAX_POINTS:
+        raise Exception(f'Слишком много точек, максимум {MAX_POINTS}: увеличьте interval или сократите период')
+    
+    balance, floor, applied = _replay(user_id, first)
+    
+    events = [(row.created_at, 0, row.id, row.delta) for row in _movements(user_id, first, date_to)]
+    checkpoints = db.session.execute(
+        select(BalanceCheckpoint.as_of, BalanceCheckpoint.id, BalanceCheckpoint.balance, BalanceCheckpoint.last_tx_id)
+        .where(BalanceCheckpoint.user_id == user_id, BalanceCheckpoint.as_of >= first, BalanceCheckpoint.as_of < date_to)
+    ).all()
+    # При равном времени сначала операции, затем точка
+    events += [(row.as_of, 1, row.id, (row.balance, row.last_tx_id)) for row in checkpoints]
+    events.sort(key=lambda event: event[:3])
+    
+    points = []
+    position = 0
+    bucket = first
+    while bucket < date_to:
+        end = min(bucket + step, date_to)
+        while position < len(events) and events[position][0] < end:
+            _, kind, event_id, value = events[position]
+            position += 1
+            if kind == 1:
+                checkpoint_balance, floor = value
+                # Операции, уже учтенные выше, но не вошедшие в точку, остаются
+                applied = [(tx_id, delta) for tx_id, delta in applied if tx_id > floor]
+                balance = checkpoint_balance + sum(delta for _, delta in applied)
+            elif event_id > floor:
+                applied.append((event_id, value))
+                balance += value
+        points.append((bucket, balance))
+        bucket += step
+    return points
+
+def series_to_dict(points):
+    return [{'date': bucket.date().isoformat(), 'balance': from_kopecks(balance)} for bucket, balance in points]
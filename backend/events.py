@@ -0,0 +1,257 @@
+"""События для клиентов (Server-Sent Events): новый баланс и новые операции.
+
+EventBus раздает события подписчикам своего процесса - открытым потокам
+/api/events. Между воркерами события передает подключаемый бэкенд:
+LocalBackend доставляет только внутри процесса (один воркер), SQLiteBackend
+пишет их в общий файл SQLite, который каждый процесс с подписчиками дочитывает
+раз в poll_interval секунд.
+"""
+import itertools
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from sqlalchemy import select
+from models import db, User
+from money import from_kopecks
+
+QUEUE_SIZE = 100  # событий в очереди одного потока; медленный клиент отключается и переподключается
+LOOKUP_CHUNK_SIZE = 500  # пользователей в одном запросе балансов для событий массовой выплаты
+
+# ==================== БЭКЕНДЫ ====================
+class LocalBackend:
+    """События видны только подписчикам этого процесса"""
+    def __init__(self):
+        self._ids = itertools.count(1)
+        self._deliver = None
+
+    def start(self, deliver):
+        self._deliver = deliver
+
+    def publish(self, items):
+        if self._deliver is None:
+            return
+        for user_id, event_type, data in items:
+            self._deliver(user_id, {'id': next(self._ids), 'type': event_type, 'data': data})
+
+class SQLiteBackend:
+    """Общая для воркеров лента событий в отдельном файле SQLite.
+    
+    Публикация - вставка строк в одной транзакции; процесс с подписчиками в
+    фоновом потоке читает строки с id больше последнего прочитанного. События
+    старше retention секунд удаляются.
+    """
+    def __init__(self, path, poll_interval=0.5, retention=300):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._local = threading.local()
+        self._thread = None
+        self._stopped = threading.Event()
+        with self._connection() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS events ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                'user_id INTEGER NOT NULL, '
+                'type TEXT NOT NULL, '
+                'data TEXT NOT NULL, '
+                'created_at REAL NOT NULL)'
+            )
+
+    def _connection(self):
+        # Соединение sqlite3 нельзя делить между потоками: у каждого потока свое
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5)
+            connection.execute('PRAGMA journal_mode=WAL')
+            self._local.connection = connection
+        return connection
+
+    def start(self, deliver):
+        if self._thread is not None:
+            return
+        last_id = self._connection().execute('SELECT COALESCE(MAX(id), 0) FROM events').fetchone()[0]
+        self._thread = threading.Thread(target=self._poll, args=(deliver, last_id), name='events-poll', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def publish(self, items):
+        now = time.time()
+        with self._connection() as connection:
+            connection.executemany(
+                'INSERT INTO events (user_id, type, data, created_at) VALUES (?, ?, ?, ?)',
+                [(user_id, event_type, json.dumps(data, ensure_ascii=False), now) for user_id, event_type, data in items]
+            )
+
+    def _poll(self, deliver, last_id):
+        connection = self._connection()
+        pruned_at = time.monotonic()
+        while not self._stopped.wait(self.poll_interval):
+            try:
+                rows = connection.execute(
+                    'SELECT id, user_id, type, data FROM events WHERE id > ? ORDER BY id', (last_id,)
+                ).fetchall()
+                for event_id, user_id, event_type, data in rows:
+                    deliver(user_id, {'id': event_id, 'type': event_type, 'data': json.loads(data)})
+                    last_id = event_id
+                
+                if time.monotonic() - pruned_at > self.retention:
+                    with connection:
+                        connection.execute('DELETE FROM events WHERE created_at < ?', (time.time() - self.retention,))
+                    pruned_at = time.monotonic()
+            except sqlite3.OperationalError:
+                # Файл занят другим воркером: прочитаем на следующем шаге
+                continue
+
+def make_backend():
+    name = os.environ.get('EVENTS_BACKEND', 'local')
+    if name == 'local':
+        return LocalBackend()
+    if name == 'sqlite':
+        return SQLiteBackend(
+            os.environ.get('EVENTS_DB', 'events.db'),
+            poll_interval=float(os.environ.get('EVENTS_POLL_INTERVAL', 0.5))
+        )
+    raise ValueError(f'Неизвестный EVENTS_BACKEND: {name}')
+
+# ==================== ПОДПИСКИ ====================
+class Subscription:
+    """Очередь событий одного открытого потока.
+    
+    wakeup (если задан) вызывается после каждого события из потока бэкенда -
+    так асинхронный обработчик узнает о событии без блокирующего ожидания.
+    """
+    def __init__(self, user_id, wakeup=None):
+        self.user_id = user_id
+        self.wakeup = wakeup
+        self.overflowed = False
+        self._queue = queue.Queue(maxsize=QUEUE_SIZE)
+
+    def push(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            # Клиент не успевает читать: поток закрывается, при переподключении придет свежий баланс
+            self.overflowed = True
+        if self.wakeup is not None:
+            self.wakeup()
+
+    def get(self, timeout):
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def drain(self):
+        events = []
+        while True:
+            try:
+                events.append(self._queue.get_nowait())
+            except queue.Empty:
+                return events
+
+class EventBus:
+    def __init__(self, backend):
+        self.backend = backend
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._started = False
+
+    def subscribe(self, user_id, wakeup=None):
+        subscription = Subscription(user_id, wakeup)
+        with self._lock:
+            # Чтение ленты начинается с первым подписчиком: CLI и воркеры без потоков ее не читают
+            if not self._started:
+                self.backend.start(self._deliver)
+                self._started = True
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscribers.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscribers[subscription.user_id]
+
+    def connections(self):
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscribers.values())
+
+    def publish(self, items):
+        """items - список (user_id, тип события, данные); вызывается после commit"""
+        if items:
+            self.backend.publish(items)
+
+    def _deliver(self, user_id, event):
+        with self._lock:
+            subscriptions = list(self._subscribers.get(user_id, ()))
+        for subscription in subscriptions:
+            subscription.push(event)
+
+bus = EventBus(make_backend())
+
+# ==================== СОБЫТИЯ ====================
+def format_event(event):
+    """Событие в формате text/event-stream"""
+    data = json.dumps(event['data'], ensure_ascii=False)
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {data}\n\n".encode('utf-8')
+
+def balance_data(balance, version):
+    # version - та же, что у getAccountInfo: клиент пропускает события старше показанных данных
+    return {'balance': from_kopecks(balance), 'version': version}
+
+def publish_transfer(transaction_id, sender_id, receiver_id, amount, description=None, session=None):
+    """Баланс и новая операция для обеих сторон перевода (после commit)"""
+    publish_transfers(sender_id, [(transaction_id, receiver_id, amount, description)], session)
+
+def publish_transfers(sender_id, transfers, session=None):
+    """Балансы и новые операции для отправителя и получателей (после commit).
+    
+    transfers - [(id операции, получатель, сумма, описание)]. Баланс и версия
+    читаются после commit: если за это время прошел еще один перевод, клиент
+    сразу получит более свежее значение.
+    """
+    if not transfers:
+        return
+    users = _load_users({sender_id} | {receiver_id for _, receiver_id, _, _ in transfers}, session)
+    sender = users.get(sender_id)
+    if sender is None:
+        return
+    
+    items = [(sender.id, 'balance', balance_data(sender.balance, sender.version))]
+    items += [(user.id, 'balance', balance_data(user.balance, user.version)) for user in users.values() if user.id != sender_id]
+    for transaction_id, receiver_id, amount, description in transfers:
+        receiver = users.get(receiver_id)
+        if receiver is None:
+            continue
+        for user, other, kind in ((sender, receiver, 'outgoing'), (receiver, sender, 'incoming')):
+            items.append((user.id, 'transaction', {
+                'id': transaction_id,
+                'type': kind,
+                'amount': from_kopecks(amount),
+                'description': description,
+                'counterparty': other.full_name
+            }))
+    bus.publish(items)
+
+def publish_balances(user_ids, session=None):
+    """Текущие балансы пользователей (после правки мимо переводов)"""
+    users = _load_users(set(user_ids), session)
+    bus.publish([(user.id, 'balance', balance_data(user.balance, user.version)) for user in users.values()])
+
+def _load_users(user_ids, session=None):
+    users = {}
+    user_ids = list(user_ids)
+    for start in range(0, len(user_ids), LOOKUP_CHUNK_SIZE):
+        rows = (session or db.session).execute(
+            select(User.id, User.full_name, User.balance, User.version)
+            .where(User.id.in_(user_ids[start:start + LOOKUP_CHUNK_SIZE]))
+        ).all()
+        users.update((row.id, row) for row in rows)
+    return users
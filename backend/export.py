@@ -0,0 +1,128 @@
+from collections import namedtuple
+import csv
+import heapq
+import io
+import json
+import zlib
+from sqlalchemy import select, func, tuple_
+from sqlalchemy.orm import aliased
+from models import db, User, Transaction
+from archive import archive, not_archived
+
+EXPORT_CHUNK_SIZE = 5000
+FORMATS = ('csv', 'jsonl')
+COLUMNS = ['id', 'sender_id', 'sender_name', 'receiver_id', 'receiver_name', 'amount', 'description', 'created_at']
+
+ExportRow = namedtuple('ExportRow', ('id', 'sender_id', 'receiver_id', 'amount', 'description', 'created_at',
+                                     'sender_name', 'receiver_name'))
+
+def _page_query(date_from, date_to, max_id, after, limit, boundary=None):
+    sender = aliased(User)
+    receiver = aliased(User)
+    query = select(
+        Transaction.id,
+        Transaction.sender_id,
+        Transaction.receiver_id,
+        Transaction.amount,
+        Transaction.description,
+        Transaction.created_at,
+        sender.full_name.label('sender_name'),
+        receiver.full_name.label('receiver_name')
+    ).join(sender, sender.id == Transaction.sender_id).join(receiver, receiver.id == Transaction.receiver_id)
+    
+    query = query.where(Transaction.id <= max_id)
+    if date_from is not None:
+        query = query.where(Transaction.created_at >= date_from)
+    if date_to is not None:
+        query = query.where(Transaction.created_at < date_to)
+    if after is not None:
+        query = query.where(tuple_(Transaction.created_at, Transaction.id) > tuple_(*after))
+    if boundary is not None:
+        query = query.where(not_archived(boundary))
+    return query.order_by(Transaction.created_at, Transaction.id).limit(limit)
+
+def export_transactions(date_from=None, date_to=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """Операции за период пачками по chunk_size строк, от старых к новым.
+    
+    Каждая пачка - отдельный короткий запрос с продолжением по ключу
+    (created_at, id), поэтому память не зависит от объема выгрузки, а SQLite
+    не держит блокировку чтения все время выгрузки. Операции, записанные
+    после начала выгрузки, в нее не попадают. Если период заходит за границу
+    архива, операции из архива сливаются с основной таблицей по времени.
+    """
+    boundary = archive.reaches(date_from)
+    rows = _hot_rows(date_from, date_to, chunk_size, boundary)
+    if boundary is not None:
+        rows = heapq.merge(_archived_rows(date_from, date_to, chunk_size), rows, key=lambda row: (row.created_at, row.id))
+    
+    chunk = []
+    for row in rows:
+        chunk.append(_row_to_dict(row))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _hot_rows(date_from, date_to, chunk_size, boundary=None):
+    max_id = db.session.execute(select(func.max(Transaction.id))).scalar() or 0
+    after = None
+    while True:
+        rows = db.session.execute(_page_query(date_from, date_to, max_id, after, chunk_size, boundary)).all()
+        db.session.rollback()  # завершаем транзакцию чтения между пачками
+        yield from rows
+        if len(rows) < chunk_size:
+            return
+        after = (rows[-1].created_at, rows[-1].id)
+
+def _archived_rows(date_from, date_to, chunk_size):
+    # Имена участников подтягиваются одним запросом на пачку строк архива
+    chunk = []
+    for row in archive.rows_between(date_from, date_to):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield from _with_names(chunk)
+            chunk = []
+    yield from _with_names(chunk)
+
+def _with_names(rows):
+    if not rows:
+        return []
+    user_ids = {row.sender_id for row in rows} | {row.receiver_id for row in rows}
+    names = dict(db.session.execute(select(User.id, User.full_name).where(User.id.in_(user_ids))).all())
+    db.session.rollback()
+    return [ExportRow(*row, names.get(row.sender_id), names.get(row.receiver_id)) for row in rows]
+
+def _row_to_dict(row):
+    data = Transaction.fields(row)
+    data['sender_name'] = row.sender_name
+    data['receiver_name'] = row.receiver_name
+    return data
+
+# ==================== ФОРМАТЫ ====================
+def encode_chunks(chunks, fmt):
+    """Превращает пачки строк в куски текста CSV (с заголовком) или JSONL"""
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=COLUMNS)
+        writer.writeheader()
+        yield buffer.getvalue()
+        for chunk in chunks:
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(chunk)
+            yield buffer.getvalue()
+    elif fmt == 'jsonl':
+        for chunk in chunks:
+            yield ''.join(json.dumps(row, ensure_ascii=False) + '\n' for row in chunk)
+    else:
+        raise Exception('Формат должен быть csv или jsonl')
+
+def gzip_stream(pieces):
+    """Сжимает поток текста в gzip на лету, не собирая его целиком"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # 31 - заголовок gzip
+    for piece in pieces:
+        data = compressor.compress(piece.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,138 @@
+from datetime import datetime, timedelta
+import base64
+from sqlalchemy import select, union_all, literal, tuple_
+from models import db, User, Transaction
+from money import from_kopecks
+from serialization import pack_rows
+from archive import archive, not_archived, history_rows
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+# ==================== ПАРАМЕТРЫ ====================
+def encode_cursor(created_at, tx_id):
+    raw = f'{created_at.isoformat()}|{tx_id}'
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        created_at, tx_id = raw.split('|')
+        return datetime.fromisoformat(created_at), int(tx_id)
+    except (ValueError, AttributeError, UnicodeError):
+        raise Exception('Некорректный курсор')
+
+def parse_date(value, end_of_day=False):
+    """Принимает дату (2025-01-31) или дату со временем в ISO-формате"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (ValueError, TypeError):
+        raise Exception('Некорректная дата')
+    # Дата без времени в качестве верхней границы включает весь день
+    if end_of_day and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed
+
+def parse_limit(value):
+    if value is None:
+        return DEFAULT_LIMIT
+    try:
+        limit = int(value)
+    except (ValueError, TypeError):
+        raise Exception('Некорректный limit')
+    if limit < 1:
+        raise Exception('limit должен быть положительным')
+    return min(limit, MAX_LIMIT)
+
+# ==================== ЗАПРОС ====================
+def _side_query(user_id, outgoing, date_from, date_to, after, limit, fields=None, boundary=None):
+    # Одна сторона истории (исходящие или входящие) с именем контрагента в том же запросе.
+    # Фильтр по участнику + сортировка по дате обслуживаются составным индексом
+    own_column = Transaction.sender_id if outgoing else Transaction.receiver_id
+    other_column = Transaction.receiver_id if outgoing else Transaction.sender_id
+    columns = {
+        'id': Transaction.id,
+        'sender_id': Transaction.sender_id,
+        'receiver_id': Transaction.receiver_id,
+        'amount': Transaction.amount,
+        'description': Transaction.description,
+        'created_at': Transaction.created_at,
+        'type': literal('outgoing' if outgoing else 'incoming').label('type'),
+        'counterparty': User.full_name.label('counterparty')
+    }
+    # id и created_at нужны всегда: по ним сортировка и курсор
+    names = [name for name in columns if not fields or name in fields or name in ('id', 'created_at')]
+    
+    query = select(*(columns[name] for name in names)).where(own_column == user_id)
+    if 'counterparty' in names:
+        query = query.join(User, User.id == other_column)
+    
+    if date_from is not None:
+        query = query.where(Transaction.created_at >= date_from)
+    if date_to is not None:
+        query = query.where(Transaction.created_at < date_to)
+    if after is not None:
+        query = query.where(tuple_(Transaction.created_at, Transaction.id) < tuple_(*after))
+    if boundary is not None:
+        # Период заходит в архив: строки, уже перенесенные туда, берутся из архива
+        query = query.where(not_archived(boundary))
+    
+    query = query.order_by(Transaction.created_at.desc(), Transaction.id.desc())
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+def _row_to_dict(row):
+    return {
+        'id': row.id,
+        'sender_id': row.sender_id,
+        'receiver_id': row.receiver_id,
+        'amount': from_kopecks(row.amount),
+        'description': row.description,
+        'created_at': row.created_at.isoformat() if row.created_at else None,
+        'type': row.type,
+        'counterparty': row.counterparty
+    }
+
+def transaction_history(user_id, limit=None, cursor=None, date_from=None, date_to=None, fields=None, session=None):
+    """История операций пользователя, от новых к старым.
+    
+    Пагинация по ключу (created_at, id): следующая страница начинается строго после
+    последней строки предыдущей, без OFFSET. Возвращает (операции, курсор следующей
+    страницы или None). Без limit возвращается вся история. fields - выбрать
+    только эти поля (контрагент без запроса не подтягивается). session - сессия
+    SQLAlchemy вместо db.session (для асинхронного режима). Если период заходит
+    за границу архива, старые операции дочитываются из архива.
+    """
+    after = decode_cursor(cursor) if cursor else None
+    fetch = limit + 1 if limit is not None else None
+    boundary = archive.reaches(date_from)
+    
+    outgoing = _side_query(user_id, True, date_from, date_to, after, fetch, fields, boundary).subquery()
+    incoming = _side_query(user_id, False, date_from, date_to, after, fetch, fields, boundary).subquery()
+    combined = union_all(select(outgoing), select(incoming)).subquery()
+    
+    query = select(combined).order_by(combined.c.created_at.desc(), combined.c.id.desc())
+    if fetch is not None:
+        query = query.limit(fetch)
+    
+    rows = (session or db.session).execute(query).all()
+    
+    # Архив нужен, только если страница не заполнилась строками новее его границы
+    if boundary is not None and (fetch is None or len(rows) < fetch or rows[-1].created_at < boundary[0]):
+        archived = archive.user_rows(user_id, date_from, date_to, before=after, limit=fetch)
+        if archived:
+            rows = sorted(rows + history_rows(archived, user_id, session), key=lambda row: (row.created_at, row.id), reverse=True)
+            if fetch is not None:
+                rows = rows[:fetch]
+    
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    
+    if fields:
+        return pack_rows(rows, fields), next_cursor
+    return [_row_to_dict(row) for row in rows], next_cursor
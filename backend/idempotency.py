@@ -0,0 +1,184 @@
+"""Ключи идемпотентности для изменяющих методов JSON-RPC.
+
+Клиент передает idempotencyKey; ключ принадлежит пользователю и хранится в
+idempotency_keys вместе с сохраненным ответом. Повтор с тем же ключом получает
+этот ответ одним поиском по уникальному индексу (user_id, key), без повторного
+выполнения. Ключ с ответом записывается в ту же транзакцию, что и само
+изменение: обработчик вызывает remember(ответ) перед своим commit (перевод в
+очереди с групповым commit - через claim.store в потоке писателя). Поэтому
+повтор после сбоя сети никогда не выполняет изменение второй раз, а вызов,
+который завершился ошибкой, откатывается вместе с ключом и ключ не занимает.
+Методы, которые фиксируют изменения несколькими commit (importUsers), ключей
+не принимают. Ключи старше TTL удаляет фоновый поток KeySweeper.
+"""
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from functools import wraps
+import hashlib
+import json as std_json
+import threading
+import time
+from flask import current_app, json, request
+from sqlalchemy import select, delete
+from sqlalchemy.exc import IntegrityError
+from models import db, IdempotencyKey
+
+KEY_PARAM = 'idempotencyKey'
+MAX_KEY_LENGTH = 100
+SWEEP_CHUNK_SIZE = 1000
+
+# Ключ текущего вызова: свой у каждого потока и у каждой задачи asyncio
+_current_claim = ContextVar('idempotency_claim', default=None)
+
+class Claim:
+    """Ключ выполняемого вызова: запись создается в транзакции изменения"""
+    def __init__(self, user_id, key, method, fingerprint):
+        self.user_id = user_id
+        self.key = key
+        self.method = method
+        self.fingerprint = fingerprint
+        self.result_stored = False
+
+    def new_row(self, result=None):
+        return IdempotencyKey(
+            user_id=self.user_id,
+            key=self.key,
+            method=self.method,
+            fingerprint=self.fingerprint,
+            result=json.dumps(result) if result is not None else None
+        )
+
+    def store(self, result):
+        """Ключ с ответом в текущей транзакции (без commit)"""
+        db.session.add(self.new_row(result))
+        self.result_stored = True
+
+def current_claim():
+    return _current_claim.get()
+
+def remember(result):
+    """Вызывается обработчиком перед commit изменения: ответ фиксируется вместе с ним"""
+    claim = _current_claim.get()
+    if claim is not None and not claim.result_stored:
+        claim.store(result)
+
+def parse_key(params):
+    key = params.get(KEY_PARAM) if isinstance(params, dict) else None
+    if key is None:
+        return None
+    if not isinstance(key, str) or not key.strip() or len(key) > MAX_KEY_LENGTH:
+        raise Exception(f'{KEY_PARAM} должен быть непустой строкой до {MAX_KEY_LENGTH} символов')
+    return key.strip()
+
+def fingerprint(params):
+    # Тот же ключ с другими параметрами - ошибка клиента, а не повтор.
+    # Стандартный json с sort_keys: хеш не зависит от порядка ключей и от кодировщика ответов
+    payload = std_json.dumps(
+        {k: v for k, v in params.items() if k != KEY_PARAM},
+        sort_keys=True, separators=(',', ':'), ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def lookup(user_id, key):
+    return db.session.execute(
+        select(IdempotencyKey.method, IdempotencyKey.fingerprint, IdempotencyKey.result)
+        .where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+    ).first()
+
+def replay(stored, claim):
+    """Сохраненный ответ для повтора с тем же ключом"""
+    if stored.method != claim.method:
+        raise Exception(f'{KEY_PARAM} уже использован для метода {stored.method}')
+    if stored.fingerprint != claim.fingerprint:
+        raise Exception(f'{KEY_PARAM} уже использован с другими параметрами')
+    if stored.result is None:
+        raise Exception('Запрос с этим ключом еще выполняется, повторите позже')
+    return json.loads(stored.result)
+
+def idempotent(method):
+    """Декоратор обработчика (под login_required): повтор с тем же ключом не выполняет изменение снова"""
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(params):
+            params = params or {}
+            key = parse_key(params)
+            if key is None:
+                return handler(params)
+            
+            sweeper = current_app.extensions.get('idempotency_sweeper')
+            if sweeper is not None:
+                sweeper.ensure_started()
+            
+            claim = Claim(request.principal.id, key, method, fingerprint(params))
+            stored = lookup(claim.user_id, key)
+            if stored is not None:
+                return replay(stored, claim)
+            
+            token = _current_claim.set(claim)
+            try:
+                result = handler({k: v for k, v in params.items() if k != KEY_PARAM})
+            except IntegrityError:
+                # Параллельный повтор успел записать тот же ключ: изменение откатилось
+                db.session.rollback()
+                stored = lookup(claim.user_id, key)
+                if stored is None:
+                    raise
+                return replay(stored, claim)
+            finally:
+                _current_claim.reset(token)
+            
+            if not claim.result_stored:
+                # Вызов ничего не изменил (например, ни одна строка выплаты не прошла):
+                # ответ все равно сохраняется, чтобы повтор получил тот же результат
+                claim.store(result)
+                db.session.commit()
+            return result
+        return wrapper
+    return decorator
+
+# ==================== ОЧИСТКА ====================
+def sweep_expired(ttl, now=None):
+    """Удаляет ключи старше ttl короткими транзакциями. Возвращает число удаленных"""
+    threshold = (now or datetime.utcnow()) - ttl
+    deleted = 0
+    while True:
+        ids = db.session.execute(
+            select(IdempotencyKey.id).where(IdempotencyKey.created_at < threshold).limit(SWEEP_CHUNK_SIZE)
+        ).scalars().all()
+        if not ids:
+            return deleted
+        db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.id.in_(ids)))
+        db.session.commit()
+        deleted += len(ids)
+
+class KeySweeper:
+    """Фоновый поток процесса: раз в interval секунд удаляет просроченные ключи"""
+    def __init__(self, app, ttl_hours=24, interval=300):
+        self.app = app
+        self.ttl = timedelta(hours=ttl_hours)
+        self.interval = interval
+        self.deleted = 0
+        self._thread = None
+        self._lock = threading.Lock()
+        app.extensions['idempotency_sweeper'] = self
+
+    def ensure_started(self):
+        # Поток создается при первом вызове с ключом - уже в процессе воркера, а не до fork
+        if self._thread is not None or self.interval <= 0:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='idempotency-sweeper', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self.app.app_context():
+                try:
+                    self.deleted += sweep_expired(self.ttl)
+                except Exception:
+                    db.session.rollback()
+                    self.app.logger.exception('Не удалось удалить просроченные ключи идемпотентности')
+                finally:
+                    db.session.remove()
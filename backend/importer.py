@@ -0,0 +1,213 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+import csv
+import io
+import json
+import os
+import time
+from models import db, User
+from validators import Validator, normalize_phone
+from money import to_kopecks
+from accounts import allocate_account_numbers, is_allocated_format
+from stats import apply_delta
+from checkpoints import write_checkpoints
+
+DEFAULT_CHUNK_SIZE = 1000
+ROLES = ('client', 'manager')
+
+# ==================== ЧТЕНИЕ ВХОДНЫХ ДАННЫХ ====================
+def read_rows(stream, fmt):
+    """Построчно читает CSV (с заголовком) или JSONL из файла или потока байт/строк"""
+    lines = (line.decode('utf-8') if isinstance(line, bytes) else line for line in stream)
+    if fmt == 'csv':
+        yield from csv.DictReader(lines)
+    elif fmt == 'jsonl':
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield {'_error': 'Некорректная строка JSON'}
+    else:
+        raise Exception('Формат должен быть csv или jsonl')
+
+def read_text(text, fmt):
+    return read_rows(io.StringIO(text), fmt)
+
+def _field(row, *names):
+    # Поддерживаем оба написания: fullName (как в createUser) и full_name (как в to_dict)
+    for name in names:
+        value = row.get(name)
+        if value not in (None, ''):
+            return value
+    return None
+
+# ==================== ИМПОРТ ====================
+def _prepare(number, row):
+    """Проверка строки теми же правилами, что и в createUser. Возвращает (данные, ошибка)"""
+    if not isinstance(row, dict) or '_error' in row:
+        return None, row.get('_error') if isinstance(row, dict) else 'Некорректная строка'
+    
+    role = _field(row, 'role') or 'client'
+    data = {
+        'row': number,
+        'login': _field(row, 'login'),
+        'password': _field(row, 'password'),
+        'full_name': _field(row, 'fullName', 'full_name'),
+        'role': role,
+        'phone': _field(row, 'phone'),
+        'account_number': _field(row, 'accountNumber', 'account_number'),
+        'balance': _field(row, 'balance')
+    }
+    if data['balance'] is None:
+        data['balance'] = 1000.0 if role == 'client' else 0
+    
+    if role not in ROLES:
+        return data, 'role: Роль должна быть client или manager'
+    is_valid, message = Validator.validate_new_user(
+        data['login'], data['password'], data['full_name'],
+        data['phone'], data['account_number'], data['balance']
+    )
+    if not is_valid:
+        return data, message
+    if is_allocated_format(data['account_number']):
+        return data, 'accountNumber: Номера этого формата выдаются автоматически'
+    if role != 'client':
+        data['account_number'] = None
+    return data, None
+
+def _existing(column, values):
+    if not values:
+        return set()
+    return {value for (value,) in db.session.query(column).filter(column.in_(values))}
+
+def _import_chunk(chunk, seen_logins, seen_accounts, hash_passwords, rejected):
+    valid = []
+    for data in chunk:
+        login, account_number = data['login'], data['account_number']
+        if login in seen_logins:
+            rejected.append({'row': data['row'], 'login': login, 'error': 'Логин повторяется в файле'})
+        elif account_number and account_number in seen_accounts:
+            rejected.append({'row': data['row'], 'login': login, 'error': 'Номер счета повторяется в файле'})
+        else:
+            seen_logins.add(login)
+            if account_number:
+                seen_accounts.add(account_number)
+            valid.append(data)
+    
+    # Уникальность проверяется одним запросом на пачку, а не двумя на пользователя
+    taken_logins = _existing(User.login, [data['login'] for data in valid])
+    taken_accounts = _existing(User.account_number, [data['account_number'] for data in valid if data['account_number']])
+    accepted = []
+    for data in valid:
+        if data['login'] in taken_logins:
+            rejected.append({'row': data['row'], 'login': data['login'], 'error': 'Логин уже существует'})
+        elif data['account_number'] in taken_accounts:
+            rejected.append({'row': data['row'], 'login': data['login'], 'error': 'Номер счета уже существует'})
+        else:
+            accepted.append(data)
+    if not accepted:
+        return 0
+    
+    # Номера из счетчика уникальны, сверять их с базой не нужно
+    missing = [data for data in accepted if data['role'] == 'client' and not data['account_number']]
+    for data, account_number in zip(missing, allocate_account_numbers(len(missing))):
+        data['account_number'] = account_number
+    
+    hashes = hash_passwords([data['password'] for data in accepted])
+    created_at = datetime.utcnow()
+    rows = [{
+        'login': data['login'],
+        'password_hash': password_hash,
+        'full_name': data['full_name'],
+        'role': data['role'],
+        'phone': data['phone'],
+        'phone_normalized': normalize_phone(data['phone']),
+        'account_number': data['account_number'],
+        'balance': to_kopecks(data['balance']),
+        'created_at': created_at,
+        'is_active': True
+    } for data, password_hash in zip(accepted, hashes)]
+    
+    db.session.execute(User.__table__.insert(), rows)
+    user_ids = db.session.execute(
+        db.select(User.id).where(User.login.in_([row['login'] for row in rows]))
+    ).scalars().all()
+    write_checkpoints(user_ids, as_of=created_at)
+    clients = [row for row in rows if row['role'] == 'client']
+    apply_delta(
+        total_users=len(rows),
+        total_clients=len(clients),
+        total_managers=len(rows) - len(clients),
+        total_balance=sum(row['balance'] for row in clients)
+    )
+    db.session.commit()
+    return len(rows)
+
+def import_users(rows, chunk_size=DEFAULT_CHUNK_SIZE, workers=None, progress=None, threads=False):
+    """Потоковый импорт пользователей.
+    
+    Строки проверяются валидаторами createUser, логины и номера счетов
+    сверяются с базой пачками, пароли хешируются bcrypt параллельно в пуле
+    процессов, каждая пачка вставляется одним executemany и фиксируется
+    отдельным commit. Отклоненные строки возвращаются с номером и причиной.
+    threads=True - пул потоков вместо процессов (bcrypt отпускает GIL): для
+    вызова из воркера сервера, где fork копировал бы его фоновые потоки.
+    """
+    started = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    rejected = []
+    imported = 0
+    processed = 0
+    seen_logins = set()
+    seen_accounts = set()
+    
+    executor_class = ThreadPoolExecutor if threads else ProcessPoolExecutor
+    pool = executor_class(max_workers=workers) if workers > 1 else None
+    try:
+        if pool:
+            def hash_passwords(passwords):
+                chunksize = max(1, len(passwords) // (workers * 4))
+                return list(pool.map(User.hash_password, passwords, chunksize=chunksize))
+        else:
+            def hash_passwords(passwords):
+                return [User.hash_password(password) for password in passwords]
+        
+        chunk = []
+        for number, row in enumerate(rows, 1):
+            data, error = _prepare(number, row)
+            if error:
+                rejected.append({'row': number, 'login': data['login'] if data else None, 'error': error})
+            else:
+                chunk.append(data)
+            processed = number
+            
+            if len(chunk) >= chunk_size:
+                imported += _import_chunk(chunk, seen_logins, seen_accounts, hash_passwords, rejected)
+                chunk = []
+                if progress:
+                    progress(processed, imported, len(rejected))
+        
+        if chunk:
+            imported += _import_chunk(chunk, seen_logins, seen_accounts, hash_passwords, rejected)
+            if progress:
+                progress(processed, imported, len(rejected))
+    finally:
+        if pool:
+            pool.shutdown()
+    
+    rejected.sort(key=lambda item: item['row'])
+    return {
+        'processed': processed,
+        'imported': imported,
+        'rejected': rejected,
+        'seconds': round(time.perf_counter() - started, 2)
+    }
+
+def write_rejected_report(rejected, path):
+    with open(path, 'w', newline='', encoding='utf-8') as report:
+        writer = csv.DictWriter(report, fieldnames=['row', 'login', 'error'])
+        writer.writeheader()
+        writer.writerows(rejected)
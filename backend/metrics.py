@@ -0,0 +1,269 @@
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+import logging
+import threading
+import time
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Метрики живут в памяти процесса: у каждого воркера свои, как и кэши
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SLOW_LOG_SIZE = 50
+MAX_TRACED_STATEMENTS = 200
+OUTSIDE_RPC = '-'  # SQL и bcrypt вне вызовов JSON-RPC (CLI, выгрузка, статика)
+
+slow_log = logging.getLogger('slow_requests')
+# Текущий вызов: свой у каждого потока и у каждой задачи asyncio
+_current_trace = ContextVar('current_trace', default=None)
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield bound, total
+
+    def quantile(self, q):
+        """Верхняя граница корзины, в которую попадает квантиль (оценка сверху)"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        for bound, total in self.cumulative():
+            if total >= rank:
+                return min(bound, self.max)
+        return self.max
+
+class MethodStats:
+    def __init__(self):
+        self.latency = Histogram()
+        self.errors = {}
+        self.sql_statements = 0
+        self.sql_seconds = 0.0
+        self.bcrypt_calls = 0
+        self.bcrypt_seconds = 0.0
+        self.routes = {}
+        self.sql_read_statements = 0
+
+class CallTrace:
+    """Что сделал один вызов: запросы к базе и время bcrypt"""
+    def __init__(self, method, route=None):
+        self.method = method
+        self.route = route
+        self.started = time.perf_counter()
+        self.sql_statements = 0
+        self.sql_read_statements = 0
+        self.sql_seconds = 0.0
+        self.bcrypt_calls = 0
+        self.bcrypt_seconds = 0.0
+        self.statements = []
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.methods = {}
+        self.slow_requests = deque(maxlen=SLOW_LOG_SIZE)
+
+    def _method(self, name):
+        stats = self.methods.get(name)
+        if stats is None:
+            stats = self.methods[name] = MethodStats()
+        return stats
+    
+    # ---------- Сбор ----------
+    @property
+    def current(self):
+        return _current_trace.get()
+
+    def start_call(self, method, route=None):
+        trace = CallTrace(method, route)
+        _current_trace.set(trace)
+        return trace
+
+    def finish_call(self, trace, error_code=None, slow_threshold=None):
+        _current_trace.set(None)
+        seconds = time.perf_counter() - trace.started
+        with self._lock:
+            stats = self._method(trace.method)
+            stats.latency.observe(seconds)
+            if error_code is not None:
+                stats.errors[error_code] = stats.errors.get(error_code, 0) + 1
+            stats.sql_statements += trace.sql_statements
+            stats.sql_read_statements += trace.sql_read_statements
+            stats.sql_seconds += trace.sql_seconds
+            if trace.route is not None:
+                stats.routes[trace.route] = stats.routes.get(trace.route, 0) + 1
+            stats.bcrypt_calls += trace.bcrypt_calls
+            stats.bcrypt_seconds += trace.bcrypt_seconds
+        
+        if slow_threshold is not None and seconds >= slow_threshold:
+            entry = {
+                'method': trace.method,
+                'route': trace.route,
+                'at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'ms': round(seconds * 1000, 1),
+                'error_code': error_code,
+                'sql_statements': trace.sql_statements,
+                'sql_ms': round(trace.sql_seconds * 1000, 1),
+                'bcrypt_ms': round(trace.bcrypt_seconds * 1000, 1),
+                # Только текст запросов: параметры могут содержать персональные данные
+                'statements': [
+                    {'sql': statement, 'ms': round(elapsed * 1000, 2)}
+                    for statement, elapsed in trace.statements
+                ]
+            }
+            with self._lock:
+                self.slow_requests.append(entry)
+            slow_log.warning(
+                'Медленный вызов %s: %.1f мс, SQL: %d запросов за %.1f мс\n%s',
+                trace.method, entry['ms'], trace.sql_statements, entry['sql_ms'],
+                '\n'.join(f"  [{item['ms']} мс] {item['sql']}" for item in entry['statements'])
+            )
+        return seconds
+
+    def record_sql(self, statement, seconds, read=False):
+        trace = self.current
+        if trace is not None:
+            trace.sql_statements += 1
+            trace.sql_read_statements += read
+            trace.sql_seconds += seconds
+            if len(trace.statements) < MAX_TRACED_STATEMENTS:
+                trace.statements.append((statement, seconds))
+            return
+        with self._lock:
+            stats = self._method(OUTSIDE_RPC)
+            stats.sql_statements += 1
+            stats.sql_read_statements += read
+            stats.sql_seconds += seconds
+
+    def record_bcrypt(self, seconds):
+        trace = self.current
+        if trace is not None:
+            trace.bcrypt_calls += 1
+            trace.bcrypt_seconds += seconds
+            return
+        with self._lock:
+            stats = self._method(OUTSIDE_RPC)
+            stats.bcrypt_calls += 1
+            stats.bcrypt_seconds += seconds
+
+    def reset(self):
+        with self._lock:
+            self.methods.clear()
+            self.slow_requests.clear()
+            self.started_at = time.time()
+    
+    # ---------- Отчеты ----------
+    def snapshot(self):
+        with self._lock:
+            methods = {}
+            for name, stats in sorted(self.methods.items()):
+                latency = stats.latency
+                methods[name] = {
+                    'calls': latency.count,
+                    'errors': {str(code): count for code, count in sorted(stats.errors.items())},
+                    'latency_ms': {
+                        'avg': round(latency.sum / latency.count * 1000, 2) if latency.count else 0.0,
+                        'p50': round(latency.quantile(0.5) * 1000, 2),
+                        'p95': round(latency.quantile(0.95) * 1000, 2),
+                        'p99': round(latency.quantile(0.99) * 1000, 2),
+                        'max': round(latency.max * 1000, 2)
+                    },
+                    'routes': dict(sorted(stats.routes.items())),
+                    'sql_statements': stats.sql_statements,
+                    'sql_read_statements': stats.sql_read_statements,
+                    'sql_ms': round(stats.sql_seconds * 1000, 2),
+                    'bcrypt_calls': stats.bcrypt_calls,
+                    'bcrypt_ms': round(stats.bcrypt_seconds * 1000, 2)
+                }
+            return {
+                'uptime_seconds': round(time.time() - self.started_at, 1),
+                'methods': methods,
+                'slow_requests': list(self.slow_requests)
+            }
+
+    def prometheus(self):
+        """Метрики в текстовом формате Prometheus"""
+        lines = []
+
+        def header(name, kind, description):
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {kind}')
+        
+        with self._lock:
+            methods = sorted(self.methods.items())
+            header('bank_rpc_duration_seconds', 'histogram', 'JSON-RPC call latency by method')
+            for name, stats in methods:
+                if not stats.latency.count:
+                    continue
+                for bound, total in stats.latency.cumulative():
+                    lines.append(f'bank_rpc_duration_seconds_bucket{{method="{name}",le="{bound}"}} {total}')
+                lines.append(f'bank_rpc_duration_seconds_bucket{{method="{name}",le="+Inf"}} {stats.latency.count}')
+                lines.append(f'bank_rpc_duration_seconds_sum{{method="{name}"}} {stats.latency.sum:.6f}')
+                lines.append(f'bank_rpc_duration_seconds_count{{method="{name}"}} {stats.latency.count}')
+            
+            header('bank_rpc_errors_total', 'counter', 'JSON-RPC errors by method and error code')
+            for name, stats in methods:
+                for code, count in sorted(stats.errors.items()):
+                    lines.append(f'bank_rpc_errors_total{{method="{name}",code="{code}"}} {count}')
+            
+            header('bank_rpc_routed_total', 'counter', 'JSON-RPC calls by method and database route (read or write)')
+            for name, stats in methods:
+                for route, count in sorted(stats.routes.items()):
+                    lines.append(f'bank_rpc_routed_total{{method="{name}",route="{route}"}} {count}')
+            
+            counters = (
+                ('bank_sql_statements_total', 'SQL statements executed', 'sql_statements', '{}'),
+                ('bank_sql_read_statements_total', 'SQL statements executed on the read-only engine', 'sql_read_statements', '{}'),
+                ('bank_sql_seconds_total', 'Time spent in SQL statements', 'sql_seconds', '{:.6f}'),
+                ('bank_bcrypt_operations_total', 'bcrypt hash and check operations', 'bcrypt_calls', '{}'),
+                ('bank_bcrypt_seconds_total', 'Time spent in bcrypt', 'bcrypt_seconds', '{:.6f}')
+            )
+            for metric, description, attribute, value_format in counters:
+                header(metric, 'counter', f'{description} by JSON-RPC method ("{OUTSIDE_RPC}" - outside calls)')
+                for name, stats in methods:
+                    lines.append(f'{metric}{{method="{name}"}} {value_format.format(getattr(stats, attribute))}')
+            
+            header('bank_slow_requests', 'gauge', 'Slow calls kept in the in-memory log')
+            lines.append(f'bank_slow_requests {len(self.slow_requests)}')
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
+
+@contextmanager
+def bcrypt_timer():
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.record_bcrypt(time.perf_counter() - started)
+
+# ==================== СОБЫТИЯ SQLALCHEMY ====================
+# Слушатели на классе Engine: учитываются запросы всех движков приложения
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_started'].pop()
+    # Движок чтения помечен параметром выполнения db_route (см. storage.py)
+    read = conn.get_execution_options().get('db_route') == 'read'
+    metrics.record_sql(statement, time.perf_counter() - started, read)
@@ -0,0 +1,107 @@
+from sqlalchemy import inspect, Float, select, update, bindparam
+from sqlalchemy.schema import CreateTable
+from models import db, User, BalanceCheckpoint
+from validators import normalize_phone
+from checkpoints import backfill_opening_checkpoints
+from search import ensure_search_index
+
+# Колонки, которые раньше хранили рубли во float, а теперь - целые копейки
+MONEY_COLUMNS = {
+    'users': ('balance',),
+    'transactions': ('amount',),
+    'statistics': ('total_balance', 'transfer_volume')
+}
+
+BACKFILL_CHUNK_SIZE = 5000
+
+def upgrade_schema(engine=None):
+    """Доводит существующую базу до текущих моделей.
+    
+    db.create_all() создает только отсутствующие таблицы, поэтому новые
+    колонки и индексы в уже созданных таблицах добавляются здесь.
+    """
+    engine = engine or db.engine
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    
+    with engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            
+            existing_columns = {column['name']: column['type'] for column in inspector.get_columns(table.name)}
+            # Запоминаем до пересборки: пересобранная таблица уже содержит новые колонки, но пустые
+            missing = [column.name for column in table.columns if column.name not in existing_columns]
+            if _stores_rubles(table.name, existing_columns):
+                _convert_money_to_kopecks(connection, table, existing_columns)
+                existing_columns = {column.name: column.type for column in table.columns}
+            
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                default = f' DEFAULT {column.server_default.arg}' if column.server_default is not None else ''
+                connection.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}{default}')
+            
+            for name in missing:
+                backfill = BACKFILLS.get((table.name, name))
+                if backfill:
+                    backfill(connection)
+            if table.name == 'users' and 'phone_normalized' not in missing:
+                # Базы, обновленные до исправления: пересборка оставляла колонку пустой
+                _backfill_phone_normalized(connection)
+            
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+        
+        # База велась до контрольных точек балансов: пишем начальные точки
+        if connection.execute(select(BalanceCheckpoint.id).limit(1)).first() is None:
+            backfill_opening_checkpoints(connection)
+        
+        ensure_search_index(connection)
+
+def _stores_rubles(table_name, existing_columns):
+    return any(isinstance(existing_columns.get(name), Float) for name in MONEY_COLUMNS.get(table_name, ()))
+
+def _convert_money_to_kopecks(connection, table, existing_columns):
+    # SQLite не умеет менять тип колонки: создаем таблицу заново по модели,
+    # переносим данные с пересчетом рублей в копейки и подменяем старую
+    if connection.dialect.name != 'sqlite':
+        raise RuntimeError(f'Перевод {table.name} на копейки автоматически поддерживается только для SQLite')
+    
+    new_name = f'{table.name}__new'
+    ddl = str(CreateTable(table).compile(dialect=connection.dialect)).strip()
+    connection.exec_driver_sql(ddl.replace(f'CREATE TABLE {table.name} ', f'CREATE TABLE {new_name} ', 1))
+    
+    money = MONEY_COLUMNS[table.name]
+    columns = [column.name for column in table.columns if column.name in existing_columns]
+    expressions = [
+        f'CAST(ROUND(COALESCE({name}, 0) * 100) AS INTEGER)' if name in money else name
+        for name in columns
+    ]
+    connection.exec_driver_sql(
+        f"INSERT INTO {new_name} ({', '.join(columns)}) SELECT {', '.join(expressions)} FROM {table.name}"
+    )
+    connection.exec_driver_sql(f'DROP TABLE {table.name}')
+    connection.exec_driver_sql(f'ALTER TABLE {new_name} RENAME TO {table.name}')
+
+def _backfill_phone_normalized(connection):
+    users = User.__table__
+    rows = connection.execute(
+        select(users.c.id, users.c.phone).where(users.c.phone.is_not(None), users.c.phone_normalized.is_(None))
+    ).all()
+    statement = (
+        update(users)
+        .where(users.c.id == bindparam('user_id'))
+        .values(phone_normalized=bindparam('normalized'))
+    )
+    for start in range(0, len(rows), BACKFILL_CHUNK_SIZE):
+        connection.execute(statement, [
+            {'user_id': user_id, 'normalized': normalize_phone(phone)}
+            for user_id, phone in rows[start:start + BACKFILL_CHUNK_SIZE]
+        ])
+
+# Заполнение новых колонок по уже существующим данным: (таблица, колонка) -> функция
+BACKFILLS = {
+    ('users', 'phone_normalized'): _backfill_phone_normalized
+}
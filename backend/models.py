@@ -1,11 +1,21 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import validates
 from datetime import datetime
 import bcrypt
+from money import from_kopecks
+from validators import normalize_phone
+from metrics import bcrypt_timer
+from storage import RoutingSession
 
-db = SQLAlchemy()
+# Чтения JSON-RPC идут на отдельный движок, если он настроен (см. storage.py)
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(db.Model):
     __tablename__ = 'users'
+    __table_args__ = (
+        # Фильтр и сортировка по балансу в списке пользователей
+        db.Index('ix_users_balance', 'balance'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     login = db.Column(db.String(50), unique=True, nullable=False, index=True)
@@ -13,19 +23,37 @@ class User(db.Model):
     full_name = db.Column(db.String(100), nullable=False)
     role = db.Column(db.String(20), nullable=False)
     phone = db.Column(db.String(20))
+    phone_normalized = db.Column(db.String(20), index=True)  # для поиска получателя по телефону
     account_number = db.Column(db.String(20), unique=True)
-    balance = db.Column(db.Float, default=0.0)
+    balance = db.Column(db.Integer, nullable=False, default=0)  # в копейках
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_active = db.Column(db.Boolean, default=True)
+    # Растет при каждом изменении строки (в том числе баланса переводом)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
     
     sent_transactions = db.relationship('Transaction', foreign_keys='Transaction.sender_id', backref='sender', lazy=True)
     received_transactions = db.relationship('Transaction', foreign_keys='Transaction.receiver_id', backref='receiver', lazy=True)
     
+    @validates('phone')
+    def _normalize_phone(self, key, phone):
+        self.phone_normalized = normalize_phone(phone)
+        return phone
+    
+    @staticmethod
+    def hash_password(password):
+        with bcrypt_timer():
+            return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    
     def set_password(self, password):
-        self.password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        self.password_hash = User.hash_password(password)
+    
+    @staticmethod
+    def verify_password(password, password_hash):
+        with bcrypt_timer():
+            return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
     
     def check_password(self, password):
-        return bcrypt.checkpw(password.encode('utf-8'), self.password_hash.encode('utf-8'))
+        return User.verify_password(password, self.password_hash)
     
     def to_dict(self):
         return {
@@ -35,28 +63,107 @@ class User(db.Model):
             'role': self.role,
             'phone': self.phone,
             'account_number': self.account_number,
-            'balance': round(self.balance, 2),
+            'balance': from_kopecks(self.balance),
             'created_at': self.created_at.isoformat() if self.created_at else None,
-            'is_active': self.is_active
+            'is_active': self.is_active,
+            'version': self.version
         }
 
 class Transaction(db.Model):
     __tablename__ = 'transactions'
+    __table_args__ = (
+        # Индексы под историю операций: фильтр по участнику + сортировка по дате
+        db.Index('ix_transactions_sender_created', 'sender_id', 'created_at'),
+        db.Index('ix_transactions_receiver_created', 'receiver_id', 'created_at'),
+        # Выгрузка за период по всем счетам
+        db.Index('ix_transactions_created', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     sender_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     receiver_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    amount = db.Column(db.Float, nullable=False)
+    amount = db.Column(db.Integer, nullable=False)  # в копейках
     description = db.Column(db.String(200))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    @staticmethod
+    def fields(row):
+        """Поля операции из объекта или строки запроса с теми же колонками"""
+        return {
+            'id': row.id,
+            'sender_id': row.sender_id,
+            'receiver_id': row.receiver_id,
+            'amount': from_kopecks(row.amount),
+            'description': row.description,
+            'created_at': row.created_at.isoformat() if row.created_at else None
+        }
+    
+    def to_dict(self):
+        data = Transaction.fields(self)
+        data['type'] = 'outgoing' if self.sender_id == self.sender_id else 'incoming'
+        return data
+
+class Statistics(db.Model):
+    """Агрегаты для панели менеджера, обновляются в тех же транзакциях, что и данные"""
+    __tablename__ = 'statistics'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    total_users = db.Column(db.Integer, nullable=False, default=0)
+    total_managers = db.Column(db.Integer, nullable=False, default=0)
+    total_clients = db.Column(db.Integer, nullable=False, default=0)
+    total_balance = db.Column(db.Integer, nullable=False, default=0)  # в копейках
+    transfer_count = db.Column(db.Integer, nullable=False, default=0)
+    transfer_volume = db.Column(db.Integer, nullable=False, default=0)  # в копейках
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # version - агрегатов, users_version - любых данных пользователей (для getAllUsers)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    users_version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    
     def to_dict(self):
         return {
-            'id': self.id,
-            'sender_id': self.sender_id,
-            'receiver_id': self.receiver_id,
-            'amount': round(self.amount, 2),
-            'description': self.description,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'type': 'outgoing' if self.sender_id == self.sender_id else 'incoming'
-        }
\ No newline at end of file
+            'total_users': self.total_users,
+            'total_managers': self.total_managers,
+            'total_clients': self.total_clients,
+            'total_balance': from_kopecks(self.total_balance),
+            'transfer_count': self.transfer_count,
+            'transfer_volume': from_kopecks(self.transfer_volume),
+            'version': self.version
+        }
+
+class AccountSequence(db.Model):
+    """Счетчик для выдачи номеров счетов блоками"""
+    __tablename__ = 'account_sequences'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    next_value = db.Column(db.Integer, nullable=False)
+
+class BalanceCheckpoint(db.Model):
+    """Баланс счета на момент as_of с учетом всех операций с id <= last_tx_id"""
+    __tablename__ = 'balance_checkpoints'
+    __table_args__ = (
+        db.Index('ix_balance_checkpoints_user_as_of', 'user_id', 'as_of'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    as_of = db.Column(db.DateTime, nullable=False)
+    balance = db.Column(db.Integer, nullable=False)  # в копейках
+    last_tx_id = db.Column(db.Integer, nullable=False, default=0)
+
+class IdempotencyKey(db.Model):
+    """Ключ идемпотентности пользователя с сохраненным ответом (см. idempotency.py)"""
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (
+        # Повтор ищется по паре (пользователь, ключ); она же не дает выполнить изменение дважды
+        db.UniqueConstraint('user_id', 'key', name='uq_idempotency_keys_user_key'),
+        # Очистка просроченных ключей
+        db.Index('ix_idempotency_keys_created', 'created_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    key = db.Column(db.String(100), nullable=False)
+    method = db.Column(db.String(50), nullable=False)
+    fingerprint = db.Column(db.String(64), nullable=False)
+    result = db.Column(db.Text)  # JSON ответа; None - изменение зафиксировано, ответ еще не записан
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
@@ -0,0 +1,18 @@
+from decimal import Decimal, ROUND_HALF_UP, InvalidOperation
+
+# Деньги хранятся в целых копейках: никаких ошибок округления float
+# и атомарные UPDATE balance = balance - :amount прямо в БД
+
+def to_kopecks(value):
+    """Рубли (число или строка) -> целые копейки"""
+    try:
+        rubles = Decimal(str(value))
+    except InvalidOperation:
+        raise ValueError(f'Некорректная сумма: {value}')
+    return int((rubles * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+def from_kopecks(kopecks):
+    """Целые копейки -> рубли для ответа API"""
+    if kopecks is None:
+        return None
+    return round(kopecks / 100, 2)
@@ -0,0 +1,96 @@
+from collections import namedtuple
+import os
+from sqlalchemy import select
+from models import db, User
+from cache import TTLCache
+from validators import normalize_phone
+
+# Кэш получатель -> пользователь для частых адресатов. Промахи не кэшируются,
+# чтобы новый счет находился сразу; устаревшая запись живет не дольше ttl,
+# а зачисление все равно проверяет, что получатель активен
+recipient_cache = TTLCache(
+    maxsize=int(os.environ.get('RECIPIENT_CACHE_SIZE', 10000)),
+    ttl=float(os.environ.get('RECIPIENT_CACHE_TTL', 30))
+)
+
+Recipient = namedtuple('Recipient', ['id', 'role', 'is_active', 'full_name', 'account_number', 'phone_normalized'])
+
+# Ограничение SQLite на число параметров запроса: IN (...) режем на куски
+RESOLVE_CHUNK_SIZE = 500
+
+def _clients():
+    return select(
+        User.id, User.role, User.is_active, User.full_name, User.account_number, User.phone_normalized
+    ).where(User.role == 'client', User.is_active == True)
+
+def _chunked(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def resolve_recipient(recipient):
+    """Ищет активного клиента по номеру счета или телефону (в любом формате записи).
+    Номер счета важнее телефона. Возвращает Recipient или None"""
+    if not recipient or not isinstance(recipient, str):
+        return None
+    key = recipient.strip()
+    cached = recipient_cache.get(key)
+    if cached is not None:
+        return cached
+    
+    clients = _clients()
+    row = db.session.execute(clients.where(User.account_number == key)).first()
+    if row is None:
+        phone = normalize_phone(key)
+        if phone:
+            row = db.session.execute(
+                clients.where(User.phone_normalized == phone).order_by(User.id).limit(1)
+            ).first()
+    if row is None:
+        return None
+    
+    found = Recipient(*row)
+    recipient_cache.set(key, found)
+    return found
+
+def resolve_recipients(recipients):
+    """Пакетный вариант для массовых выплат: IN-запросы кусками вместо поиска по одному.
+    Возвращает {строка получателя: Recipient} только для найденных"""
+    recipients = list(recipients)
+    phones = {}
+    for recipient in recipients:
+        phone = normalize_phone(recipient)
+        if phone:
+            phones.setdefault(phone, []).append(recipient)
+    
+    resolved = {}
+    for chunk in _chunked(list(phones), RESOLVE_CHUNK_SIZE):
+        rows = db.session.execute(
+            _clients().where(User.phone_normalized.in_(chunk)).order_by(User.id)
+        ).all()
+        for row in rows:
+            for recipient in phones[row.phone_normalized]:
+                resolved.setdefault(recipient, Recipient(*row))
+    for chunk in _chunked(recipients, RESOLVE_CHUNK_SIZE):
+        rows = db.session.execute(_clients().where(User.account_number.in_(chunk))).all()
+        for row in rows:
+            resolved[row.account_number] = Recipient(*row)
+    return resolved
+
+def display_name(full_name):
+    """Имя для предпросмотра перевода: фамилия и инициалы"""
+    parts = (full_name or '').split()
+    if not parts:
+        return ''
+    initials = ' '.join(f'{part[0]}.' for part in parts[1:3])
+    return f'{parts[0]} {initials}'.strip()
+
+def mask_account_number(account_number):
+    """Номер счета для предпросмотра: только последние 4 цифры"""
+    if not account_number:
+        return ''
+    return f'****{account_number[-4:]}'
+
+def invalidate_recipients():
+    # Ключи кэша - строки, которые вводили пользователи, поэтому при изменении
+    # пользователя кэш этого процесса сбрасывается целиком
+    recipient_cache.clear()
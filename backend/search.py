@@ -0,0 +1,172 @@
+from datetime import datetime
+import base64
+import json
+import re
+from sqlalchemy import event, select, or_, text, func, tuple_
+from sqlalchemy.exc import OperationalError
+from models import db, User
+from money import to_kopecks
+from serialization import pack_rows
+
+FTS_TABLE = 'users_fts'
+FTS_COLUMNS = ('full_name', 'login', 'phone_normalized', 'account_number')
+SORTS = {
+    'id': User.id,
+    'login': User.login,
+    'full_name': User.full_name,
+    'balance': User.balance,
+    'created_at': func.coalesce(User.created_at, datetime(1970, 1, 1))
+}
+ROLES = ('client', 'manager')
+
+# ==================== ПОЛНОТЕКСТОВЫЙ ИНДЕКС ====================
+# users_fts - индекс FTS5 над колонками users (external content), синхронизируется
+# триггерами при любой записи. Триггер на UPDATE срабатывает только при изменении
+# индексируемых колонок, поэтому переводы (UPDATE balance) его не затрагивают
+_columns = ', '.join(FTS_COLUMNS)
+_new = ', '.join(f'new.{column}' for column in FTS_COLUMNS)
+_old = ', '.join(f'old.{column}' for column in FTS_COLUMNS)
+SEARCH_INDEX_DDL = {
+    FTS_TABLE: f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5({_columns}, content='users', content_rowid='id')",
+    'users_fts_insert': f"""CREATE TRIGGER users_fts_insert AFTER INSERT ON users BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, {_columns}) VALUES (new.id, {_new});
+    END""",
+    'users_fts_delete': f"""CREATE TRIGGER users_fts_delete AFTER DELETE ON users BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_columns}) VALUES ('delete', old.id, {_old});
+    END""",
+    'users_fts_update': f"""CREATE TRIGGER users_fts_update AFTER UPDATE OF {_columns} ON users BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_columns}) VALUES ('delete', old.id, {_old});
+        INSERT INTO {FTS_TABLE}(rowid, {_columns}) VALUES (new.id, {_new});
+    END"""
+}
+
+def ensure_search_index(connection):
+    """Создает недостающие части индекса и перестраивает его по users.
+    Возвращает False, если база не SQLite или SQLite собрана без FTS5"""
+    if connection.dialect.name != 'sqlite':
+        return False
+    existing = set(connection.exec_driver_sql(
+        "SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger') AND name LIKE 'users_fts%'"
+    ).scalars())
+    missing = [name for name in SEARCH_INDEX_DDL if name not in existing]
+    if not missing:
+        return True
+    try:
+        with connection.begin_nested():
+            for name in missing:
+                connection.exec_driver_sql(SEARCH_INDEX_DDL[name])
+            connection.exec_driver_sql(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    except OperationalError:
+        # no such module: fts5 - поиск работает через LIKE
+        return False
+    return True
+
+@event.listens_for(User.__table__, 'after_create')
+def _create_search_index(table, connection, **kwargs):
+    ensure_search_index(connection)
+
+def search_index_available():
+    if db.engine.dialect.name != 'sqlite':
+        return False
+    return db.session.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': FTS_TABLE}
+    ).first() is not None
+
+# ==================== ЗАПРОС ====================
+def _terms(query):
+    # Телефон в любой записи ищем одним термом по цифрам, как он лежит в phone_normalized
+    if re.fullmatch(r'[\d\s()+-]+', query):
+        digits = re.sub(r'\D', '', query)
+        if query.startswith('8'):
+            digits = '7' + digits[1:]
+        return [digits] if digits else []
+    return re.findall(r'\w+', query)
+
+def _text_filter(terms):
+    if search_index_available():
+        # Каждое слово - префикс, все слова должны встретиться (AND)
+        match = ' '.join(f'"{term}"*' for term in terms)
+        matched = select(text('rowid')).select_from(text(FTS_TABLE)).where(text(f'{FTS_TABLE} MATCH :match'))
+        return User.id.in_(matched.params(match=match))
+    
+    # LIKE в SQLite не различает регистр только для латиницы: кириллицу
+    # ищем в типичных написаниях (как ввели, строчными, с заглавной, прописными)
+    conditions = []
+    for term in terms:
+        escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        variants = {escaped, escaped.lower(), escaped.capitalize(), escaped.upper()}
+        conditions.append(or_(*(
+            getattr(User, column).like(f'%{variant}%', escape='\\')
+            for column in FTS_COLUMNS for variant in variants
+        )))
+    return db.and_(*conditions)
+
+def encode_cursor(sort, value, user_id):
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([sort, value, user_id])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor, sort):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        cursor_sort, value, user_id = json.loads(raw)
+    except (ValueError, AttributeError, UnicodeError, TypeError):
+        raise Exception('Некорректный курсор')
+    if cursor_sort != sort:
+        raise Exception('Курсор получен для другой сортировки')
+    if sort == 'created_at':
+        value = datetime.fromisoformat(value)
+    return value, user_id
+
+def search_users(query=None, role=None, min_balance=None, max_balance=None, sort='id', limit=50, cursor=None, fields=None):
+    """Активные пользователи с фильтрами и пагинацией по ключу (поле сортировки, id).
+    
+    Текстовый поиск - по префиксам слов в ФИО, логине, телефоне и номере счета
+    через индекс FTS5; без FTS5 - подстрочный поиск через LIKE.
+    sort - имя поля, с минусом в начале - по убыванию.
+    fields - выбрать из базы и вернуть только эти поля (None - все, как to_dict).
+    Возвращает (пользователи, курсор следующей страницы или None).
+    """
+    descending = bool(sort) and sort.startswith('-')
+    sort_name = (sort or 'id').lstrip('-')
+    if sort_name not in SORTS:
+        raise Exception(f"sort должен быть одним из: {', '.join(SORTS)}")
+    sort_column = SORTS[sort_name]
+    
+    if fields:
+        selected = [getattr(User, name).label(name) for name in fields]
+    else:
+        selected = [User]
+    statement = select(*selected, User.id.label('cursor_id'), sort_column.label('sort_value')).where(User.is_active == True)
+    if query and query.strip():
+        terms = _terms(query.strip())
+        if terms:
+            statement = statement.where(_text_filter(terms))
+    if role is not None:
+        if role not in ROLES:
+            raise Exception('Роль должна быть client или manager')
+        statement = statement.where(User.role == role)
+    if min_balance is not None:
+        statement = statement.where(User.balance >= to_kopecks(min_balance))
+    if max_balance is not None:
+        statement = statement.where(User.balance <= to_kopecks(max_balance))
+    
+    if cursor:
+        after = tuple_(*decode_cursor(cursor, sort))
+        key = tuple_(sort_column, User.id)
+        statement = statement.where(key < after if descending else key > after)
+    if descending:
+        statement = statement.order_by(sort_column.desc(), User.id.desc())
+    else:
+        statement = statement.order_by(sort_column, User.id)
+    
+    rows = db.session.execute(statement.limit(limit + 1)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(sort, last.sort_value, last.cursor_id)
+    if fields:
+        return pack_rows(rows, fields), next_cursor
+    return [row.User.to_dict() for row in rows], next_cursor
@@ -0,0 +1,221 @@
+from datetime import datetime, timedelta
+import random
+import time
+from models import db, User, Transaction, BalanceCheckpoint
+from stats import snapshot, record_user_change, apply_delta
+from money import to_kopecks
+from accounts import allocate_account_numbers
+from checkpoints import write_checkpoints
+
+# ==================== ДЕМО-ДАННЫЕ ====================
+def seed_test_data():
+    """Создает демо-пользователей, если база пустая. Вызывается один раз при запуске"""
+    if User.query.count() > 0:
+        return False
+    
+    # Номера резервируются до первой записи в сессии
+    account_numbers = allocate_account_numbers(10)
+    
+    admin1 = User(
+        login='admin1',
+        full_name='Иванов Иван Иванович',
+        role='manager',
+        phone='+79991112233',
+        account_number='ADMIN001'
+    )
+    admin1.set_password('admin123')
+    db.session.add(admin1)
+    record_user_change(None, snapshot(admin1))
+    
+    admin2 = User(
+        login='manager1',
+        full_name='Петрова Анна Сергеевна',
+        role='manager',
+        phone='+79992223344',
+        account_number='ADMIN002'
+    )
+    admin2.set_password('manager123')
+    db.session.add(admin2)
+    record_user_change(None, snapshot(admin2))
+    
+    clients_data = [
+        {'full_name': 'Сидоров Алексей Владимирович', 'phone': '+79161111111'},
+        {'full_name': 'Кузнецова Мария Петровна', 'phone': '+79162222222'},
+        {'full_name': 'Смирнов Дмитрий Алексеевич', 'phone': '+79163333333'},
+        {'full_name': 'Васильева Екатерина Игоревна', 'phone': '+79164444444'},
+        {'full_name': 'Попов Сергей Николаевич', 'phone': '+79165555555'},
+        {'full_name': 'Новикова Ольга Викторовна', 'phone': '+79166666666'},
+        {'full_name': 'Фёдоров Павел Александрович', 'phone': '+79167777777'},
+        {'full_name': 'Морозова Анастасия Дмитриевна', 'phone': '+79168888888'},
+        {'full_name': 'Волков Андрей Сергеевич', 'phone': '+79169999999'},
+        {'full_name': 'Лебедева Татьяна Михайловна', 'phone': '+79160000000'}
+    ]
+    
+    for i, (client_data, account_number) in enumerate(zip(clients_data, account_numbers), 1):
+        client = User(
+            login=f'client{i}',
+            full_name=client_data['full_name'],
+            role='client',
+            phone=client_data['phone'],
+            account_number=account_number,
+            balance=to_kopecks(10000)
+        )
+        client.set_password(f'client{i}')
+        db.session.add(client)
+        record_user_change(None, snapshot(client))
+    
+    db.session.flush()
+    write_checkpoints([user.id for user in User.query.all()])
+    db.session.commit()
+    print("Тестовые данные созданы")
+    return True
+
+# ==================== НАГРУЗОЧНЫЕ ДАННЫЕ ====================
+LAST_NAMES = ['Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Петров', 'Соколов', 'Михайлов']
+FIRST_NAMES = ['Алексей', 'Дмитрий', 'Сергей', 'Андрей', 'Павел', 'Иван', 'Олег', 'Николай']
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+# Формат, в котором SQLAlchemy хранит DateTime в SQLite: сравнение строк совпадает с сравнением дат
+SQLITE_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+def _insert_rows(table, rows):
+    connection = db.session.connection()
+    if connection.dialect.name != 'sqlite':
+        connection.execute(table.insert(), rows)
+        return
+    # Для SQLite пишем напрямую через драйвер, минуя обработку типов SQLAlchemy:
+    # на миллионах строк это основная часть времени загрузки
+    columns = list(rows[0])
+    dates = [column for column in columns if isinstance(rows[0][column], datetime)]
+    sql = f"INSERT INTO {table.name} ({', '.join(columns)}) VALUES ({', '.join(':' + c for c in columns)})"
+    for row in rows:
+        for column in dates:
+            row[column] = row[column].strftime(SQLITE_DATETIME_FORMAT)
+    connection.exec_driver_sql(sql, rows)
+
+def _synthetic_transfers(rng, first_id, clients, transfers, start_time, step):
+    # Генератор детерминирован: при одном и том же rng дает ту же последовательность
+    random_value = rng.random
+    for n in range(transfers):
+        sender = first_id + int(random_value() * clients)
+        receiver = first_id + int(random_value() * (clients - 1))
+        if receiver >= sender:
+            receiver += 1
+        amount = 100 + int(random_value() * 99901)  # от 1 до 1000 рублей, в копейках
+        yield sender, receiver, amount, start_time + step * n
+
+def bulk_seed(clients, transfers=0, password='client', initial_balance=10000.0,
+              chunk_size=10000, seed=None, days=365, progress=None):
+    """Заполняет users и transactions синтетическими данными для нагрузочного тестирования.
+    
+    Пароль хешируется один раз и общий для всех синтетических клиентов, вставка идет
+    пакетами через executemany в одной транзакции. Переводы без достаточного баланса
+    пропускаются, так что итоговые балансы согласованы с историей операций.
+    """
+    if clients < 2 and transfers:
+        raise ValueError('Для переводов нужно минимум два клиента')
+    initial_balance = to_kopecks(initial_balance)
+    
+    started = time.perf_counter()
+    password_hash = User.hash_password(password)
+    first_id = (db.session.query(db.func.max(User.id)).scalar() or 0) + 1
+    last_tx_id = db.session.query(db.func.max(Transaction.id)).scalar() or 0
+    now = datetime.utcnow()
+    start_time = now - timedelta(days=days)
+    step = timedelta(days=days) / max(transfers, 1)
+    seed = seed if seed is not None else random.randrange(2 ** 32)
+    account_numbers = allocate_account_numbers(clients)
+    
+    # Первый проход: считаем итоговые балансы, второй проход повторяет ту же
+    # последовательность и пишет операции, не держа их все в памяти
+    balances = [initial_balance] * clients
+    accepted = 0
+    volume = 0
+    for sender, receiver, amount, _ in _synthetic_transfers(random.Random(seed), first_id, clients, transfers, start_time, step):
+        if balances[sender - first_id] >= amount:
+            balances[sender - first_id] -= amount
+            balances[receiver - first_id] += amount
+            accepted += 1
+            volume += amount
+
+    def user_rows():
+        for i in range(clients):
+            user_id = first_id + i
+            yield {
+                'id': user_id,
+                'login': f'load{user_id}',
+                'password_hash': password_hash,
+                'full_name': f'{LAST_NAMES[user_id % len(LAST_NAMES)]} {FIRST_NAMES[user_id // len(LAST_NAMES) % len(FIRST_NAMES)]} #{user_id}',
+                'role': 'client',
+                'phone': f'+7{9000000000 + user_id}',
+                'phone_normalized': f'+7{9000000000 + user_id}',
+                'account_number': account_numbers[i],
+                'balance': balances[i],
+                'created_at': start_time,
+                'is_active': True
+            }
+
+    def transaction_rows():
+        balances = [initial_balance] * clients
+        for sender, receiver, amount, created_at in _synthetic_transfers(random.Random(seed), first_id, clients, transfers, start_time, step):
+            if balances[sender - first_id] < amount:
+                continue
+            balances[sender - first_id] -= amount
+            balances[receiver - first_id] += amount
+            yield {
+                'sender_id': sender,
+                'receiver_id': receiver,
+                'amount': amount,
+                'description': f'Перевод {account_numbers[receiver - first_id]}',
+                'created_at': created_at
+            }
+    
+    inserted_users = 0
+    for chunk in _chunks(user_rows(), chunk_size):
+        _insert_rows(User.__table__, chunk)
+        inserted_users += len(chunk)
+        if progress:
+            progress('users', inserted_users, clients)
+    
+    # Начальные точки балансов: история синтетических операций начинается после них
+    checkpoint_rows = ({
+        'user_id': first_id + i,
+        'as_of': start_time,
+        'balance': initial_balance,
+        'last_tx_id': last_tx_id
+    } for i in range(clients))
+    for chunk in _chunks(checkpoint_rows, chunk_size):
+        _insert_rows(BalanceCheckpoint.__table__, chunk)
+    
+    inserted_transactions = 0
+    for chunk in _chunks(transaction_rows(), chunk_size):
+        _insert_rows(Transaction.__table__, chunk)
+        inserted_transactions += len(chunk)
+        if progress:
+            progress('transactions', inserted_transactions, accepted)
+    
+    apply_delta(
+        total_users=inserted_users,
+        total_clients=inserted_users,
+        total_balance=initial_balance * inserted_users,
+        transfer_count=inserted_transactions,
+        transfer_volume=volume
+    )
+    db.session.commit()
+    
+    return {
+        'users': inserted_users,
+        'transactions': inserted_transactions,
+        'skipped_transfers': transfers - accepted,
+        'seed': seed,
+        'seconds': round(time.perf_counter() - started, 2)
+    }
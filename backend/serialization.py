@@ -0,0 +1,99 @@
+from datetime import date, datetime
+from decimal import Decimal
+import json
+import os
+from flask.json.provider import JSONProvider
+from money import from_kopecks
+
+try:
+    import orjson
+except ImportError:  # orjson не обязателен: без него работает стандартный json
+    orjson = None
+
+# ==================== КОДИРОВЩИК ====================
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f'Тип {type(value).__name__} не сериализуется в JSON')
+
+def _stdlib_dumps(obj, sort_keys=False):
+    # Без экранирования кириллицы и без пробелов: ответ короче, чем у jsonify по умолчанию
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=_default, sort_keys=sort_keys).encode('utf-8')
+
+def _orjson_dumps(obj, sort_keys=False):
+    option = orjson.OPT_NON_STR_KEYS
+    if sort_keys:
+        option |= orjson.OPT_SORT_KEYS
+    return orjson.dumps(obj, default=_default, option=option)
+
+def encoder_name():
+    """orjson, если установлен и не отключен через JSON_ENCODER=stdlib"""
+    if orjson is not None and os.environ.get('JSON_ENCODER', 'orjson') != 'stdlib':
+        return 'orjson'
+    return 'stdlib'
+
+ENCODERS = {'orjson': _orjson_dumps, 'stdlib': _stdlib_dumps}
+
+class FastJSONProvider(JSONProvider):
+    """JSON для jsonify и request.get_json: orjson, если доступен, иначе json.
+    
+    datetime кодируется в ISO 8601 (как в to_dict), поэтому строки из
+    выборки по полям можно отдавать без предварительного форматирования.
+    """
+    mimetype = 'application/json'
+
+    def __init__(self, app, encoder=None):
+        super().__init__(app)
+        self.encoder = encoder or encoder_name()
+        self._dumps = ENCODERS[self.encoder]
+
+    def dumps(self, obj, **kwargs):
+        # Из параметров json.dumps поддерживается sort_keys (канонический вид для хешей)
+        return self._dumps(obj, sort_keys=kwargs.get('sort_keys', False)).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if orjson is not None:
+            return orjson.loads(s)
+        return json.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self._dumps(obj), mimetype=self.mimetype)
+
+# ==================== ВЫБОРКА ПОЛЕЙ ====================
+# Поля, которые можно запросить параметром fields, и денежные среди них
+USER_FIELDS = ('id', 'login', 'full_name', 'role', 'phone', 'account_number', 'balance', 'created_at', 'is_active', 'version')
+TRANSACTION_FIELDS = ('id', 'sender_id', 'receiver_id', 'amount', 'description', 'created_at', 'type', 'counterparty')
+MONEY_FIELDS = {'balance', 'amount'}
+
+def parse_fields(value, allowed):
+    """Список полей из параметра fields (массив или строка через запятую) или None - все поля"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.split(',')
+    if not isinstance(value, list) or not all(isinstance(name, str) for name in value):
+        raise Exception('fields должен быть списком имен полей')
+    fields = list(dict.fromkeys(name.strip() for name in value if name.strip()))
+    if not fields:
+        raise Exception('fields не должен быть пустым')
+    unknown = [name for name in fields if name not in allowed]
+    if unknown:
+        raise Exception(f"Неизвестные поля: {', '.join(unknown)}. Доступны: {', '.join(allowed)}")
+    return fields
+
+def pack_rows(rows, fields):
+    """Строки запроса -> словари только с запрошенными полями (деньги - в рублях)"""
+    money = [name in MONEY_FIELDS for name in fields]
+    packed = []
+    for row in rows:
+        mapping = row._mapping
+        packed.append({
+            name: from_kopecks(mapping[name]) if is_money else mapping[name]
+            for name, is_money in zip(fields, money)
+        })
+    return packed
@@ -0,0 +1,140 @@
+from sqlalchemy import func, case, update, select
+from models import db, User, Transaction, Statistics
+from archive import archive
+
+STATISTICS_ID = 1
+COUNTERS = ('total_users', 'total_managers', 'total_clients', 'total_balance', 'transfer_count', 'transfer_volume')
+
+# ==================== ВКЛАД ПОЛЬЗОВАТЕЛЯ ====================
+def snapshot(user):
+    """То, что от пользователя попадает в агрегаты: (активен, роль, баланс)"""
+    if user is None:
+        return None
+    # У нового, еще не записанного объекта колонки с default пока None
+    is_active = True if user.is_active is None else bool(user.is_active)
+    return is_active, user.role, int(user.balance or 0)
+
+def _contribution(state):
+    if state is None:
+        return {}
+    is_active, role, balance = state
+    if not is_active:
+        return {}
+    return {
+        'total_users': 1,
+        'total_managers': 1 if role == 'manager' else 0,
+        'total_clients': 1 if role == 'client' else 0,
+        'total_balance': balance if role == 'client' else 0
+    }
+
+# ==================== ОБНОВЛЕНИЕ ====================
+def apply_delta(**deltas):
+    """Прибавляет изменения к агрегатам в текущей транзакции (без commit).
+    
+    Обновление идет одним UPDATE col = col + :delta, поэтому параллельные
+    транзакции не теряют изменения друг друга. Вызов означает, что изменились
+    данные пользователей, поэтому users_version растет всегда, а version -
+    только если изменились сами агрегаты.
+    """
+    deltas = {key: value for key, value in deltas.items() if value}
+    
+    values = {key: getattr(Statistics, key) + value for key, value in deltas.items()}
+    values['users_version'] = Statistics.users_version + 1
+    if deltas:
+        values['version'] = Statistics.version + 1
+    result = db.session.execute(
+        update(Statistics).where(Statistics.id == STATISTICS_ID).values(**values)
+    )
+    if result.rowcount == 0:
+        # Строки агрегатов еще нет: считаем ее по данным, включая изменения этой транзакции
+        db.session.flush()
+        db.session.add(Statistics(id=STATISTICS_ID, **compute_statistics()))
+
+def record_user_change(before, after):
+    """before/after - результаты snapshot() до и после изменения (None - пользователя нет)"""
+    old = _contribution(before)
+    new = _contribution(after)
+    apply_delta(**{key: new.get(key, 0) - old.get(key, 0) for key in set(old) | set(new)})
+
+def record_transfer(amount, sender_role='client', receiver_role='client'):
+    # amount - в копейках
+    total_balance = 0
+    if sender_role == 'client':
+        total_balance -= amount
+    if receiver_role == 'client':
+        total_balance += amount
+    apply_delta(transfer_count=1, transfer_volume=amount, total_balance=total_balance)
+
+# ==================== ЧТЕНИЕ И ПЕРЕСЧЕТ ====================
+def compute_statistics(session=None):
+    """Полный пересчет агрегатов по таблицам users и transactions"""
+    session = session or db.session
+    is_client = (User.role == 'client')
+    users = session.query(
+        func.count(User.id),
+        func.sum(case((User.role == 'manager', 1), else_=0)),
+        func.sum(case((is_client, 1), else_=0)),
+        func.sum(case((is_client, User.balance), else_=0))
+    ).filter(User.is_active == True).one()
+    
+    transfers = session.query(
+        func.count(Transaction.id),
+        func.sum(Transaction.amount)
+    ).one()
+    # Операции, перенесенные в архив, учитываются по итогам его запусков
+    archived_count, archived_volume = archive.totals()
+    
+    return {
+        'total_users': users[0] or 0,
+        'total_managers': users[1] or 0,
+        'total_clients': users[2] or 0,
+        'total_balance': int(users[3] or 0),
+        'transfer_count': (transfers[0] or 0) + archived_count,
+        'transfer_volume': int(transfers[1] or 0) + archived_volume
+    }
+
+def get_statistics(session=None):
+    """Агрегаты для getStatistics. Только чтение: метод идет на движок чтения.
+    
+    Строку агрегатов создает запуск (ensure_statistics) или flask rebuild-stats.
+    Если ее все же нет, значения считаются по таблицам без записи, version - None.
+    """
+    statistics = (session or db.session).get(Statistics, STATISTICS_ID)
+    if statistics is None:
+        statistics = Statistics(id=STATISTICS_ID, version=None, **compute_statistics(session))
+    return statistics.to_dict()
+
+def ensure_statistics():
+    """Создает строку агрегатов при запуске, если ее нет (например, после обновления схемы)"""
+    if db.session.get(Statistics, STATISTICS_ID) is None:
+        rebuild_statistics()
+
+def get_versions(session=None):
+    """(version агрегатов, users_version) одним чтением строки, без пересчета"""
+    row = (session or db.session).execute(
+        select(Statistics.version, Statistics.users_version).where(Statistics.id == STATISTICS_ID)
+    ).first()
+    return tuple(row) if row else (None, None)
+
+def rebuild_statistics(check_only=False):
+    """Пересчитывает агрегаты с нуля. Возвращает расхождения {поле: (было, стало)}"""
+    expected = compute_statistics()
+    statistics = db.session.get(Statistics, STATISTICS_ID)
+    
+    drift = {}
+    for key in COUNTERS:
+        stored = getattr(statistics, key) if statistics is not None else None
+        if stored != expected[key]:
+            drift[key] = (stored, expected[key])
+    
+    if not check_only:
+        if statistics is None:
+            db.session.add(Statistics(id=STATISTICS_ID, **expected))
+        else:
+            for key, value in expected.items():
+                setattr(statistics, key, value)
+            if drift:
+                statistics.version = Statistics.version + 1
+        db.session.commit()
+    
+    return drift
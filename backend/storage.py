@@ -0,0 +1,175 @@
+"""Настройки хранилища: адрес базы, пул соединений и PRAGMA для SQLite.
+
+По умолчанию SQLite работает в режиме журнала отката: читатели ждут писателя,
+а параллельные воркеры получают "database is locked". Здесь каждое новое
+соединение переводится в WAL (читатели не блокируются записью) с
+synchronous=NORMAL, busy_timeout, mmap и увеличенным кэшем страниц.
+Все значения задаются переменными окружения, адрес - BANK_DATABASE_URI,
+так что приложение можно направить и на другую СУБД.
+
+Чтения можно направить на отдельный движок только для чтения (привязка
+READ_BIND): реплику из DB_READ_URI или тот же файл SQLite, открытый с
+mode=ro. Маршрут выбирает диспетчер JSON-RPC (use_route), а RoutingSession
+отправляет на движок чтения все запросы, кроме записи и flush.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+import os
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+# PRAGMA -> (переменная окружения, значение по умолчанию)
+SQLITE_PRAGMAS = {
+    'journal_mode': ('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': ('SQLITE_SYNCHRONOUS', 'NORMAL'),  # в WAL не теряет целостность, fsync только на checkpoint
+    'busy_timeout': ('SQLITE_BUSY_TIMEOUT_MS', '5000'),
+    'mmap_size': ('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)),
+    'cache_size': ('SQLITE_CACHE_SIZE', '-65536')  # отрицательное - в КиБ: 64 МиБ на соединение
+}
+
+READ_BIND = 'read'
+READ, WRITE = 'read', 'write'
+
+# Маршрут текущего вызова: свой у каждого потока и у каждой задачи asyncio
+_route = ContextVar('db_route', default=WRITE)
+
+def sqlite_pragmas():
+    return {name: os.environ.get(variable, default) for name, (variable, default) in SQLITE_PRAGMAS.items()}
+
+def read_pragmas():
+    """PRAGMA соединений только для чтения: режим журнала задает писатель"""
+    pragmas = sqlite_pragmas()
+    del pragmas['journal_mode']
+    pragmas['query_only'] = '1'
+    return pragmas
+
+def is_sqlite_file(uri):
+    url = make_url(uri)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+def engine_options(uri):
+    """Параметры create_engine для адреса базы.
+    
+    Пул считается на один процесс: каждый воркер gunicorn держит свой, поэтому
+    DB_POOL_SIZE - это число потоков воркера, а не всех воркеров вместе.
+    """
+    url = make_url(uri)
+    if url.get_backend_name() == 'sqlite' and not is_sqlite_file(uri):
+        # База в памяти живет в одном соединении - пул для нее не настраивается
+        return {}
+    
+    options = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 8)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 4)),
+        'pool_timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10))
+    }
+    if url.get_backend_name() == 'sqlite':
+        # Ожидание блокировки в драйвере совпадает с busy_timeout
+        options['connect_args'] = {'timeout': int(sqlite_pragmas()['busy_timeout']) / 1000}
+    else:
+        # Сетевые СУБД закрывают простаивающие соединения
+        options['pool_pre_ping'] = True
+        options['pool_recycle'] = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    return options
+
+def install_pragmas(engine, pragmas=None):
+    """Выставляет PRAGMA на каждом новом соединении движка SQLite"""
+    if engine.dialect.name != 'sqlite':
+        return
+    pragmas = pragmas or sqlite_pragmas()
+
+    @event.listens_for(engine, 'connect')
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name}={value}')
+        finally:
+            cursor.close()
+
+def read_uri(uri):
+    """Адрес для чтений: DB_READ_URI (реплика) или тот же файл SQLite с mode=ro.
+    None - отдельного движка нет (база в памяти или маршрутизация выключена)"""
+    if os.environ.get('DB_READ_ROUTING', '1') != '1':
+        return None
+    if os.environ.get('DB_READ_URI'):
+        return os.environ['DB_READ_URI']
+    if not is_sqlite_file(uri):
+        return None
+    url = make_url(uri)
+    database = url.database if url.query.get('uri') else f'file:{url.database}'
+    return url.set(database=database).update_query_dict({'mode': 'ro', 'uri': 'true'}).render_as_string(hide_password=False)
+
+def configure_database(app):
+    """Адрес базы и параметры движка до db.init_app"""
+    # Отдельная база (нагрузочные прогоны, проверки, другая СУБД) без правки кода
+    if os.environ.get('BANK_DATABASE_URI'):
+        app.config['SQLALCHEMY_DATABASE_URI'] = os.environ['BANK_DATABASE_URI']
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    for name, value in engine_options(app.config['SQLALCHEMY_DATABASE_URI']).items():
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'].setdefault(name, value)
+    
+    uri = read_uri(app.config['SQLALCHEMY_DATABASE_URI'])
+    if uri is not None:
+        # Свой пул: длинные отчеты не занимают соединения писателей
+        options = engine_options(uri)
+        if 'pool_size' in options:
+            options['pool_size'] = int(os.environ.get('DB_READ_POOL_SIZE', options['pool_size']))
+        options['execution_options'] = {'db_route': READ}
+        app.config.setdefault('SQLALCHEMY_BINDS', {})
+        app.config['SQLALCHEMY_BINDS'].setdefault(READ_BIND, {'url': uri, **options})
+
+def init_storage(app, db):
+    """PRAGMA для движков, созданных db.init_app"""
+    with app.app_context():
+        for key, engine in db.engines.items():
+            install_pragmas(engine, read_pragmas() if key == READ_BIND else None)
+
+# ==================== МАРШРУТИЗАЦИЯ ЧТЕНИЙ ====================
+def current_route():
+    return _route.get()
+
+@contextmanager
+def use_route(route):
+    """Запросы внутри блока идут на движок чтения (READ) или на основной (WRITE)"""
+    token = _route.set(route)
+    try:
+        yield
+    finally:
+        _route.reset(token)
+
+def routed(iterable, route=READ):
+    """Потоковый ответ: каждый шаг генератора выполняется с маршрутом route"""
+    iterator = iter(iterable)
+    while True:
+        with use_route(route):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+class RoutingSession(Session):
+    """Сессия Flask-SQLAlchemy, которая отправляет чтения на движок READ_BIND.
+    
+    Запись (INSERT/UPDATE/DELETE и flush объектов) всегда идет на основной
+    движок, даже если метод помечен как чтение: случайная запись в отчете не
+    упадет на соединении только для чтения.
+    """
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and _route.get() == READ and not self._flushing and not getattr(clause, 'is_dml', False):
+            engine = self._db.engines.get(READ_BIND)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+def storage_info(engine):
+    """Фактические настройки соединения (для проверки после запуска)"""
+    info = {'dialect': engine.dialect.name}
+    if engine.dialect.name == 'sqlite':
+        with engine.connect() as connection:
+            for name in SQLITE_PRAGMAS:
+                info[name] = connection.exec_driver_sql(f'PRAGMA {name}').scalar()
+    info['pool'] = engine.pool.status()
+    return info
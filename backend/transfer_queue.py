@@ -0,0 +1,131 @@
+"""Очередь переводов с одним писателем и групповым commit.
+
+Каждый commit в SQLite - отдельный fsync, поэтому переводы по одному упираются
+в скорость синхронизации диска. В этом режиме обработчики кладут перевод в
+очередь процесса и ждут свой результат, а поток-писатель забирает накопившиеся
+переводы пачкой (до batch_size штук или пока не пройдет max_delay секунд с
+первого) и проводит их в одной транзакции. Каждый перевод выполняется в своей
+точке сохранения: ошибка одного ("Недостаточно средств", "Получатель не найден")
+откатывает только его и возвращается его вызывающему, остальные фиксируются
+общим commit.
+"""
+import queue
+import threading
+import time
+from sqlalchemy import text
+from models import db
+from transfers import apply_transfer
+
+class PendingTransfer:
+    def __init__(self, sender_id, receiver_id, amount, description, on_applied=None):
+        self.sender_id = sender_id
+        self.receiver_id = receiver_id
+        self.amount = amount
+        self.description = description
+        self.on_applied = on_applied
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+class TransferQueue:
+    def __init__(self, app, batch_size=64, max_delay=0.002):
+        self.app = app
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.transfers = 0
+        self.failed = 0
+        self.commit_seconds = 0.0
+
+    def submit(self, sender_id, receiver_id, amount, description=None, on_applied=None):
+        """Проводит перевод через писателя; результат, ошибки и on_applied - как у transfer()"""
+        self._ensure_started()
+        item = PendingTransfer(sender_id, receiver_id, amount, description, on_applied)
+        self._queue.put(item)
+        # Без таймаута: перевод из очереди все равно будет проведен, ответ должен ему соответствовать
+        item.done.wait()
+        if item.error is not None:
+            raise item.error
+        return item.result
+
+    def _ensure_started(self):
+        # Поток создается при первом переводе - уже в процессе воркера, а не до fork
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='transfer-writer', daemon=True)
+                self._thread.start()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        with self.app.app_context():
+            while True:
+                batch = self._collect()
+                try:
+                    self._apply(batch)
+                finally:
+                    db.session.remove()
+                    for item in batch:
+                        item.done.set()
+
+    def _apply(self, batch):
+        try:
+            if db.engine.dialect.name == 'sqlite':
+                # Драйвер sqlite3 сам не открывает транзакцию перед SAVEPOINT: без BEGIN
+                # первая точка сохранения фиксировалась бы отдельно. IMMEDIATE сразу берет
+                # блокировку записи, и пачка не упадет посередине на "database is locked"
+                db.session.execute(text('BEGIN IMMEDIATE'))
+            for item in batch:
+                savepoint = db.session.begin_nested()
+                try:
+                    item.result = apply_transfer(item.sender_id, item.receiver_id, item.amount, item.description)
+                    if item.on_applied is not None:
+                        # Вызывается в потоке писателя: записи попадают в ту же точку сохранения
+                        item.on_applied(item.result)
+                    savepoint.commit()
+                except Exception as e:
+                    savepoint.rollback()
+                    item.error = e
+            started = time.perf_counter()
+            db.session.commit()
+            commit_seconds = time.perf_counter() - started
+        except Exception as e:
+            # Общий commit не прошел: не проведен ни один перевод пачки
+            db.session.rollback()
+            for item in batch:
+                item.result = None
+                item.error = item.error or e
+            commit_seconds = 0.0
+        
+        with self._lock:
+            self.batches += 1
+            self.transfers += len(batch)
+            self.failed += sum(1 for item in batch if item.error is not None)
+            self.commit_seconds += commit_seconds
+
+    def stats(self):
+        with self._lock:
+            return {
+                'batch_size': self.batch_size,
+                'max_delay_ms': round(self.max_delay * 1000, 3),
+                'batches': self.batches,
+                'transfers': self.transfers,
+                'failed': self.failed,
+                'avg_batch': round(self.transfers / self.batches, 2) if self.batches else 0.0,
+                'pending': self._queue.qsize(),
+                'commit_ms': round(self.commit_seconds * 1000, 2)
+            }
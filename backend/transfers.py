@@ -0,0 +1,207 @@
+from datetime import datetime
+import json
+from sqlalchemy import update, select, bindparam
+from models import db, User, Transaction
+from stats import record_transfer, apply_delta
+from validators import Validator
+from money import to_kopecks
+from recipients import resolve_recipients
+
+def transfer(sender_id, receiver_id, amount, description=None, on_applied=None):
+    """Переводит amount копеек одной короткой транзакцией.
+    
+    Списание - условный UPDATE ... WHERE balance >= :amount, зачисление - один
+    UPDATE balance = balance + :amount. Баланс не читается в Python перед
+    записью, поэтому параллельные переводы из разных воркеров не теряют
+    обновления и не требуют блокировок на стороне приложения.
+    Возвращает (id операции, новый баланс отправителя в копейках).
+    on_applied(результат) вызывается до commit, в той же транзакции.
+    """
+    try:
+        result = apply_transfer(sender_id, receiver_id, amount, description)
+        if on_applied is not None:
+            on_applied(result)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    
+    return result
+
+def apply_transfer(sender_id, receiver_id, amount, description=None):
+    """Изменения одного перевода в текущей транзакции (без commit)"""
+    debit = db.session.execute(
+        update(User)
+        .where(User.id == sender_id, User.is_active == True, User.balance >= amount)
+        .values(balance=User.balance - amount, version=User.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    if debit.rowcount != 1:
+        raise Exception('Недостаточно средств')
+    
+    credit = db.session.execute(
+        update(User)
+        .where(User.id == receiver_id, User.is_active == True, User.role == 'client')
+        .values(balance=User.balance + amount, version=User.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    if credit.rowcount != 1:
+        raise Exception('Получатель не найден')
+    
+    transaction = Transaction(
+        sender_id=sender_id,
+        receiver_id=receiver_id,
+        amount=amount,
+        description=description
+    )
+    db.session.add(transaction)
+    # Явный flush: id операции нужен в ответе и в событиях, не полагаемся на autoflush
+    db.session.flush()
+    record_transfer(amount)
+    transaction_id = transaction.id
+    
+    new_balance = db.session.execute(
+        select(User.balance).where(User.id == sender_id)
+    ).scalar_one()
+    return transaction_id, new_balance
+
+# ==================== МАССОВЫЕ ВЫПЛАТЫ ====================
+INSERT_CHUNK_SIZE = 1000
+
+def _chunked(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def parse_transfer_lines(lines):
+    """Разбирает JSONL-поток: строка -> {"recipient": ..., "amount": ...}.
+    Возвращает строки в том же формате, что и список transfers в bulkTransfer"""
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield {'_error': 'Некорректная строка JSON'}
+
+def bulk_transfer(source_id, rows, description=None, on_applied=None):
+    """Выплаты с одного счета многим получателям в одной транзакции.
+    
+    Строки проверяются и получатели ищутся целиком для всего списка, затем
+    списание одним условным UPDATE, зачисления и записи операций - пакетами
+    executemany и один commit. Ошибочные строки не мешают остальным и
+    возвращаются в failed с номером строки (с 1). В transactions - проведенные
+    строки (id операции, получатель, сумма, описание) для уведомлений.
+    on_applied(результат) вызывается до commit, в той же транзакции.
+    """
+    failed = []
+    candidates = []
+    for number, row in enumerate(rows, 1):
+        if not isinstance(row, dict) or '_error' in row:
+            failed.append({'row': number, 'recipient': None, 'error': row.get('_error') if isinstance(row, dict) else 'Некорректная строка'})
+            continue
+        recipient = row.get('recipient')
+        amount = row.get('amount')
+        is_valid, message = Validator.validate_amount(amount)
+        if not recipient or not isinstance(recipient, str):
+            is_valid, message = False, 'Не указан получатель'
+        if not is_valid:
+            failed.append({'row': number, 'recipient': recipient, 'error': message})
+            continue
+        candidates.append((number, recipient, to_kopecks(amount)))
+    
+    source = db.session.execute(
+        select(User.id, User.role, User.balance, User.is_active).where(User.id == source_id)
+    ).first()
+    if not source or not source.is_active:
+        raise Exception('Счет списания не найден')
+    
+    recipients = resolve_recipients({recipient for _, recipient, _ in candidates})
+    
+    # Строки принимаются по порядку, пока хватает средств на счете списания
+    accepted = []
+    total = 0
+    for number, recipient, amount in candidates:
+        receiver = recipients.get(recipient)
+        if not receiver or receiver.role != 'client' or not receiver.is_active:
+            error = 'Получатель не найден'
+        elif receiver.id == source.id:
+            error = 'Нельзя переводить самому себе'
+        elif total + amount > source.balance:
+            error = 'Недостаточно средств'
+        else:
+            accepted.append((receiver.id, recipient, amount))
+            total += amount
+            continue
+        failed.append({'row': number, 'recipient': recipient, 'error': error})
+    failed.sort(key=lambda item: item['row'])
+    
+    if not accepted:
+        return {'applied': 0, 'total': 0, 'new_balance': source.balance, 'failed': failed, 'transactions': []}
+    
+    try:
+        debit = db.session.execute(
+            update(User)
+            .where(User.id == source.id, User.is_active == True, User.balance >= total)
+            .values(balance=User.balance - total, version=User.version + 1)
+            .execution_options(synchronize_session=False)
+        )
+        if debit.rowcount != 1:
+            raise Exception('Баланс счета списания изменился во время выплаты, повторите операцию')
+        
+        credits = {}
+        for receiver_id, _, amount in accepted:
+            credits[receiver_id] = credits.get(receiver_id, 0) + amount
+        
+        users = User.__table__
+        credit = db.session.execute(
+            users.update()
+            .where(users.c.id == bindparam('receiver_id'), users.c.is_active == True)
+            .values(balance=users.c.balance + bindparam('credit'), version=users.c.version + 1),
+            [{'receiver_id': receiver_id, 'credit': amount} for receiver_id, amount in credits.items()]
+        )
+        if credit.rowcount != len(credits):
+            raise Exception('Часть получателей заблокирована во время выплаты, повторите операцию')
+        
+        created_at = datetime.utcnow()
+        transaction_rows = [{
+            'sender_id': source.id,
+            'receiver_id': receiver_id,
+            'amount': amount,
+            'description': description or f'Выплата {recipient}',
+            'created_at': created_at
+        } for receiver_id, recipient, amount in accepted]
+        transactions = []
+        insert_rows = Transaction.__table__.insert().returning(Transaction.__table__.c.id, sort_by_parameter_order=True)
+        for chunk in _chunked(transaction_rows, INSERT_CHUNK_SIZE):
+            ids = db.session.execute(insert_rows, chunk).scalars().all()
+            transactions += [
+                (transaction_id, row['receiver_id'], row['amount'], row['description'])
+                for transaction_id, row in zip(ids, chunk)
+            ]
+        
+        apply_delta(
+            transfer_count=len(accepted),
+            transfer_volume=total,
+            total_balance=total if source.role != 'client' else 0
+        )
+        new_balance = db.session.execute(
+            select(User.balance).where(User.id == source.id)
+        ).scalar_one()
+        result = {
+            'applied': len(accepted),
+            'total': total,
+            'new_balance': new_balance,
+            'failed': failed,
+            'transactions': transactions
+        }
+        if on_applied is not None:
+            on_applied(result)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    
+    return result
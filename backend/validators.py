@@ -1,4 +1,21 @@
+import math
 import re
+from decimal import Decimal, InvalidOperation
+
+# Копейки хранятся в INTEGER SQLite (до 2**63 - 1): больший баланс не записать
+MAX_BALANCE = 10 ** 15
+
+def normalize_phone(phone):
+    """Приводит телефон к виду +7XXXXXXXXXX: убирает пробелы, скобки и дефисы,
+    российский номер с 8 в начале считается тем же, что и с +7"""
+    if not phone:
+        return None
+    digits = re.sub(r'\D', '', str(phone))
+    if not digits:
+        return None
+    if len(digits) == 11 and digits[0] == '8':
+        digits = '7' + digits[1:]
+    return '+' + digits
 
 class Validator:
     @staticmethod
@@ -47,20 +64,44 @@ class Validator:
     def validate_amount(amount):
         try:
             amount_float = float(amount)
+            if not math.isfinite(amount_float):
+                return False, "Некорректная сумма"
             if amount_float <= 0:
                 return False, "Сумма должна быть положительной"
             if amount_float > 1000000:
                 return False, "Сумма не может превышать 1,000,000"
+            if Decimal(str(amount)).as_tuple().exponent < -2:
+                return False, "Сумма может содержать не больше двух знаков после запятой"
             return True, ""
-        except (ValueError, TypeError):
+        except (ValueError, TypeError, InvalidOperation):
             return False, "Некорректная сумма"
     
     @staticmethod
     def validate_balance(balance):
         try:
             balance_float = float(balance)
+            # nan и inf проходят float(), но не переводятся в копейки
+            if not math.isfinite(balance_float):
+                return False, "Некорректный баланс"
             if balance_float < 0:
                 return False, "Баланс не может быть отрицательным"
+            if balance_float > MAX_BALANCE:
+                return False, "Баланс слишком большой"
             return True, ""
         except (ValueError, TypeError):
-            return False, "Некорректный баланс"
\ No newline at end of file
+            return False, "Некорректный баланс"
+    
+    @staticmethod
+    def validate_new_user(login, password, full_name, phone, account_number, balance):
+        for field, value, validator in [
+            ('login', login, Validator.validate_login),
+            ('password', password, Validator.validate_password),
+            ('full_name', full_name, Validator.validate_full_name),
+            ('phone', phone, Validator.validate_phone),
+            ('account_number', account_number, Validator.validate_account_number),
+            ('balance', balance, Validator.validate_balance)
+        ]:
+            is_valid, message = validator(value)
+            if not is_valid:
+                return False, f'{field}: {message}'
+        return True, ""
\ No newline at end of file
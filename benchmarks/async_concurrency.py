@@ -0,0 +1,214 @@
+"""Сколько одновременных соединений выдерживает один процесс: синхронный
+воркер (WSGI, как gunicorn sync/gthread) против асинхронного режима (asgi.py).
+
+Оба режима работают в этом же процессе без сетевого сервера: WSGI-приложение
+обслуживает не больше --threads запросов одновременно (остальные ждут, как в
+очереди сокета воркера), ASGI-приложение вызывается из задач asyncio. Для каждого
+уровня параллельности - пропускная способность и p50/p99; итог - наибольшая
+параллельность, при которой p99 укладывается в --slo-ms.
+
+Запуск из корня проекта:
+    python benchmarks/async_concurrency.py --levels 1,8,32,128 --duration 5 --threads 1
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+from load_api import ROOT, CLIENT_PASSWORD, prepare_app, summarize, git_commit
+
+DEFAULT_MIX = 'getAccountInfo=4,getTransactionHistory=4,login=1'
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        mix[name.strip()] = float(weight or 1)
+    unknown = set(mix) - {'getAccountInfo', 'getTransactionHistory', 'login'}
+    if unknown:
+        raise SystemExit(f"Неизвестные операции: {', '.join(sorted(unknown))}")
+    return mix
+
+class Workload:
+    """Запросы виртуального соединения: свой клиент с готовой cookie сессии"""
+    def __init__(self, app, clients, mix, seed):
+        from models import db, User
+        self.rng = random.Random(seed)
+        self.mix = mix
+        self.names = list(mix)
+        self.weights = [mix[name] for name in self.names]
+        self.clients = clients
+        with app.app_context():
+            login, _ = self.rng.choice(clients)
+            user_id = db.session.execute(db.select(User.id).where(User.login == login)).scalar_one()
+        # Подписанная cookie вместо входа: bcrypt на каждое соединение растянул бы подготовку
+        interface = app.session_interface
+        value = interface.get_signing_serializer(app).dumps({'user_id': user_id})
+        self.cookie = f'{interface.get_cookie_name(app)}={value}'
+
+    def next_request(self):
+        name = self.rng.choices(self.names, self.weights)[0]
+        if name == 'login':
+            login, _ = self.rng.choice(self.clients)
+            params = {'login': login, 'password': CLIENT_PASSWORD}
+        elif name == 'getTransactionHistory':
+            params = {'limit': 50}
+        else:
+            params = {}
+        body = json.dumps({'jsonrpc': '2.0', 'method': name, 'params': params, 'id': 1}).encode('utf-8')
+        return name, body
+
+# ==================== СИНХРОННЫЙ ВОРКЕР ====================
+def run_wsgi(app, workloads, duration, threads):
+    capacity = threading.Semaphore(threads)
+    samples, errors = [], {}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def connection(workload):
+        client = app.test_client(use_cookies=False)
+        while time.perf_counter() < deadline:
+            _, body = workload.next_request()
+            started = time.perf_counter()
+            with capacity:
+                response = client.post('/api', data=body, content_type='application/json', headers={'Cookie': workload.cookie})
+            elapsed = time.perf_counter() - started
+            error = (response.get_json() or {}).get('error')
+            with lock:
+                samples.append(elapsed)
+                if error:
+                    errors[error['message']] = errors.get(error['message'], 0) + 1
+    
+    started = time.perf_counter()
+    pool = [threading.Thread(target=connection, args=(workload,), daemon=True) for workload in workloads]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return samples, errors, time.perf_counter() - started
+
+# ==================== АСИНХРОННЫЙ РЕЖИМ ====================
+async def asgi_request(application, body, cookie):
+    scope = {
+        'type': 'http',
+        'method': 'POST',
+        'path': '/api',
+        'query_string': b'',
+        'headers': [(b'content-type', b'application/json'), (b'cookie', cookie.encode('latin-1'))],
+        'http_version': '1.1',
+        'scheme': 'http',
+        'server': ('127.0.0.1', 80),
+        'client': ('127.0.0.1', 0)
+    }
+    received = False
+    chunks = []
+    
+    async def receive():
+        nonlocal received
+        if received:
+            return {'type': 'http.disconnect'}
+        received = True
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+    
+    async def send(message):
+        if message['type'] == 'http.response.body':
+            chunks.append(message.get('body', b''))
+    
+    await application(scope, receive, send)
+    return json.loads(b''.join(chunks))
+
+def run_asgi(application, workloads, duration):
+    samples, errors = [], {}
+    
+    async def connection(workload, deadline):
+        while time.perf_counter() < deadline:
+            _, body = workload.next_request()
+            started = time.perf_counter()
+            response = await asgi_request(application, body, workload.cookie)
+            samples.append(time.perf_counter() - started)
+            error = response.get('error')
+            if error:
+                errors[error['message']] = errors.get(error['message'], 0) + 1
+    
+    async def main():
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*(connection(workload, deadline) for workload in workloads))
+    
+    started = time.perf_counter()
+    asyncio.run(main())
+    return samples, errors, time.perf_counter() - started
+
+# ==================== ОТЧЕТ ====================
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=2000, help='синтетических клиентов')
+    parser.add_argument('--transfers', type=int, default=20000, help='переводов в истории')
+    parser.add_argument('--levels', default='1,8,32,128', help='уровни параллельности через запятую')
+    parser.add_argument('--duration', type=float, default=5.0, help='длительность каждого уровня, с')
+    parser.add_argument('--threads', type=int, default=1, help='потоков синхронного воркера (1 - gunicorn sync)')
+    parser.add_argument('--slo-ms', type=float, default=250.0, help='допустимый p99, мс')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='веса операций: метод=вес,...')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='файл результатов (по умолчанию benchmarks/results/async-<коммит>-<время>.json)')
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+    levels = [int(level) for level in args.levels.split(',')]
+    logging.getLogger('slow_requests').setLevel(logging.ERROR)
+    
+    import tempfile
+    app, clients = prepare_app(os.path.join(tempfile.mkdtemp(), 'async.db'), args.users, args.transfers, args.seed)
+    import asgi
+    
+    results = {'wsgi': {}, 'asgi': {}}
+    print(f'\nБаза для ASGI: {asgi.database.mode}, потоков синхронного воркера: {args.threads}')
+    print(f'{"режим":<6}{"соединений":>12}{"запросов":>10}{"ошибок":>8}{"rps":>10}{"p50, мс":>10}{"p99, мс":>10}')
+    for level in levels:
+        workloads = [Workload(app, clients, mix, args.seed * 100000 + level * 1000 + number) for number in range(level)]
+        for mode in ('wsgi', 'asgi'):
+            if mode == 'wsgi':
+                samples, errors, elapsed = run_wsgi(app, workloads, args.duration, args.threads)
+            else:
+                samples, errors, elapsed = run_asgi(asgi.application, workloads, args.duration)
+            result = summarize(samples, errors, elapsed)
+            results[mode][str(level)] = result
+            print(f"{mode:<6}{level:>12}{result['requests']:>10}{result['errors']:>8}{result['throughput_rps']:>10.1f}"
+                  f"{result['p50_ms']:>10.2f}{result['p99_ms']:>10.2f}")
+    
+    capacity = {
+        mode: max([int(level) for level, result in by_level.items() if result['p99_ms'] <= args.slo_ms], default=0)
+        for mode, by_level in results.items()
+    }
+    print(f"\nСоединений на процесс при p99 <= {args.slo_ms:.0f} мс: WSGI {capacity['wsgi']}, ASGI {capacity['asgi']}")
+    
+    commit = git_commit()
+    report = {
+        'meta': {
+            'commit': commit,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'cpus': os.cpu_count(),
+            'asgi_database': asgi.database.mode,
+            'wsgi_threads': args.threads,
+            'users': args.users,
+            'transfers': args.transfers,
+            'duration_seconds': args.duration,
+            'mix': mix,
+            'slo_ms': args.slo_ms,
+            'seed': args.seed
+        },
+        'results': results,
+        'connections_within_slo': capacity
+    }
+    output = args.output or os.path.join(
+        ROOT, 'benchmarks', 'results', f"async-{commit}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as output_file:
+        json.dump(report, output_file, ensure_ascii=False, indent=2)
+    print(f'Результаты: {output}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Проверка обновления схемы: база первой версии приложения (деньги в рублях во
+float, без нормализованного телефона, статистики и контрольных точек)
+создается во временном файле, обновляется upgrade_schema и сверяется с
+ожидаемым результатом.
+
+Запуск из корня проекта:
+    python benchmarks/check_upgrade.py
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from flask import Flask
+from sqlalchemy import create_engine, select
+from models import db, User, BalanceCheckpoint
+from migrations import upgrade_schema
+from validators import normalize_phone
+
+BASELINE_SCHEMA = (
+    'CREATE TABLE users ('
+    'id INTEGER PRIMARY KEY, login VARCHAR(50) NOT NULL UNIQUE, password_hash VARCHAR(128) NOT NULL, '
+    'full_name VARCHAR(100) NOT NULL, role VARCHAR(20) NOT NULL, phone VARCHAR(20), '
+    'account_number VARCHAR(20) UNIQUE, balance FLOAT, created_at DATETIME, is_active BOOLEAN)',
+    'CREATE INDEX ix_users_login ON users (login)',
+    'CREATE TABLE transactions ('
+    'id INTEGER PRIMARY KEY, sender_id INTEGER NOT NULL REFERENCES users (id), '
+    'receiver_id INTEGER NOT NULL REFERENCES users (id), amount FLOAT NOT NULL, '
+    'description VARCHAR(200), created_at DATETIME)'
+)
+BASELINE_DATA = (
+    "INSERT INTO users VALUES (1, 'client1', '-', 'Иванов Иван Иванович', 'client', '+7 (916) 111-11-11', "
+    "'40817810000000000001', 9950.5, '2025-01-01 10:00:00', 1)",
+    "INSERT INTO users VALUES (2, 'client2', '-', 'Петров Петр Петрович', 'client', '89162222222', "
+    "'40817810000000000002', 10049.5, '2025-01-01 10:00:00', 1)",
+    "INSERT INTO transactions VALUES (1, 1, 2, 49.5, 'Перевод', '2025-01-02 12:00:00')"
+)
+
+def check_upgrade(directory):
+    """Возвращает список найденных проблем (пустой - обновление корректно)"""
+    database_path = os.path.join(directory, 'baseline.db')
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{database_path}'
+    db.init_app(app)
+    
+    engine = create_engine(f'sqlite:///{database_path}')
+    try:
+        with engine.begin() as connection:
+            for statement in BASELINE_SCHEMA + BASELINE_DATA:
+                connection.exec_driver_sql(statement)
+        with app.app_context():
+            db.metadata.create_all(engine)
+            upgrade_schema(engine)
+        return upgrade_problems(engine)
+    finally:
+        engine.dispose()
+
+def upgrade_problems(engine):
+    users = User.__table__
+    problems = []
+    with engine.connect() as connection:
+        balances = dict(connection.execute(select(users.c.login, users.c.balance)).all())
+        if balances != {'client1': 995050, 'client2': 1004950}:
+            problems.append(f'Балансы не переведены в копейки: {balances}')
+        amount = connection.exec_driver_sql('SELECT amount FROM transactions WHERE id = 1').scalar()
+        if amount != 4950:
+            problems.append(f'Сумма операции не переведена в копейки: {amount}')
+        for phone, login in (('89161111111', 'client1'), ('+7 916 222-22-22', 'client2')):
+            found = connection.execute(
+                select(users.c.login).where(users.c.phone_normalized == normalize_phone(phone))
+            ).scalar()
+            if found != login:
+                problems.append(f'Получатель по телефону {phone} не найден (phone_normalized не заполнен)')
+        checkpoints = connection.execute(select(BalanceCheckpoint.user_id)).scalars().all()
+        if sorted(checkpoints) != [1, 2]:
+            problems.append(f'Начальные контрольные точки: {checkpoints}')
+    return problems
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        problems = check_upgrade(directory)
+    if problems:
+        for problem in problems:
+            print(problem)
+        sys.exit(1)
+    print('Обновление схемы с первой версии работает')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""Пропускная способность переводов: commit на каждый перевод против очереди
+с одним писателем и групповым commit (transfer_queue.py).
+
+Переводы выполняются напрямую (без HTTP) из --concurrency потоков в течение
+--duration секунд для каждого режима. --synchronous FULL показывает случай,
+когда каждый commit ждет fsync диска.
+
+Запуск из корня проекта:
+    python benchmarks/group_commit.py --concurrency 16 --duration 10 --synchronous FULL
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+
+from load_api import ROOT, summarize, git_commit
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--max-delay-ms', type=float, default=2.0)
+    parser.add_argument('--synchronous', default='NORMAL', help='PRAGMA synchronous: NORMAL или FULL')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='файл результатов (по умолчанию benchmarks/results/group-commit-<коммит>-<время>.json)')
+    args = parser.parse_args()
+    logging.getLogger('slow_requests').setLevel(logging.ERROR)
+    
+    # PRAGMA читаются из окружения при создании соединений, поэтому до импорта приложения
+    os.environ['SQLITE_SYNCHRONOUS'] = args.synchronous
+    from load_api import prepare_app
+    app, _ = prepare_app(os.path.join(tempfile.mkdtemp(), 'group-commit.db'), args.users, 0, args.seed)
+    import app as appmodule
+    from models import db, User
+    from transfers import transfer
+    
+    with app.app_context():
+        client_ids = db.session.execute(db.select(User.id).where(User.login.like('load%'))).scalars().all()
+    queue = appmodule.transfer_queue
+    queue.batch_size = args.batch_size
+    queue.max_delay = args.max_delay_ms / 1000
+    
+    results = {}
+    print(f'{"режим":<8}{"переводов":>10}{"ошибок":>8}{"в сек":>10}{"p50, мс":>10}{"p99, мс":>10}')
+    for mode, submit in (('direct', transfer), ('queue', queue.submit)):
+        samples, errors = [], {}
+        lock = threading.Lock()
+        deadline = time.perf_counter() + args.duration
+
+        def worker(number):
+            rng = random.Random(args.seed * 1000 + number)
+            with app.app_context():
+                while time.perf_counter() < deadline:
+                    sender_id, receiver_id = rng.sample(client_ids, 2)
+                    started = time.perf_counter()
+                    try:
+                        submit(sender_id, receiver_id, rng.randint(100, 10000), 'Нагрузочный перевод')
+                    except Exception as e:
+                        with lock:
+                            errors[str(e)] = errors.get(str(e), 0) + 1
+                        continue
+                    with lock:
+                        samples.append(time.perf_counter() - started)
+        
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker, args=(number,)) for number in range(args.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        result = summarize(samples, errors, time.perf_counter() - started)
+        if mode == 'queue':
+            result['queue'] = queue.stats()
+        results[mode] = result
+        print(f"{mode:<8}{result['requests']:>10}{result['errors']:>8}{result['throughput_rps']:>10.1f}"
+              f"{result['p50_ms']:>10.2f}{result['p99_ms']:>10.2f}")
+    print(f"Средний размер пачки: {results['queue']['queue']['avg_batch']}")
+    
+    commit = git_commit()
+    report = {
+        'meta': {
+            'commit': commit,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'cpus': os.cpu_count(),
+            'users': args.users,
+            'concurrency': args.concurrency,
+            'duration_seconds': args.duration,
+            'batch_size': args.batch_size,
+            'max_delay_ms': args.max_delay_ms,
+            'synchronous': args.synchronous,
+            'seed': args.seed
+        },
+        'results': results
+    }
+    output = args.output or os.path.join(
+        ROOT, 'benchmarks', 'results', f"group-commit-{commit}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as output_file:
+        json.dump(report, output_file, ensure_ascii=False, indent=2)
+    print(f'Результаты: {output}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,316 @@
+"""Нагрузочный прогон JSON-RPC API: смешанная нагрузка на /api с заданной
+параллельностью, пропускная способность и p50/p99 по методам.
+
+База создается заново во временном каталоге и заполняется bulk_seed заданного
+размера. Запросы идут через тестовый клиент Flask (--mode client) или через
+локальный WSGI-сервер по HTTP (--mode server). Результаты пишутся в JSON вместе
+с коммитом и параметрами прогона; --compare сравнивает их с прошлым прогоном.
+
+Запуск из корня проекта:
+    python benchmarks/load_api.py --users 10000 --transfers 100000 --concurrency 8 --duration 30
+    python benchmarks/load_api.py --compare benchmarks/results/load-<коммит>-<время>.json
+"""
+import argparse
+from http.client import HTTPConnection
+import json
+import logging
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'backend'))
+
+DEFAULT_MIX = 'login=1,transferMoney=4,getTransactionHistory=4,getAllUsers=1,getStatistics=2'
+CLIENT_PASSWORD = 'client'
+
+# ==================== ПОДГОТОВКА ====================
+def prepare_app(database_path, users, transfers, seed):
+    # База приложения выбирается при импорте, поэтому адрес задается до него
+    os.environ['BANK_DATABASE_URI'] = f'sqlite:///{database_path}'
+    import app as appmodule
+    from models import db, User
+    
+    app = appmodule.app
+    
+    started = time.perf_counter()
+    with app.app_context():
+        db.create_all()
+        appmodule.upgrade_schema()
+        appmodule.seed_test_data()
+        appmodule.bulk_seed(users, transfers, password=CLIENT_PASSWORD, seed=seed)
+        clients = db.session.execute(
+            db.select(User.login, User.account_number).where(User.login.like('load%'))
+        ).all()
+    print(f'База: {users} клиентов, {transfers} переводов, {time.perf_counter() - started:.1f} с')
+    return app, [(login, account_number) for login, account_number in clients]
+
+# ==================== ТРАНСПОРТ ====================
+class TestClientSession:
+    """Сессия через тестовый клиент Flask: без сети, cookie хранит сам клиент"""
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def call(self, method, params):
+        response = self.client.post('/api', json={'jsonrpc': '2.0', 'method': method, 'params': params, 'id': 1})
+        return response.status_code, response.get_json()
+
+class HTTPSession:
+    """Сессия по HTTP к локальному серверу с cookie сессии Flask"""
+    def __init__(self, port):
+        self.connection = HTTPConnection('127.0.0.1', port, timeout=60)
+        self.cookie = None
+
+    def call(self, method, params):
+        body = json.dumps({'jsonrpc': '2.0', 'method': method, 'params': params, 'id': 1})
+        headers = {'Content-Type': 'application/json'}
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        self.connection.request('POST', '/api', body=body, headers=headers)
+        response = self.connection.getresponse()
+        data = response.read()
+        cookie = response.getheader('Set-Cookie')
+        if cookie:
+            self.cookie = cookie.split(';', 1)[0]
+        return response.status, json.loads(data) if data else None
+
+def start_server(app):
+    from werkzeug.serving import make_server
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# ==================== НАГРУЗКА ====================
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        mix[name.strip()] = float(weight or 1)
+    unknown = set(mix) - set(OPERATIONS)
+    if unknown:
+        raise SystemExit(f"Неизвестные операции: {', '.join(sorted(unknown))}. Доступны: {', '.join(OPERATIONS)}")
+    return mix
+
+def op_login(worker):
+    login, _ = worker.rng.choice(worker.clients)
+    return worker.new_session().call('login', {'login': login, 'password': CLIENT_PASSWORD})
+
+def op_transfer(worker):
+    _, account_number = worker.rng.choice(worker.clients)
+    if account_number == worker.account_number:
+        account_number = worker.clients[0][1] if worker.clients[0][1] != account_number else worker.clients[1][1]
+    return worker.client.call('transferMoney', {'recipient': account_number, 'amount': worker.rng.randint(1, 100)})
+
+def op_history(worker):
+    return worker.client.call('getTransactionHistory', {'limit': 50})
+
+def op_all_users(worker):
+    return worker.manager.call('getAllUsers', {'limit': 50, 'sort': worker.rng.choice(['id', '-balance', 'full_name'])})
+
+def op_statistics(worker):
+    return worker.manager.call('getStatistics', {})
+
+OPERATIONS = {
+    'login': op_login,
+    'transferMoney': op_transfer,
+    'getTransactionHistory': op_history,
+    'getAllUsers': op_all_users,
+    'getStatistics': op_statistics
+}
+
+class Worker(threading.Thread):
+    """Виртуальный пользователь: своя сессия клиента и менеджера, операции по весам"""
+    def __init__(self, number, new_session, clients, mix, requests, seed):
+        super().__init__(daemon=True)
+        self.rng = random.Random(seed * 1000 + number)
+        self.new_session = new_session
+        self.clients = clients
+        self.mix = mix
+        self.deadline = None
+        self.requests = requests
+        self.samples = {name: [] for name in mix}
+        self.errors = {name: {} for name in mix}
+        
+        login, self.account_number = self.rng.choice(clients)
+        self.client = new_session()
+        self.client.call('login', {'login': login, 'password': CLIENT_PASSWORD})
+        self.manager = new_session()
+        self.manager.call('login', {'login': 'admin1', 'password': 'admin123'})
+
+    def run(self):
+        names = list(self.mix)
+        weights = [self.mix[name] for name in names]
+        done = 0
+        while time.perf_counter() < self.deadline and (self.requests is None or done < self.requests):
+            name = self.rng.choices(names, weights)[0]
+            started = time.perf_counter()
+            try:
+                status, body = OPERATIONS[name](self)
+                error = body.get('error', {}).get('message') if isinstance(body, dict) else None
+                if status >= 500 and not error:
+                    error = f'HTTP {status}'
+            except Exception as e:
+                error = f'{type(e).__name__}: {e}'
+            self.samples[name].append(time.perf_counter() - started)
+            if error:
+                self.errors[name][error] = self.errors[name].get(error, 0) + 1
+            done += 1
+
+# ==================== РЕЗУЛЬТАТЫ ====================
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def summarize(samples, errors, elapsed):
+    values = sorted(samples)
+    error_count = sum(errors.values())
+    return {
+        'requests': len(values),
+        'errors': error_count,
+        'error_messages': dict(sorted(errors.items(), key=lambda item: -item[1])[:5]),
+        'throughput_rps': round(len(values) / elapsed, 2),
+        'mean_ms': round(sum(values) / len(values) * 1000, 3) if values else 0.0,
+        'p50_ms': round(percentile(values, 0.50) * 1000, 3),
+        'p90_ms': round(percentile(values, 0.90) * 1000, 3),
+        'p99_ms': round(percentile(values, 0.99) * 1000, 3),
+        'max_ms': round(values[-1] * 1000, 3) if values else 0.0
+    }
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def compare(current, baseline_path):
+    """Печатает изменение пропускной способности и задержек относительно прошлого прогона"""
+    with open(baseline_path, encoding='utf-8') as baseline_file:
+        baseline = json.load(baseline_file)
+    print(f"\nСравнение с {baseline['meta']['commit']} ({baseline_path}):")
+    print(f'{"метод":<24}{"rps":>18}{"p50, мс":>22}{"p99, мс":>22}')
+
+    def change(old, new):
+        percent = (new - old) / old * 100 if old else 0.0
+        return f'{old:.1f} -> {new:.1f} ({percent:+.0f}%)'
+    
+    for name, result in current['results'].items():
+        old = baseline['results'].get(name)
+        if not old:
+            continue
+        print(f"{name:<24}{change(old['throughput_rps'], result['throughput_rps']):>18}"
+              f"{change(old['p50_ms'], result['p50_ms']):>22}{change(old['p99_ms'], result['p99_ms']):>22}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=2000, help='синтетических клиентов')
+    parser.add_argument('--transfers', type=int, default=20000, help='переводов в истории')
+    parser.add_argument('--concurrency', type=int, default=4, help='параллельных виртуальных пользователей')
+    parser.add_argument('--duration', type=float, default=10.0, help='длительность прогона, с')
+    parser.add_argument('--requests', type=int, help='запросов на пользователя (вместо длительности)')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='веса операций: метод=вес,...')
+    parser.add_argument('--mode', choices=('client', 'server'), default='client', help='тестовый клиент Flask или HTTP к локальному серверу')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='файл результатов (по умолчанию benchmarks/results/load-<коммит>-<время>.json)')
+    parser.add_argument('--compare', help='прошлый файл результатов для сравнения')
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+    # Журналы запросов и медленных вызовов только мешают читать итог
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    logging.getLogger('slow_requests').setLevel(logging.ERROR)
+    
+    directory = tempfile.mkdtemp()
+    app, clients = prepare_app(os.path.join(directory, 'load.db'), args.users, args.transfers, args.seed)
+    from metrics import metrics
+    from serialization import encoder_name
+    
+    server = None
+    if args.mode == 'server':
+        server = start_server(app)
+        port = server.server_port
+        new_session = lambda: HTTPSession(port)
+    else:
+        new_session = lambda: TestClientSession(app)
+    
+    # Вход виртуальных пользователей в замер не попадает
+    workers = [
+        Worker(number, new_session, clients, mix, args.requests, args.seed)
+        for number in range(args.concurrency)
+    ]
+    duration = args.duration if args.requests is None else float('inf')
+    metrics.reset()
+    started = time.perf_counter()
+    for worker in workers:
+        worker.deadline = started + duration
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    if server:
+        server.shutdown()
+    
+    results = {}
+    all_samples = []
+    all_errors = {}
+    for name in mix:
+        samples = [value for worker in workers for value in worker.samples[name]]
+        errors = {}
+        for worker in workers:
+            for message, count in worker.errors[name].items():
+                errors[message] = errors.get(message, 0) + count
+                all_errors[message] = all_errors.get(message, 0) + count
+        results[name] = summarize(samples, errors, elapsed)
+        all_samples.extend(samples)
+    total = summarize(all_samples, all_errors, elapsed)
+    
+    commit = git_commit()
+    report = {
+        'meta': {
+            'commit': commit,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'json_encoder': encoder_name(),
+            'mode': args.mode,
+            'concurrency': args.concurrency,
+            'users': args.users,
+            'transfers': args.transfers,
+            'duration_seconds': round(elapsed, 2),
+            'mix': mix,
+            'seed': args.seed
+        },
+        'results': results,
+        'total': total,
+        # Что делал сервер за время прогона: SQL-запросы и bcrypt по методам
+        'server_metrics': metrics.snapshot()['methods']
+    }
+    
+    print(f'\n{"метод":<24}{"запросов":>10}{"ошибок":>8}{"rps":>10}{"p50, мс":>10}{"p99, мс":>10}')
+    for name, result in [*results.items(), ('всего', total)]:
+        print(f"{name:<24}{result['requests']:>10}{result['errors']:>8}{result['throughput_rps']:>10.1f}"
+              f"{result['p50_ms']:>10.2f}{result['p99_ms']:>10.2f}")
+    
+    output = args.output or os.path.join(
+        ROOT, 'benchmarks', 'results', f"load-{commit}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as output_file:
+        json.dump(report, output_file, ensure_ascii=False, indent=2)
+    print(f'\nРезультаты: {output}')
+    
+    if args.compare:
+        compare(report, args.compare)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Сравнение сериализации списков: to_dict + jsonify по умолчанию против быстрого
+кодировщика (orjson или json без экранирования) и выборки только нужных полей.
+
+Для каждого варианта - размер ответа и время на 10 000 строк (выборка из базы +
+формирование словарей + кодирование), лучшее из нескольких повторов.
+
+Запуск из корня проекта:
+    python benchmarks/serialization.py --rows 10000 --repeat 5
+"""
+import argparse
+from datetime import datetime, timedelta
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from models import db, User, Transaction
+from serialization import ENCODERS, pack_rows, orjson
+
+USER_FIELDS = ['id', 'full_name', 'balance']
+TRANSACTION_FIELDS = ['id', 'amount', 'created_at']
+
+def create_app(database_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{database_path}'
+    db.init_app(app)
+    return app
+
+def prepare(rows):
+    start = datetime(2025, 1, 1)
+    users = [{
+        'login': f'bench{i}',
+        'password_hash': '-',
+        'full_name': f'Тестов Тест Тестович {i}',
+        'role': 'client',
+        'phone': f'+7916{i:07d}',
+        'phone_normalized': f'+7916{i:07d}',
+        'account_number': f'BENCH{i:09d}',
+        'balance': 1000000 + i,
+        'created_at': start + timedelta(seconds=i),
+        'is_active': True
+    } for i in range(rows)]
+    db.session.execute(User.__table__.insert(), users)
+    transactions = [{
+        'sender_id': i % rows + 1,
+        'receiver_id': (i + 1) % rows + 1,
+        'amount': 100 + i,
+        'description': f'Перевод {i}',
+        'created_at': start + timedelta(seconds=i)
+    } for i in range(rows)]
+    db.session.execute(Transaction.__table__.insert(), transactions)
+    db.session.commit()
+
+def full_users():
+    return [user.to_dict() for user in User.query.all()]
+
+def sparse_users():
+    rows = db.session.execute(db.select(*(getattr(User, name) for name in USER_FIELDS))).all()
+    return pack_rows(rows, USER_FIELDS)
+
+def full_transactions():
+    return [transaction.to_dict() for transaction in Transaction.query.all()]
+
+def sparse_transactions():
+    rows = db.session.execute(db.select(*(getattr(Transaction, name) for name in TRANSACTION_FIELDS))).all()
+    return pack_rows(rows, TRANSACTION_FIELDS)
+
+def measure(load, encode, repeat):
+    best = None
+    for _ in range(repeat):
+        db.session.expunge_all()
+        started = time.perf_counter()
+        body = encode(load())
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return len(body), best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as directory:
+        app = create_app(os.path.join(directory, 'bench.db'))
+        # Так кодирует jsonify по умолчанию: сортировка ключей и \\u-экранирование кириллицы
+        default_provider = DefaultJSONProvider(app)
+        encoders = {
+            'jsonify': lambda payload: default_provider.dumps(payload, separators=(',', ':')).encode('utf-8'),
+            'stdlib': ENCODERS['stdlib']
+        }
+        if orjson is not None:
+            encoders['orjson'] = ENCODERS['orjson']
+        
+        with app.app_context():
+            db.create_all()
+            prepare(args.rows)
+            
+            scale = 10000 / args.rows
+            print(f'{"список":<14}{"поля":<8}{"кодировщик":<12}{"байт/10K":>12}{"мс/10K":>10}')
+            for name, full, sparse in (
+                ('users', full_users, sparse_users),
+                ('transactions', full_transactions, sparse_transactions)
+            ):
+                for selection, load in (('все', full), ('3', sparse)):
+                    for encoder_name, encode in encoders.items():
+                        size, seconds = measure(load, encode, args.repeat)
+                        print(f'{name:<14}{selection:<8}{encoder_name:<12}{int(size * scale):>12}{seconds * 1000 * scale:>10.1f}')
+
+if __name__ == '__main__':
+    main()
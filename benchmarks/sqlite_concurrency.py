@@ -0,0 +1,191 @@
+"""Параллельное чтение и запись в SQLite: настройки по умолчанию против storage.py.
+
+Несколько процессов (как воркеры gunicorn) одновременно пишут переводы
+(два UPDATE баланса + INSERT операции в одной транзакции) и читают историю
+(последние 50 операций клиента с именем контрагента). Для каждой конфигурации
+база создается заново: "default" - create_engine без параметров (журнал отката),
+"tuned" - параметры движка и PRAGMA из storage.py (WAL, synchronous=NORMAL,
+busy_timeout, mmap, кэш). Считаются операции в секунду, p50/p99 и ошибки
+("database is locked").
+
+Запуск из корня проекта:
+    python benchmarks/sqlite_concurrency.py --readers 4 --writers 2 --duration 10
+"""
+import argparse
+from datetime import datetime, timedelta
+import json
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+from load_api import ROOT, summarize, git_commit
+
+from sqlalchemy import create_engine, text
+from storage import engine_options, install_pragmas, storage_info
+
+HISTORY_SQL = text(
+    'SELECT t.id, t.amount, t.created_at, u.full_name FROM transactions t '
+    'JOIN users u ON u.id = t.receiver_id '
+    'WHERE t.sender_id = :user_id ORDER BY t.created_at DESC, t.id DESC LIMIT 50'
+)
+DEBIT_SQL = text('UPDATE users SET balance = balance - :amount WHERE id = :user_id AND balance >= :amount')
+CREDIT_SQL = text('UPDATE users SET balance = balance + :amount WHERE id = :user_id')
+INSERT_SQL = text(
+    'INSERT INTO transactions (sender_id, receiver_id, amount, description, created_at) '
+    'VALUES (:sender_id, :receiver_id, :amount, :description, :created_at)'
+)
+
+def make_engine(uri, config):
+    if config == 'tuned':
+        engine = create_engine(uri, **engine_options(uri))
+        install_pragmas(engine)
+        return engine
+    engine = create_engine(uri)
+    with engine.begin() as connection:
+        # Режим журнала хранится в файле: для базовой конфигурации явно прежний
+        connection.exec_driver_sql('PRAGMA journal_mode=DELETE')
+    return engine
+
+def prepare(path, users, transfers, seed):
+    from models import db
+    engine = create_engine(f'sqlite:///{path}')
+    db.metadata.create_all(engine)
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 1)
+    with engine.begin() as connection:
+        connection.execute(db.metadata.tables['users'].insert(), [{
+            'login': f'bench{i}',
+            'password_hash': '-',
+            'full_name': f'Тестов Тест Тестович {i}',
+            'role': 'client',
+            'phone': f'+7916{i:07d}',
+            'phone_normalized': f'+7916{i:07d}',
+            'account_number': f'BENCH{i:09d}',
+            'balance': 10 ** 9,
+            'created_at': start,
+            'is_active': True
+        } for i in range(users)])
+        connection.execute(db.metadata.tables['transactions'].insert(), [{
+            'sender_id': rng.randint(1, users),
+            'receiver_id': rng.randint(1, users),
+            'amount': rng.randint(100, 100000),
+            'description': 'Перевод',
+            'created_at': start + timedelta(seconds=i * 60)
+        } for i in range(transfers)])
+    engine.dispose()
+
+def worker(role, uri, config, users, duration, seed, results):
+    engine = make_engine(uri, config)
+    rng = random.Random(seed)
+    samples, errors = [], {}
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        user_id = rng.randint(1, users)
+        started = time.perf_counter()
+        try:
+            if role == 'reader':
+                with engine.connect() as connection:
+                    connection.execute(HISTORY_SQL, {'user_id': user_id}).all()
+            else:
+                receiver_id = rng.randint(1, users)
+                amount = rng.randint(100, 10000)
+                with engine.begin() as connection:
+                    connection.execute(DEBIT_SQL, {'user_id': user_id, 'amount': amount})
+                    connection.execute(CREDIT_SQL, {'user_id': receiver_id, 'amount': amount})
+                    connection.execute(INSERT_SQL, {
+                        'sender_id': user_id,
+                        'receiver_id': receiver_id,
+                        'amount': amount,
+                        'description': 'Перевод',
+                        'created_at': datetime.utcnow()
+                    })
+        except Exception as e:
+            message = str(getattr(e, 'orig', e))
+            errors[message] = errors.get(message, 0) + 1
+            continue
+        samples.append(time.perf_counter() - started)
+    engine.dispose()
+    results.put((role, samples, errors))
+
+def run(config, args, directory):
+    path = os.path.join(directory, f'{config}.db')
+    prepare(path, args.users, args.transfers, args.seed)
+    uri = f'sqlite:///{path}'
+    
+    results = multiprocessing.Queue()
+    roles = ['reader'] * args.readers + ['writer'] * args.writers
+    processes = [
+        multiprocessing.Process(target=worker, args=(role, uri, config, args.users, args.duration, args.seed + number, results))
+        for number, role in enumerate(roles)
+    ]
+    started = time.perf_counter()
+    for process in processes:
+        process.start()
+    collected = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - started
+    
+    report = {}
+    for role in ('reader', 'writer'):
+        samples = [sample for name, values, _ in collected if name == role for sample in values]
+        errors = {}
+        for name, _, role_errors in collected:
+            if name == role:
+                for message, count in role_errors.items():
+                    errors[message] = errors.get(message, 0) + count
+        report[role] = summarize(samples, errors, elapsed)
+    
+    engine = make_engine(uri, config)
+    report['storage'] = {key: value for key, value in storage_info(engine).items() if key != 'pool'}
+    engine.dispose()
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--transfers', type=int, default=100000)
+    parser.add_argument('--readers', type=int, default=4, help='процессов-читателей')
+    parser.add_argument('--writers', type=int, default=2, help='процессов-писателей')
+    parser.add_argument('--duration', type=float, default=10.0, help='длительность прогона каждой конфигурации, с')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='файл результатов (по умолчанию benchmarks/results/sqlite-<коммит>-<время>.json)')
+    args = parser.parse_args()
+    
+    results = {}
+    print(f'{"конфигурация":<14}{"роль":<8}{"операций":>10}{"ошибок":>8}{"оп/с":>10}{"p50, мс":>10}{"p99, мс":>10}')
+    with tempfile.TemporaryDirectory() as directory:
+        for config in ('default', 'tuned'):
+            results[config] = run(config, args, directory)
+            for role in ('reader', 'writer'):
+                result = results[config][role]
+                print(f"{config:<14}{role:<8}{result['requests']:>10}{result['errors']:>8}{result['throughput_rps']:>10.1f}"
+                      f"{result['p50_ms']:>10.2f}{result['p99_ms']:>10.2f}")
+    
+    commit = git_commit()
+    report = {
+        'meta': {
+            'commit': commit,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'cpus': os.cpu_count(),
+            'users': args.users,
+            'transfers': args.transfers,
+            'readers': args.readers,
+            'writers': args.writers,
+            'duration_seconds': args.duration,
+            'seed': args.seed
+        },
+        'results': results
+    }
+    output = args.output or os.path.join(
+        ROOT, 'benchmarks', 'results', f"sqlite-{commit}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as output_file:
+        json.dump(report, output_file, ensure_ascii=False, indent=2)
+    print(f'Результаты: {output}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""Нагрузочная проверка движка переводов: параллельные процессы переводят деньги
+между небольшим числом "горячих" счетов, после чего проверяется, что деньги
+не появились и не исчезли.
+
+Запуск из корня проекта:
+    python benchmarks/stress_transfers.py --workers 8 --transfers 500 --accounts 10
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from flask import Flask
+from sqlalchemy import func
+from sqlalchemy.exc import OperationalError
+from models import db, User, Transaction
+from stats import rebuild_statistics, snapshot, record_user_change
+from transfers import transfer
+
+def create_app(database_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{database_path}'
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 60}}
+    db.init_app(app)
+    return app
+
+def prepare(database_path, accounts, balance):
+    app = create_app(database_path)
+    with app.app_context():
+        db.create_all()
+        for i in range(accounts):
+            user = User(
+                login=f'stress{i}',
+                password_hash='-',
+                full_name=f'Stress {i}',
+                role='client',
+                account_number=f'ACC{i + 1:06d}',
+                balance=balance
+            )
+            db.session.add(user)
+            record_user_change(None, snapshot(user))
+        db.session.commit()
+        return [user_id for (user_id,) in db.session.query(User.id).order_by(User.id)]
+
+def worker(database_path, account_ids, transfers, seed, results):
+    app = create_app(database_path)
+    rng = random.Random(seed)
+    done = rejected = retries = 0
+    with app.app_context():
+        for _ in range(transfers):
+            sender, receiver = rng.sample(account_ids, 2)
+            amount = rng.randint(1, 5000)
+            while True:
+                try:
+                    transfer(sender, receiver, amount, description='stress')
+                    done += 1
+                except OperationalError:
+                    retries += 1
+                    continue
+                except Exception:
+                    rejected += 1
+                break
+    results.put((done, rejected, retries))
+
+def check(database_path, balance, initial_total, expected_transactions):
+    app = create_app(database_path)
+    errors = []
+    with app.app_context():
+        total = db.session.query(func.sum(User.balance)).scalar()
+        if total != initial_total:
+            errors.append(f'сумма балансов {total} != {initial_total}')
+        
+        negative = db.session.query(func.count(User.id)).filter(User.balance < 0).scalar()
+        if negative:
+            errors.append(f'отрицательных балансов: {negative}')
+        
+        count = db.session.query(func.count(Transaction.id)).scalar()
+        if count != expected_transactions:
+            errors.append(f'операций в журнале {count}, успешных переводов {expected_transactions}')
+        
+        # Баланс каждого счета должен сходиться с журналом операций
+        for user in User.query.all():
+            incoming = db.session.query(func.coalesce(func.sum(Transaction.amount), 0)).filter(Transaction.receiver_id == user.id).scalar()
+            outgoing = db.session.query(func.coalesce(func.sum(Transaction.amount), 0)).filter(Transaction.sender_id == user.id).scalar()
+            if user.balance != balance + incoming - outgoing:
+                errors.append(f'счет {user.id}: баланс {user.balance} не сходится с журналом')
+        
+        drift = rebuild_statistics(check_only=True)
+        if drift:
+            errors.append(f'расхождение агрегатов: {drift}')
+    return errors
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--transfers', type=int, default=300, help='переводов на процесс')
+    parser.add_argument('--accounts', type=int, default=10)
+    parser.add_argument('--balance', type=int, default=20000, help='начальный баланс счета в копейках')
+    args = parser.parse_args()
+    
+    database_path = os.path.join(tempfile.mkdtemp(), 'stress.db')
+    account_ids = prepare(database_path, args.accounts, args.balance)
+    initial_total = args.accounts * args.balance
+    
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=worker, args=(database_path, account_ids, args.transfers, seed, results))
+        for seed in range(args.workers)
+    ]
+    started = time.perf_counter()
+    for process in processes:
+        process.start()
+    totals = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - started
+    
+    done = sum(t[0] for t in totals)
+    rejected = sum(t[1] for t in totals)
+    retries = sum(t[2] for t in totals)
+    print(f'Процессов: {args.workers}, переводов: {done} успешно, {rejected} отклонено, {retries} повторов')
+    print(f'Время: {elapsed:.2f} с, {done / elapsed:.0f} переводов/с')
+    
+    errors = check(database_path, args.balance, initial_total, done)
+    if errors:
+        print('ОШИБКА:')
+        for error in errors:
+            print(f'  {error}')
+        sys.exit(1)
+    print('OK: балансы сохранены, журнал и агрегаты сходятся')
+
+if __name__ == '__main__':
+    main()
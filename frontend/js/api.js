@@ -40,6 +40,46 @@ class BankAPI {
         }
     }
 
+    // Пакетный вызов: несколько методов за один HTTP-запрос.
+    // calls - массив [method, params], результат - массив {result} или {error} в том же порядке
+    async batch(calls) {
+        const requests = calls.map(([method, params = {}]) => ({
+            jsonrpc: "2.0",
+            method: method,
+            params: params,
+            id: this.requestId++
+        }));
+
+        try {
+            const response = await fetch(this.baseUrl, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json'
+                },
+                body: JSON.stringify(requests),
+                credentials: 'include'
+            });
+
+            if (!response.ok) {
+                throw new Error(`HTTP error: ${response.status}`);
+            }
+
+            const data = await response.json();
+
+            if (!Array.isArray(data)) {
+                throw new Error(data.error ? data.error.message : 'Некорректный ответ сервера');
+            }
+
+            const byId = new Map(data.map(item => [item.id, item]));
+            return requests.map(request => byId.get(request.id) || {
+                error: { message: 'Нет ответа сервера' }
+            });
+        } catch (error) {
+            console.error('API Error:', error);
+            throw error;
+        }
+    }
+
     async login(login, password) {
         return await this.call('login', { login, password });
     }
@@ -56,16 +96,47 @@ class BankAPI {
         return await this.call('getAccountInfo');
     }
 
-    async getTransactionHistory() {
-        return await this.call('getTransactionHistory');
+    async getTransactionHistory(params = {}) {
+        return await this.call('getTransactionHistory', params);
+    }
+
+    async getBalanceAt(date, userId) {
+        return await this.call('getBalanceAt', { date, userId });
+    }
+
+    async getBalanceSeries(params = {}) {
+        return await this.call('getBalanceSeries', params);
     }
 
     async transferMoney(params) {
         return await this.call('transferMoney', params);
     }
 
-    async getAllUsers() {
-        return await this.call('getAllUsers');
+    async resolveRecipient(recipient) {
+        return await this.call('resolveRecipient', { recipient });
+    }
+
+    async bulkTransfer(sourceAccount, transfers, description) {
+        return await this.call('bulkTransfer', { sourceAccount, transfers, description });
+    }
+
+    exportTransactionsUrl(params = {}) {
+        // Выгрузка отдается потоком как файл, поэтому это ссылка, а не вызов RPC
+        const query = new URLSearchParams(params).toString();
+        return `${this.baseUrl}/export/transactions${query ? '?' + query : ''}`;
+    }
+
+    subscribeEvents(handlers) {
+        // Поток событий клиента: balance и transaction. EventSource сам переподключается
+        const source = new EventSource(`${this.baseUrl}/events`, { withCredentials: true });
+        Object.entries(handlers).forEach(([type, handler]) => {
+            source.addEventListener(type, (event) => handler(JSON.parse(event.data)));
+        });
+        return source;
+    }
+
+    async getAllUsers(params = {}) {
+        return await this.call('getAllUsers', params);
     }
 
     async createUser(userData) {
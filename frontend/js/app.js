@@ -3,6 +3,18 @@ class BankApp {
         this.api = window.bankAPI;
         this.currentUser = null;
         this.editingUserId = null;
+        this.historyCursor = null;
+        this.historyPageSize = 50;
+        this.usersCursor = null;
+        this.usersPageSize = 50;
+        this.usersById = new Map();
+        this.usersSearchTimer = null;
+        // Версии уже показанных данных: сервер отвечает notModified, если они не изменились
+        this.versions = {};
+        // Поток событий: баланс и новые операции приходят сами, без повторных запросов
+        this.events = null;
+        // Поток событий сервер включает только там, где он не занимает воркер (см. login/verifyToken)
+        this.eventsEnabled = false;
     }
 
     init() {
@@ -34,6 +46,7 @@ class BankApp {
         try {
             const result = await this.api.verifyToken();
             if (result.valid) {
+                this.eventsEnabled = Boolean(result.events);
                 const user = await this.api.getAccountInfo();
                 this.currentUser = user;
                 localStorage.setItem('user', JSON.stringify(user));
@@ -58,15 +71,43 @@ class BankApp {
             document.getElementById('clientInterface').classList.remove('hidden');
             document.getElementById('managerInterface').classList.add('hidden');
             this.loadClientData();
+            if (this.eventsEnabled) {
+                this.openEvents();
+            }
         }
     }
 
+    openEvents() {
+        this.closeEvents();
+        this.events = this.api.subscribeEvents({
+            balance: (data) => {
+                // Событие могло прийти позже ответа getAccountInfo с более новой версией
+                if (this.versions.account && data.version < this.versions.account) return;
+                document.getElementById('balanceAmount').textContent = data.balance.toFixed(2) + ' ₽';
+            },
+            transaction: () => this.loadTransactionHistory()
+        });
+    }
+
+    closeEvents() {
+        if (this.events) {
+            this.events.close();
+            this.events = null;
+        }
+    }
+
+    eventsConnected() {
+        return this.events && this.events.readyState === EventSource.OPEN;
+    }
+
     showLogin() {
         document.getElementById('loginSection').classList.remove('hidden');
         document.getElementById('clientInterface').classList.add('hidden');
         document.getElementById('managerInterface').classList.add('hidden');
         document.getElementById('loginForm').reset();
         this.clearValidationErrors(['login', 'password']);
+        this.versions = {};
+        this.closeEvents();
     }
 
     showUserInfo() {
@@ -86,30 +127,87 @@ class BankApp {
 
     async loadManagerData() {
         try {
-            await this.loadAllUsers();
-            await this.loadStatistics();
+            const usersParams = this.usersFilterParams();
+            const usersKey = JSON.stringify(usersParams);
+            if (this.versions.usersKey === usersKey && !this.usersCursor) {
+                usersParams.ifVersion = this.versions.users;
+            }
+            
+            const [users, stats] = await this.api.batch([
+                ['getAllUsers', usersParams],
+                ['getStatistics', { ifVersion: this.versions.stats }]
+            ]);
+            
+            if (users.error) {
+                this.showUsersError();
+            } else if (!users.result.notModified) {
+                this.updateUsersTable(users.result.users, users.result.next_cursor);
+                this.versions.users = users.result.version;
+                this.versions.usersKey = usersKey;
+            }
+            
+            if (stats.error) {
+                document.getElementById('statsSection').style.display = 'none';
+            } else if (!stats.result.notModified) {
+                this.updateStatistics(stats.result);
+                this.versions.stats = stats.result.version;
+            }
         } catch (error) {
             this.showError('Ошибка загрузки данных');
         }
     }
 
-    async loadAllUsers() {
+    usersFilterParams() {
+        const params = {
+            limit: this.usersPageSize,
+            sort: document.getElementById('userSort').value
+        };
+        const query = document.getElementById('userSearch').value.trim();
+        const role = document.getElementById('userRoleFilter').value;
+        const minBalance = document.getElementById('userMinBalance').value;
+        const maxBalance = document.getElementById('userMaxBalance').value;
+        
+        if (query) params.query = query;
+        if (role) params.role = role;
+        if (minBalance !== '') params.minBalance = minBalance;
+        if (maxBalance !== '') params.maxBalance = maxBalance;
+        return params;
+    }
+
+    async loadAllUsers(append = false) {
         try {
-            const users = await this.api.getAllUsers();
-            this.updateUsersTable(users);
+            const params = this.usersFilterParams();
+            if (append && this.usersCursor) {
+                params.cursor = this.usersCursor;
+            }
+            const page = await this.api.getAllUsers(params);
+            this.updateUsersTable(page.users, page.next_cursor, append);
+            // Версия относится к первой странице с этими фильтрами
+            this.versions.usersKey = append ? null : JSON.stringify(params);
+            this.versions.users = page.version;
         } catch (error) {
-            document.getElementById('usersTableBody').innerHTML = `
-                <tr>
-                    <td colspan="7" class="error-table">Ошибка загрузки</td>
-                </tr>
-            `;
+            this.showUsersError();
         }
     }
 
-    updateUsersTable(users) {
+    showUsersError() {
+        document.getElementById('usersTableBody').innerHTML = `
+            <tr>
+                <td colspan="7" class="error-table">Ошибка загрузки</td>
+            </tr>
+        `;
+    }
+
+    updateUsersTable(users, nextCursor = null, append = false) {
         const tbody = document.getElementById('usersTableBody');
+        const more = document.getElementById('usersMore');
+        this.usersCursor = nextCursor;
+        more.innerHTML = '';
+        if (!append) {
+            this.usersById.clear();
+        }
         
-        if (!users || users.length === 0) {
+        if (!append && (!users || users.length === 0)) {
             tbody.innerHTML = `
                 <tr>
                     <td colspan="7" class="empty-table">Нет пользователей</td>
@@ -120,6 +218,7 @@ class BankApp {
         
         let html = '';
         users.forEach(user => {
+            this.usersById.set(user.id, user);
             html += `
                 <tr data-user-id="${user.id}">
                     <td>${user.login}</td>
@@ -144,49 +243,91 @@ class BankApp {
             `;
         });
         
-        tbody.innerHTML = html;
-        this.setupUserActions();
+        if (append) {
+            tbody.insertAdjacentHTML('beforeend', html);
+        } else {
+            tbody.innerHTML = html;
+        }
+        
+        if (nextCursor) {
+            more.innerHTML = `
+                <button id="loadMoreUsers" class="btn btn-secondary btn-sm">
+                    Показать ещё
+                </button>
+            `;
+            document.getElementById('loadMoreUsers').addEventListener('click', () => {
+                this.loadAllUsers(true);
+            });
+        }
     }
 
     async loadStatistics() {
         try {
             const stats = await this.api.getStatistics();
-            document.getElementById('totalUsers').textContent = stats.total_users;
-            document.getElementById('totalManagers').textContent = stats.total_managers;
-            document.getElementById('totalClients').textContent = stats.total_clients;
-            document.getElementById('totalBalance').textContent = stats.total_balance.toFixed(2) + ' ₽';
-            document.getElementById('statsSection').style.display = 'grid';
+            this.updateStatistics(stats);
         } catch (error) {
             document.getElementById('statsSection').style.display = 'none';
         }
     }
 
+    updateStatistics(stats) {
+        document.getElementById('totalUsers').textContent = stats.total_users;
+        document.getElementById('totalManagers').textContent = stats.total_managers;
+        document.getElementById('totalClients').textContent = stats.total_clients;
+        document.getElementById('totalBalance').textContent = stats.total_balance.toFixed(2) + ' ₽';
+        document.getElementById('statsSection').style.display = 'grid';
+    }
+
     async loadClientData() {
         try {
-            const accountInfo = await this.api.getAccountInfo();
-            document.getElementById('balanceAmount').textContent = accountInfo.balance.toFixed(2) + ' ₽';
-            document.getElementById('accountNumber').textContent = accountInfo.account_number || '-';
-            document.getElementById('accountOwner').textContent = accountInfo.full_name;
-            document.getElementById('accountPhone').textContent = accountInfo.phone || '-';
-            await this.loadTransactionHistory();
+            const [accountInfo, transactions] = await this.api.batch([
+                ['getAccountInfo', { ifVersion: this.versions.account }],
+                ['getTransactionHistory', { limit: this.historyPageSize }]
+            ]);
+            
+            if (accountInfo.error) {
+                throw new Error(accountInfo.error.message);
+            }
+            if (!accountInfo.result.notModified) {
+                this.updateAccountInfo(accountInfo.result);
+                this.versions.account = accountInfo.result.version;
+            }
+            
+            if (transactions.error) {
+                console.error('Error loading transactions:', transactions.error.message);
+            } else {
+                this.updateTransactionsList(transactions.result.transactions, transactions.result.next_cursor);
+            }
         } catch (error) {
             this.showError('Ошибка загрузки данных счета');
         }
     }
 
-    async loadTransactionHistory() {
+    updateAccountInfo(accountInfo) {
+        document.getElementById('balanceAmount').textContent = accountInfo.balance.toFixed(2) + ' ₽';
+        document.getElementById('accountNumber').textContent = accountInfo.account_number || '-';
+        document.getElementById('accountOwner').textContent = accountInfo.full_name;
+        document.getElementById('accountPhone').textContent = accountInfo.phone || '-';
+    }
+
+    async loadTransactionHistory(append = false) {
         try {
-            const transactions = await this.api.getTransactionHistory();
-            this.updateTransactionsList(transactions);
+            const params = { limit: this.historyPageSize };
+            if (append && this.historyCursor) {
+                params.cursor = this.historyCursor;
+            }
+            const page = await this.api.getTransactionHistory(params);
+            this.updateTransactionsList(page.transactions, page.next_cursor, append);
         } catch (error) {
             console.error('Error loading transactions:', error);
         }
     }
 
-    updateTransactionsList(transactions) {
+    updateTransactionsList(transactions, nextCursor = null, append = false) {
         const list = document.getElementById('transactionsList');
+        this.historyCursor = nextCursor;
         
-        if (!transactions || transactions.length === 0) {
+        if (!append && (!transactions || transactions.length === 0)) {
             list.innerHTML = `
                 <div class="empty-state">
                     <i class="fas fa-receipt"></i>
@@ -228,7 +369,27 @@ class BankApp {
             `;
         });
         
-        list.innerHTML = html;
+        const moreButton = document.getElementById('loadMoreTransactions');
+        if (moreButton) {
+            moreButton.remove();
+        }
+        
+        if (append) {
+            list.insertAdjacentHTML('beforeend', html);
+        } else {
+            list.innerHTML = html;
+        }
+        
+        if (nextCursor) {
+            list.insertAdjacentHTML('beforeend', `
+                <button id="loadMoreTransactions" class="btn btn-secondary btn-sm">
+                    Показать ещё
+                </button>
+            `);
+            document.getElementById('loadMoreTransactions').addEventListener('click', () => {
+                this.loadTransactionHistory(true);
+            });
+        }
     }
 
     setupEventListeners() {
@@ -250,8 +411,7 @@ class BankApp {
 
         if (document.getElementById('refreshUsersBtn')) {
             document.getElementById('refreshUsersBtn').addEventListener('click', () => {
-                this.loadAllUsers();
-                this.loadStatistics();
+                this.loadManagerData();
             });
         }
 
@@ -262,6 +422,17 @@ class BankApp {
             });
         }
 
+        if (document.getElementById('usersTableBody')) {
+            this.setupUserActions();
+            this.setupUserFilters();
+        }
+
+        if (document.getElementById('exportTransactionsBtn')) {
+            document.getElementById('exportTransactionsBtn').addEventListener('click', () => {
+                window.location.href = this.api.exportTransactionsUrl({ format: 'csv', gzip: 1 });
+            });
+        }
+
         if (document.getElementById('cancelCreate')) {
             document.getElementById('cancelCreate').addEventListener('click', () => {
                 this.hideEditUserForm();
@@ -296,21 +467,33 @@ class BankApp {
                 e.preventDefault();
                 this.handleTransfer();
             });
+            document.getElementById('recipient').addEventListener('change', () => {
+                this.previewRecipient();
+            });
         }
     }
 
     setupUserActions() {
-        document.querySelectorAll('.edit-user').forEach(button => {
-            button.addEventListener('click', (e) => {
-                const userId = e.currentTarget.dataset.id;
-                this.handleEditUser(userId);
-            });
+        // Один обработчик на таблицу: строки подгружаются страницами
+        document.getElementById('usersTableBody').addEventListener('click', (e) => {
+            const editButton = e.target.closest('.edit-user');
+            const deleteButton = e.target.closest('.delete-user');
+            if (editButton) {
+                this.handleEditUser(editButton.dataset.id);
+            } else if (deleteButton) {
+                this.handleDeleteUser(deleteButton.dataset.id);
+            }
         });
+    }
 
-        document.querySelectorAll('.delete-user').forEach(button => {
-            button.addEventListener('click', (e) => {
-                const userId = e.currentTarget.dataset.id;
-                this.handleDeleteUser(userId);
+    setupUserFilters() {
+        document.getElementById('userSearch').addEventListener('input', () => {
+            clearTimeout(this.usersSearchTimer);
+            this.usersSearchTimer = setTimeout(() => this.loadAllUsers(), 300);
+        });
+        ['userRoleFilter', 'userMinBalance', 'userMaxBalance', 'userSort'].forEach(id => {
+            document.getElementById(id).addEventListener('change', () => {
+                this.loadAllUsers();
             });
         });
     }
@@ -334,6 +517,7 @@ class BankApp {
         try {
             const result = await this.api.login(login, password);
             this.currentUser = result.user;
+            this.eventsEnabled = Boolean(result.events);
             localStorage.setItem('user', JSON.stringify(result.user));
             this.showInterface();
         } catch (error) {
@@ -374,27 +558,21 @@ class BankApp {
             await this.api.createUser(userData);
             this.showSuccess('Пользователь успешно создан!');
             this.hideEditUserForm();
-            await this.loadAllUsers();
-            await this.loadStatistics();
+            await this.loadManagerData();
         } catch (error) {
             this.showError('Ошибка создания пользователя: ' + error.message);
         }
     }
 
     async handleEditUser(userId) {
-        try {
-            const users = await this.api.getAllUsers();
-            const userToEdit = users.find(u => u.id === parseInt(userId));
-            
-            if (!userToEdit) {
-                this.showError('Пользователь не найден');
-                return;
-            }
-            
-            this.showEditUserForm(userToEdit);
-        } catch (error) {
-            this.showError('Ошибка загрузки данных пользователя');
+        const userToEdit = this.usersById.get(parseInt(userId));
+        
+        if (!userToEdit) {
+            this.showError('Пользователь не найден');
+            return;
         }
+        
+        this.showEditUserForm(userToEdit);
     }
 
     showEditUserForm(user) {
@@ -452,8 +630,7 @@ class BankApp {
             await this.api.updateUser(userData);
             this.showSuccess('Пользователь успешно обновлен!');
             this.hideEditUserForm();
-            await this.loadAllUsers();
-            await this.loadStatistics();
+            await this.loadManagerData();
         } catch (error) {
             this.showError('Ошибка обновления пользователя: ' + error.message);
         }
@@ -480,8 +657,7 @@ class BankApp {
         try {
             await this.api.deleteUser(userId);
             this.showSuccess('Пользователь удален');
-            await this.loadAllUsers();
-            await this.loadStatistics();
+            await this.loadManagerData();
         } catch (error) {
             this.showError('Ошибка удаления пользователя: ' + error.message);
         }
@@ -503,6 +679,29 @@ class BankApp {
         }
     }
 
+    async previewRecipient() {
+        const recipient = document.getElementById('recipient').value.trim();
+        const preview = document.getElementById('recipientPreview');
+        
+        this.clearValidationErrors(['recipient']);
+        preview.textContent = '';
+        preview.style.display = 'none';
+        
+        if (!recipient) return;
+        
+        try {
+            const result = await this.api.resolveRecipient(recipient);
+            if (result.is_self) {
+                this.showValidationError('recipient', 'Нельзя переводить самому себе');
+                return;
+            }
+            preview.textContent = `Получатель: ${result.display_name} (${result.account_number})`;
+            preview.style.display = 'block';
+        } catch (error) {
+            this.showValidationError('recipient', error.message);
+        }
+    }
+
     async handleTransfer() {
         const recipient = document.getElementById('recipient').value;
         const amount = parseFloat(document.getElementById('transferAmount').value);
@@ -527,7 +726,11 @@ class BankApp {
             
             this.showSuccess('Перевод успешно выполнен!');
             document.getElementById('transferForm').reset();
-            await this.loadClientData();
+            document.getElementById('recipientPreview').style.display = 'none';
+            // Новый баланс и операция придут событиями; без потока - перечитываем счет
+            if (!this.eventsConnected()) {
+                await this.loadClientData();
+            }
         } catch (error) {
             this.showError('Ошибка перевода: ' + error.message);
         }
@@ -15,13 +15,11 @@ if os.path.exists(activate_this):
         exec(f.read(), {'__file__': activate_this})
 
 # Импортируем приложение
-from backend.app import app as application
+from backend.app import app as application, init_database
 
-# Создаем базу данных если нужно
-with application.app_context():
-    from backend.models import db
-    try:
-        db.create_all()
-        print(" База данных инициализирована")
-    except Exception as e:
-        print(f"⚠ Ошибка БД: {e}")
\ No newline at end of file
+# Создаем базу данных и демо-данные если нужно (один раз при запуске воркера)
+try:
+    init_database()
+    print(" База данных инициализирована")
+except Exception as e:
+    print(f"⚠ Ошибка БД: {e}")
\ No newline at end of file